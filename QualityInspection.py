@@ -1,30 +1,42 @@
 import streamlit as st
 import json
 import pandas as pd
+import openpyxl
+import pyarrow as pa
+import pyarrow.parquet as pq
 from datetime import datetime, timedelta, date
 import uuid
-from PIL import Image
+from PIL import Image, ImageOps
 import hashlib
 import io
+import bisect
+import contextvars
+import functools
+from abc import ABC, abstractmethod
+import csv
+import shutil
+import tempfile
+import unicodedata
 import base64
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, NamedTuple, Optional
 from office365.runtime.auth.user_credential import UserCredential
 from office365.runtime.auth.authentication_context import AuthenticationContext
 from office365.sharepoint.client_context import ClientContext
+from office365.runtime.http.request_options import RequestOptions
+from office365.runtime.http.http_method import HttpMethod
+from office365.runtime.transport.base import BaseTransport
+from office365.runtime.exceptions import DuplicatedObjectException, ObjectNotFoundException
 import os
-
-def download_file_content(ctx, file_path):
-    return _cached_download_file_content(file_path, ctx)
-
-@st.cache_data
-def _cached_download_file_content(file_path, _ctx):
-    try:
-        file = _ctx.web.get_file_by_server_relative_url(file_path)
-        file_content = file.get_content().execute_query().value
-        return file_content
-    except Exception as e:
-        st.error(f"Erro ao baixar o arquivo {file_path}: {e}")
-        return None
+import random
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import requests
+from urllib.parse import parse_qs, urlparse
 
 # Configuração da página
 st.set_page_config(
@@ -41,34 +53,656 @@ SHAREPOINT_IMAGENS_PATH = f"{SHAREPOINT_DADOS_PATH}/imagens"
 SHAREPOINT_INSPECOES_PATH = f"{SHAREPOINT_DADOS_PATH}/inspecoes"
 SHAREPOINT_RELATORIOS_PATH = f"{SHAREPOINT_DADOS_PATH}/relatorios"
 
+# Armazenamento local do servidor (fila de gravação offline)
+DIRETORIO_DADOS_LOCAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados_locais")
+ARQUIVO_BANCO_LOCAL = os.path.join(DIRETORIO_DADOS_LOCAL, "inspecoes_local.db")
+
+# Telemetria
+# Desligada por padrão. Com `habilitada = true` na seção [telemetria] dos secrets, cada
+# requisição HTTP ao SharePoint e as etapas pesadas viram spans, agregados por rerun e
+# por ação no painel de depuração da barra lateral e gravados em JSON Lines. O contexto
+# (rerun, ação, span pai) viaja em uma ContextVar, então as threads sem contexto do
+# Streamlit só registram spans quando quem as criou repassa esse contexto.
+ARQUIVO_TELEMETRIA = os.path.join(DIRETORIO_DADOS_LOCAL, "telemetria.jsonl")
+TELEMETRIA_ARQUIVO_MAX_MB = 50
+TELEMETRIA_FAIXAS_MS = [10, 50, 100, 250, 500, 1000, 2500, 5000]
+TELEMETRIA_RERUNS_SESSAO = 20
+PREFIXO_SPAN_SHAREPOINT = "sharepoint."
+ACAO_PADRAO = "rerun"
+
+class EstatisticasTelemetria:
+    # Chamadas, erros, histograma de latência e bytes por (ação, operação)
+    def __init__(self, escopo=ACAO_PADRAO):
+        self.escopo = escopo
+        self.inicio = datetime.now()
+        self.duracao_ms = None
+        self._lock = threading.Lock()
+        self._operacoes = {}
+
+    def registrar(self, acao, operacao, duracao_ms, bytes_enviados=0, bytes_recebidos=0, erro=False) -> None:
+        with self._lock:
+            estatistica = self._operacoes.get((acao, operacao))
+            if estatistica is None:
+                estatistica = self._operacoes[(acao, operacao)] = {
+                    'chamadas': 0, 'erros': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                    'bytes_enviados': 0, 'bytes_recebidos': 0,
+                    'histograma': [0] * (len(TELEMETRIA_FAIXAS_MS) + 1),
+                }
+            estatistica['chamadas'] += 1
+            estatistica['erros'] += int(erro)
+            estatistica['total_ms'] += duracao_ms
+            estatistica['max_ms'] = max(estatistica['max_ms'], duracao_ms)
+            estatistica['bytes_enviados'] += bytes_enviados
+            estatistica['bytes_recebidos'] += bytes_recebidos
+            estatistica['histograma'][bisect.bisect_left(TELEMETRIA_FAIXAS_MS, duracao_ms)] += 1
+
+    def resumo(self) -> List[Dict]:
+        with self._lock:
+            return [
+                {
+                    'ação': acao,
+                    'operação': operacao,
+                    'chamadas': e['chamadas'],
+                    'erros': e['erros'],
+                    'média (ms)': round(e['total_ms'] / e['chamadas'], 1),
+                    'máx (ms)': round(e['max_ms'], 1),
+                    'KB enviados': round(e['bytes_enviados'] / 1024, 1),
+                    'KB recebidos': round(e['bytes_recebidos'] / 1024, 1),
+                    'latência': list(e['histograma']),
+                }
+                for (acao, operacao), e in sorted(self._operacoes.items())
+            ]
+
+    def totais(self) -> Dict:
+        with self._lock:
+            requisicoes = [e for (_, operacao), e in self._operacoes.items()
+                           if operacao.startswith(PREFIXO_SPAN_SHAREPOINT)]
+            return {
+                'escopo': self.escopo,
+                'início': self.inicio.strftime('%H:%M:%S'),
+                'tempo (ms)': round(self.duracao_ms) if self.duracao_ms is not None else None,
+                'idas e voltas': sum(e['chamadas'] for e in requisicoes),
+                'KB enviados': round(sum(e['bytes_enviados'] for e in requisicoes) / 1024, 1),
+                'KB recebidos': round(sum(e['bytes_recebidos'] for e in requisicoes) / 1024, 1),
+            }
+
+class Telemetria:
+    # Agregado do processo e arquivo de spans, compartilhados por todas as sessões
+    def __init__(self, arquivo=ARQUIVO_TELEMETRIA, max_bytes=TELEMETRIA_ARQUIVO_MAX_MB * 1024 * 1024):
+        self.arquivo = arquivo
+        self.max_bytes = max_bytes
+        self.processo = EstatisticasTelemetria()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(arquivo)), exist_ok=True)
+        self._saida = open(arquivo, "a", encoding="utf-8")
+        self._tamanho = self._saida.tell()
+
+    def registrar(self, contexto, operacao, acao, id_span, inicio_ns, duracao_ms, atributos, erro) -> None:
+        bytes_enviados = atributos.get('bytes_enviados', 0)
+        bytes_recebidos = atributos.get('bytes_recebidos', 0)
+        for estatisticas in (contexto.registro, self.processo):
+            if estatisticas is not None:
+                estatisticas.registrar(acao, operacao, duracao_ms, bytes_enviados, bytes_recebidos, erro is not None)
+        # Campos no formato dos spans do OpenTelemetry, para importação em ferramentas externas
+        span = {
+            'trace_id': contexto.id_trace,
+            'span_id': id_span,
+            'parent_span_id': contexto.id_span,
+            'name': operacao,
+            'start_time_unix_nano': inicio_ns,
+            'end_time_unix_nano': inicio_ns + int(duracao_ms * 1_000_000),
+            'duration_ms': round(duracao_ms, 3),
+            'status': 'ERROR' if erro is not None else 'OK',
+            'attributes': {'acao': acao, 'thread': threading.current_thread().name, **atributos},
+        }
+        if erro is not None:
+            span['attributes']['erro'] = str(erro)
+        linha = json.dumps(span, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            if self._tamanho + len(linha) > self.max_bytes:
+                # Mantém só o arquivo anterior, para o disco não crescer sem limite
+                self._saida.close()
+                os.replace(self.arquivo, self.arquivo + ".1")
+                self._saida = open(self.arquivo, "a", encoding="utf-8")
+                self._tamanho = 0
+            self._saida.write(linha)
+            self._saida.flush()
+            self._tamanho += len(linha)
+
+class ContextoTelemetria(NamedTuple):
+    telemetria: Telemetria
+    registro: Optional[EstatisticasTelemetria]  # Rerun atual; None nas threads de segundo plano
+    acao: Optional[str]
+    id_trace: str
+    id_span: Optional[str]
+
+_contexto_telemetria = contextvars.ContextVar("contexto_telemetria", default=None)
+
+@contextmanager
+def medir(operacao, acao=None, **atributos):
+    # Sem telemetria no contexto atual não registra nada. A ação mais externa prevalece,
+    # então o carregamento feito por uma exportação conta como parte da exportação
+    contexto = _contexto_telemetria.get()
+    if contexto is None:
+        yield atributos
+        return
+    acao = contexto.acao or acao
+    id_span = uuid.uuid4().hex[:16]
+    token = _contexto_telemetria.set(contexto._replace(acao=acao, id_span=id_span))
+    inicio_ns = time.time_ns()
+    inicio = time.perf_counter()
+    erro = None
+    try:
+        yield atributos
+    except Exception as e:
+        erro = e
+        raise
+    finally:
+        _contexto_telemetria.reset(token)
+        contexto.telemetria.registrar(contexto, operacao, acao or ACAO_PADRAO, id_span, inicio_ns,
+                                      (time.perf_counter() - inicio) * 1000, atributos, erro)
+
+def instrumentado(operacao, acao=False):
+    # Decorador de medir(); com acao=True a chamada dá nome à ação dos spans internos
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def executar(*args, **kwargs):
+            with medir(operacao, acao=operacao if acao else None):
+                return funcao(*args, **kwargs)
+        return executar
+    return decorador
+
+def tipo_requisicao(request) -> str:
+    url = request.url.lower()
+    if "$batch" in url:
+        return "lote"
+    if "/startupload" in url or "/continueupload" in url or "/finishupload" in url:
+        return "envio_blocos"
+    if "/files/add" in url or (url.endswith("/$value") and request.method != HttpMethod.Get):
+        return "envio"
+    if url.endswith("/$value"):
+        return "download"
+    if "/folders/add" in url:
+        return "criar_pasta"
+    if "/contextinfo" in url:
+        return "contextinfo"
+    return "consulta" if request.method == HttpMethod.Get else "comando"
+
+class TransporteInstrumentado(BaseTransport):
+    # Consultas, lotes, downloads diretos e envios em blocos passam todos pelo transporte
+    def __init__(self, interno: BaseTransport):
+        self._interno = interno
+
+    def execute(self, request):
+        dados = request.data
+        bytes_enviados = len(dados) if isinstance(dados, (bytes, str)) else 0
+        with medir(f"{PREFIXO_SPAN_SHAREPOINT}{tipo_requisicao(request)}", metodo=request.method,
+                   url=request.url, bytes_enviados=bytes_enviados) as atributos:
+            response = self._interno.execute(request)
+            atributos['status'] = response.status_code
+            atributos['bytes_recebidos'] = len(response.content or b"")
+            return response
+
+    @property
+    def proxies(self):
+        return self._interno.proxies
+
+    @property
+    def verify(self):
+        return self._interno.verify
+
+    @property
+    def timeout(self):
+        return self._interno.timeout
+
+    @property
+    def auth(self):
+        return self._interno.auth
+
+    def close(self) -> None:
+        self._interno.close()
+
+def instrumentar_contexto(ctx) -> ClientContext:
+    requisicao = ctx.pending_request()
+    requisicao.transport = TransporteInstrumentado(requisicao.transport)
+    return ctx
+
+@st.cache_resource
+def obter_telemetria():
+    config = st.secrets.get("telemetria", {})
+    if not config.get("habilitada", False):
+        return None
+    return Telemetria(config.get("arquivo", ARQUIVO_TELEMETRIA))
+
+@contextmanager
+def rerun_instrumentado(escopo=ACAO_PADRAO):
+    # Abre o registro do rerun na sessão (os últimos ficam disponíveis para o painel)
+    telemetria = obter_telemetria()
+    if telemetria is None:
+        yield
+        return
+    registro = EstatisticasTelemetria(escopo)
+    reruns = st.session_state.setdefault('telemetria_reruns', deque(maxlen=TELEMETRIA_RERUNS_SESSAO))
+    reruns.append(registro)
+    token = _contexto_telemetria.set(ContextoTelemetria(telemetria, registro, None, uuid.uuid4().hex, None))
+    inicio = time.perf_counter()
+    try:
+        with medir(escopo):
+            yield
+    finally:
+        registro.duracao_ms = (time.perf_counter() - inicio) * 1000
+        _contexto_telemetria.reset(token)
+
+def exibir_painel_telemetria():
+    telemetria = obter_telemetria()
+    reruns = st.session_state.get('telemetria_reruns')
+    if telemetria is None or not reruns:
+        return
+    colunas_estatisticas = {
+        "latência": st.column_config.BarChartColumn(
+            "latência", help="Chamadas por faixa: " + ", ".join(f"≤{faixa}" for faixa in TELEMETRIA_FAIXAS_MS)
+                             + f", >{TELEMETRIA_FAIXAS_MS[-1]} ms", y_min=0),
+    }
+    with st.sidebar.expander("🛠️ Telemetria"):
+        st.write("Reruns recentes")
+        st.dataframe(pd.DataFrame([registro.totais() for registro in reversed(reruns)]), hide_index=True)
+        indice = st.selectbox("Detalhar", range(len(reruns)), key="telemetria_rerun",
+                              format_func=lambda i: f"{reruns[-1 - i].escopo} das {reruns[-1 - i].inicio.strftime('%H:%M:%S')}")
+        st.dataframe(pd.DataFrame(reruns[-1 - indice].resumo()), hide_index=True, column_config=colunas_estatisticas)
+        if st.checkbox("Acumulado do processo", key="telemetria_processo"):
+            st.dataframe(pd.DataFrame(telemetria.processo.resumo()), hide_index=True,
+                         column_config=colunas_estatisticas)
+        st.caption(f"Spans gravados em {telemetria.arquivo}")
+
+# Fragmentos
+# Trechos pesados da interface rodam como st.fragment: uma interação dentro deles
+# reexecuta só o fragmento, sem o main(). Como nesses reruns parciais o main() não
+# roda, o registro de telemetria do fragmento é aberto aqui.
+def fragmento(funcao=None, *, run_every=None):
+    if funcao is None:
+        return functools.partial(fragmento, run_every=run_every)
+    @functools.wraps(funcao)
+    def executar(*args, **kwargs):
+        if _contexto_telemetria.get() is not None:
+            return funcao(*args, **kwargs)
+        with rerun_instrumentado(f"fragmento.{funcao.__name__}"):
+            return funcao(*args, **kwargs)
+    return st.fragment(executar, run_every=run_every)
+
+# Pool de conexões do SharePoint (compartilhado entre sessões)
+SHAREPOINT_TOKEN_TTL_MINUTOS = 60
+SHAREPOINT_TOKEN_MARGEM_MINUTOS = 5
+ENVIO_TAMANHO_BLOCO_MB = 4
+
+class PoolSharePoint:
+    def __init__(self, site_url, username, password,
+                 ttl_minutos=SHAREPOINT_TOKEN_TTL_MINUTOS,
+                 margem_minutos=SHAREPOINT_TOKEN_MARGEM_MINUTOS):
+        self.site_url = site_url
+        self.username = username
+        self.password = password
+        self.ttl = ttl_minutos * 60
+        self.margem = margem_minutos * 60
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._auth = None
+        self._geracao = 0
+        self._expira_em = 0.0
+
+    def _token_valido(self) -> bool:
+        return self._auth is not None and time.monotonic() < self._expira_em - self.margem
+
+    @instrumentado("autenticar")
+    def _autenticar(self) -> None:
+        ctx_auth = AuthenticationContext(self.site_url)
+        if not ctx_auth.acquire_token_for_user(self.username, self.password):
+            raise PermissionError("Falha na autenticação: Credenciais inválidas.")
+        ctx = instrumentar_contexto(ClientContext(self.site_url, ctx_auth))
+        ctx.execute_query()  # Testa a conexão apenas quando o token é renovado
+        self._auth = ctx_auth
+        self._geracao += 1
+        self._expira_em = time.monotonic() + self.ttl
+
+    def obter_contexto(self) -> ClientContext:
+        with self._lock:
+            if not self._token_valido():
+                self._autenticar()
+            auth, geracao = self._auth, self._geracao
+        # ClientContext acumula consultas pendentes, então cada thread usa o seu,
+        # todos reaproveitando o mesmo token
+        ctx = getattr(self._local, "ctx", None)
+        if ctx is None or self._local.geracao != geracao:
+            ctx = instrumentar_contexto(ClientContext(self.site_url, auth))
+            self._local.ctx = ctx
+            self._local.geracao = geracao
+        return ctx
+
+    def invalidar(self) -> None:
+        with self._lock:
+            self._auth = None
+            self._expira_em = 0.0
+
+@st.cache_resource
+def obter_pool_sharepoint():
+    config = st.secrets["sharepoint"]
+    return PoolSharePoint(
+        config["site_url"],
+        config["email"],
+        config["password"],
+        ttl_minutos=config.get("token_ttl_minutos", SHAREPOINT_TOKEN_TTL_MINUTOS),
+    )
+
+@instrumentado("get_sharepoint_context")
 def get_sharepoint_context(max_retries=3):
-    site_url = st.secrets["sharepoint"]["site_url"]
-    username = st.secrets["sharepoint"]["email"]
-    password = st.secrets["sharepoint"]["password"]
+    pool = obter_pool_sharepoint()
     
     for attempt in range(max_retries):
         try:
-            ctx_auth = AuthenticationContext(site_url)
-            if ctx_auth.acquire_token_for_user(username, password):
-                ctx = ClientContext(site_url, ctx_auth)
-                ctx.execute_query()  # Testa a conexão
-                return ctx
-            else:
-                st.error("Falha na autenticação: Credenciais inválidas.")
-                return None
+            return pool.obter_contexto()
+        except PermissionError as e:
+            st.error(str(e))
+            return None
         except Exception as e:
+            pool.invalidar()
             st.warning(f"Tentativa {attempt + 1} falhou: {str(e)}")
             if attempt == max_retries - 1:
                 st.error(f"Erro ao conectar ao SharePoint após {max_retries} tentativas: {e}")
                 return None
     return None
 
+# Funções de Acesso a Arquivos do SharePoint
+def status_http(erro) -> Optional[int]:
+    return getattr(getattr(erro, 'response', None), 'status_code', None)
+
+def erro_transitorio(erro) -> bool:
+    # Falhas de rede ou indisponibilidade do SharePoint, que justificam tentar mais tarde
+    if isinstance(erro, (ConnectionError, TimeoutError, requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    return status_http(erro) in (408, 429, 500, 502, 503, 504)
+
+# SPException "arquivo não existe" e System.IO.FileNotFoundException
+HRESULTS_ARQUIVO_NAO_ENCONTRADO = ("-2130575338", "-2147024894")
+
+def arquivo_nao_encontrado(erro) -> bool:
+    # Só pelo status, tipo ou HRESULT: o texto do erro traz a URL, que pode conter "404"
+    return (status_http(erro) == 404 or isinstance(erro, ObjectNotFoundException)
+            or getattr(erro, 'hresult', None) in HRESULTS_ARQUIVO_NAO_ENCONTRADO)
+
+def ler_json(ctx, caminho, padrao=None, revalidar=False):
+    # Retorna `padrao` apenas se o arquivo não existir; outras falhas são propagadas
+    try:
+        conteudo = baixar_arquivo_em_cache(ctx, caminho, revalidar)
+    except Exception as e:
+        if arquivo_nao_encontrado(e):
+            return padrao
+        raise
+    return json.loads(conteudo.decode('utf-8')) if conteudo else padrao
+
+def enviar_arquivo_em_blocos(ctx, pasta, nome_arquivo, caminho_local, tamanho_bloco=ENVIO_TAMANHO_BLOCO_MB * 1024 * 1024) -> str:
+    # Envia um arquivo local em partes, sem carregá-lo inteiro na memória
+    with open(caminho_local, 'rb') as arquivo:
+        ctx.web.get_folder_by_server_relative_url(pasta).files.create_upload_session(
+            arquivo, tamanho_bloco, file_name=nome_arquivo
+        ).execute_query()
+    invalidar_downloads(f"{pasta}/{nome_arquivo}")
+    return f"{pasta}/{nome_arquivo}"
+
+def listar_subpastas(ctx, pasta) -> List[str]:
+    try:
+        subpastas = ctx.web.get_folder_by_server_relative_url(pasta).folders.get().execute_query()
+    except Exception as e:
+        if arquivo_nao_encontrado(e):
+            return []
+        raise
+    return [subpasta.name for subpasta in subpastas]
+
+# Provisionamento de Pastas
+# As pastas já confirmadas no SharePoint ficam memorizadas no processo, então uma escrita
+# só cria as que ainda não foram vistas, com os ancestrais, em um único lote. Um 404 na
+# escrita indica que alguma pasta foi apagada: ela é esquecida e recriada na próxima vez.
+class PastasSharePoint:
+    def __init__(self, raiz=SHAREPOINT_BASE_PATH):
+        self.raiz = raiz
+        self._lock = threading.Lock()
+        self._existentes = set()
+
+    def niveis(self, pasta) -> List[str]:
+        # A pasta e seus ancestrais abaixo da raiz, do mais externo para o mais interno
+        if not pasta.startswith(self.raiz + "/"):
+            return [pasta]
+        partes = pasta[len(self.raiz) + 1:].strip("/").split("/")
+        return [f"{self.raiz}/{'/'.join(partes[:i])}" for i in range(1, len(partes) + 1)]
+
+    def adicionar(self, ctx, *pastas) -> List[str]:
+        # Só enfileira a criação no contexto; quem chama executa o lote e confirma
+        with self._lock:
+            faltantes = list(dict.fromkeys(
+                nivel for pasta in pastas for nivel in self.niveis(pasta) if nivel not in self._existentes
+            ))
+        for pasta in faltantes:
+            ctx.web.folders.add(pasta)
+        return faltantes
+
+    def confirmar(self, pastas) -> None:
+        with self._lock:
+            self._existentes.update(pastas)
+
+    def esquecer(self, *pastas) -> None:
+        with self._lock:
+            for pasta in pastas:
+                self._existentes.difference_update(self.niveis(pasta))
+
+    def garantir(self, ctx, *pastas) -> None:
+        faltantes = self.adicionar(ctx, *pastas)
+        if faltantes:
+            ctx.execute_batch()
+            self.confirmar(faltantes)
+
+    @contextmanager
+    def escrita(self, ctx, *pastas, em_lote=False):
+        # em_lote=True deixa a criação das pastas no lote que o bloco executa,
+        # sem uma ida e volta a mais
+        faltantes = self.adicionar(ctx, *pastas) if em_lote else []
+        if not em_lote:
+            self.garantir(ctx, *pastas)
+        try:
+            yield
+        except Exception as e:
+            if arquivo_nao_encontrado(e):
+                self.esquecer(*pastas)
+            raise
+        self.confirmar(faltantes)
+
+@st.cache_resource
+def obter_pastas_sharepoint():
+    return PastasSharePoint()
+
+# Escrita Condicional (ETag)
+# Arquivos compartilhados por várias sessões são atualizados com If-Match: se outra
+# sessão gravou no intervalo, o SharePoint responde 412, o arquivo é relido e a
+# alteração é reaplicada sobre a versão mais recente.
+ESCRITA_CONDICIONAL_MAX_TENTATIVAS = 5
+
+# HRESULT do SharePoint para "já existe um arquivo com este nome" em Files/add
+HRESULT_ARQUIVO_EXISTENTE = "-2130575257"
+
+class ConflitoEscrita(Exception):
+    pass
+
+def arquivo_ja_existe(erro) -> bool:
+    return isinstance(erro, DuplicatedObjectException) or getattr(erro, 'hresult', None) == HRESULT_ARQUIVO_EXISTENTE
+
+def _url_conteudo_arquivo(ctx, caminho) -> str:
+    return f"{ctx.base_url}/_api/web/GetFileByServerRelativeUrl('{caminho}')/$value"
+
+def ler_json_com_etag(ctx, caminho, padrao=None, etag_atual=None):
+    return ler_json_da_url_com_etag(ctx, _url_conteudo_arquivo(ctx, caminho), padrao, etag_atual)
+
+def ler_json_da_url_com_etag(ctx, url, padrao=None, etag_atual=None):
+    # Com `etag_atual`, um arquivo inalterado devolve (None, etag_atual) sem transferir o corpo
+    request = RequestOptions(url)
+    request.method = HttpMethod.Get
+    if etag_atual:
+        request.set_header("If-None-Match", etag_atual)
+    try:
+        response = ctx.pending_request().execute_request_direct(request)
+    except Exception as e:
+        if arquivo_nao_encontrado(e):
+            return padrao, None
+        raise
+    if etag_atual and response.status_code == 304:
+        return None, etag_atual
+    conteudo = response.content
+    dados = json.loads(conteudo.decode('utf-8')) if conteudo else padrao
+    return dados, response.headers.get('ETag')
+
+def escrever_arquivo_condicional(ctx, pasta, nome_arquivo, conteudo, etag) -> None:
+    # Sem ETag o arquivo é criado sem sobrescrever; com ETag só é gravado se não mudou
+    if etag is None:
+        request = RequestOptions(
+            f"{ctx.base_url}/_api/web/GetFolderByServerRelativeUrl('{pasta}')"
+            f"/Files/add(url='{nome_arquivo}',overwrite=false)"
+        )
+    else:
+        request = RequestOptions(_url_conteudo_arquivo(ctx, f"{pasta}/{nome_arquivo}"))
+        request.set_header("X-HTTP-Method", "PUT")
+        request.set_header("IF-MATCH", etag)
+    request.method = HttpMethod.Post
+    request.data = conteudo
+    try:
+        ctx.pending_request().execute_request_direct(request)
+        invalidar_downloads(f"{pasta}/{nome_arquivo}")
+    except Exception as e:
+        # Um 400 só é conflito se o arquivo já existir; nome ou caminho inválido é outro erro
+        if status_http(e) in (409, 412) or (etag is None and arquivo_ja_existe(e)):
+            raise ConflitoEscrita(f"{pasta}/{nome_arquivo} foi alterado por outra sessão.") from e
+        raise
+
+def atualizar_json_condicional(ctx, pasta, nome_arquivo, mesclar, padrao=None, indent=None,
+                               max_tentativas=ESCRITA_CONDICIONAL_MAX_TENTATIVAS):
+    # `mesclar` recebe o conteúdo atual e devolve o novo, sem alterar o original
+    caminho = f"{pasta}/{nome_arquivo}"
+    for tentativa in range(max_tentativas):
+        atual, etag = ler_json_com_etag(ctx, caminho, padrao)
+        novo = mesclar(atual)
+        conteudo = json.dumps(novo, ensure_ascii=False, indent=indent).encode('utf-8')
+        try:
+            escrever_arquivo_condicional(ctx, pasta, nome_arquivo, conteudo, etag)
+            return novo
+        except ConflitoEscrita:
+            time.sleep(random.uniform(0.05, 0.2) * 2 ** tentativa)
+    raise ConflitoEscrita(f"Não foi possível atualizar {caminho} após {max_tentativas} tentativas concorrentes.")
+
+# Cache de Downloads
+# Camada única para leituras do SharePoint: dentro do TTL o conteúdo é servido da
+# memória; depois disso é revalidado com If-None-Match, e um 304 não transfere o
+# corpo. O tamanho total é limitado e as entradas menos usadas são descartadas.
+# Os caminhos de escrita chamam `invalidar_downloads` para os arquivos que alteram.
+CACHE_DOWNLOADS_TTL_SEGUNDOS = 60
+CACHE_DOWNLOADS_MAX_MB = 64
+
+class CacheDownloads:
+    def __init__(self, ttl_segundos=CACHE_DOWNLOADS_TTL_SEGUNDOS, max_bytes=CACHE_DOWNLOADS_MAX_MB * 1024 * 1024):
+        self.ttl = ttl_segundos
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()  # caminho -> (conteudo, etag, validado_em)
+        self._bytes = 0
+        self._geracao = 0
+
+    def obter(self, ctx, caminho, revalidar=False) -> bytes:
+        # `revalidar` ignora o TTL quando o chamador sabe que o arquivo mudou
+        with self._lock:
+            entrada = self._entradas.get(caminho)
+            if entrada:
+                self._entradas.move_to_end(caminho)
+            geracao = self._geracao
+        if entrada and not revalidar and time.monotonic() - entrada[2] < self.ttl:
+            return entrada[0]
+
+        request = RequestOptions(_url_conteudo_arquivo(ctx, caminho))
+        request.method = HttpMethod.Get
+        if entrada and entrada[1]:
+            request.set_header("If-None-Match", entrada[1])
+        try:
+            response = ctx.pending_request().execute_request_direct(request)
+        except Exception as e:
+            if arquivo_nao_encontrado(e):
+                self.invalidar(caminho)
+            raise
+        if entrada and response.status_code == 304:
+            conteudo, etag = entrada[0], entrada[1]
+        else:
+            conteudo, etag = response.content, response.headers.get('ETag')
+        self._guardar(caminho, conteudo, etag, geracao)
+        return conteudo
+
+    def _guardar(self, caminho, conteudo, etag, geracao) -> None:
+        with self._lock:
+            # Uma invalidação durante o download torna o conteúdo lido suspeito
+            if geracao != self._geracao or len(conteudo) > self.max_bytes:
+                return
+            self._remover(caminho)
+            self._entradas[caminho] = (conteudo, etag, time.monotonic())
+            self._bytes += len(conteudo)
+            while self._bytes > self.max_bytes:
+                self._remover(next(iter(self._entradas)))
+
+    def _remover(self, caminho) -> None:
+        entrada = self._entradas.pop(caminho, None)
+        if entrada:
+            self._bytes -= len(entrada[0])
+
+    def invalidar(self, *caminhos) -> None:
+        with self._lock:
+            self._geracao += 1
+            for caminho in caminhos:
+                self._remover(caminho)
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._geracao += 1
+            self._entradas.clear()
+            self._bytes = 0
+
+@st.cache_resource
+def obter_cache_downloads():
+    config = st.secrets.get("sharepoint", {})
+    return CacheDownloads(
+        ttl_segundos=config.get("cache_ttl_segundos", CACHE_DOWNLOADS_TTL_SEGUNDOS),
+        max_bytes=config.get("cache_max_mb", CACHE_DOWNLOADS_MAX_MB) * 1024 * 1024,
+    )
+
+def baixar_arquivo_em_cache(ctx, caminho, revalidar=False) -> bytes:
+    return obter_cache_downloads().obter(ctx, caminho, revalidar)
+
+def invalidar_downloads(*caminhos) -> None:
+    obter_cache_downloads().invalidar(*caminhos)
+
+def download_file_content(ctx, file_path):
+    try:
+        return baixar_arquivo_em_cache(ctx, file_path)
+    except Exception as e:
+        st.error(f"Erro ao baixar o arquivo {file_path}: {e}")
+        return None
+
 # Classe GerenciadorInspetores
+# Registro único por processo, compartilhado por todas as sessões. O índice
+# nome -> email é revalidado pelo ETag de inspetores.json no máximo a cada
+# INSPETORES_REVALIDACAO_SEGUNDOS, e novos inspetores são mesclados com escrita
+# condicional, para que administradores simultâneos não se sobrescrevam.
+INSPETORES_REVALIDACAO_SEGUNDOS = 30
+
 class GerenciadorInspetores:
-    def __init__(self, sharepoint_path=SHAREPOINT_DADOS_PATH):
+    def __init__(self, pool, sharepoint_path=SHAREPOINT_DADOS_PATH, intervalo=INSPETORES_REVALIDACAO_SEGUNDOS):
+        self.pool = pool
         self.sharepoint_path = sharepoint_path
         self.arquivo_inspetores = f"{sharepoint_path}/inspetores.json"
+        self.intervalo = intervalo
         self.inspetores = {}
+        self._etag = None
+        self._verificado_em = None
+        self._lock = threading.Lock()
         self.inspetores_iniciais = {
             "Aline Cristina Felício": "aline.felicio@synvia.com",
             "Amanda Hayashi Yamanouchi Brandão": "amanda.brandao@synvia.com",
@@ -92,59 +726,61 @@ class GerenciadorInspetores:
             "Naira Ferro Cintra": "naira.ferro@synvia.com",
             "Paulo Rogerio Delmonde": "paulo.delmonde@synvia.com"
         }
-        # Cache para evitar múltiplas leituras do SharePoint
-        if 'inspetores_cache' not in st.session_state:
-            self.carregar_inspetores()
-            st.session_state.inspetores_cache = self.inspetores
-        else:
-            self.inspetores = st.session_state.inspetores_cache
 
-    def carregar_inspetores(self) -> None:
-        ctx = get_sharepoint_context()
-        if not ctx:
-            self.inspetores = self.inspetores_iniciais
+    def carregar_inspetores(self, forcar=False) -> None:
+        if not forcar and self._verificado_em is not None and time.monotonic() - self._verificado_em < self.intervalo:
+            return
+        # Com o índice já carregado, quem chega durante uma revalidação usa a versão atual
+        if not self._lock.acquire(blocking=not self.inspetores):
             return
-        
         try:
-            file_content = download_file_content(ctx, self.arquivo_inspetores)
-            self.inspetores = json.loads(file_content.decode('utf-8'))
-        except Exception:
-            self.inspetores = self.inspetores_iniciais
-            # Não salva automaticamente para evitar escritas desnecessárias
+            if not forcar and self._verificado_em is not None and time.monotonic() - self._verificado_em < self.intervalo:
+                return
+            try:
+                dados, etag = ler_json_com_etag(self.pool.obter_contexto(), self.arquivo_inspetores, etag_atual=self._etag)
+                if etag is None:
+                    # Arquivo ainda não existe; não é criado aqui para evitar escritas desnecessárias
+                    self.inspetores = dict(self.inspetores_iniciais)
+                elif etag != self._etag:
+                    self.inspetores = dados or dict(self.inspetores_iniciais)
+                self._etag = etag
+            except Exception:
+                # SharePoint indisponível: mantém o índice atual e tenta de novo no próximo intervalo
+                if not self.inspetores:
+                    self.inspetores = dict(self.inspetores_iniciais)
+            self._verificado_em = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def adicionar_inspetor(self, nome: str, email: str) -> bool:
+        # A mescla é reaplicada sobre a versão mais recente do arquivo se outra sessão gravar antes
+        def mesclar(atuais):
+            return {**(atuais or self.inspetores_iniciais), nome: email}
 
-    def salvar_inspetores(self) -> None:
-        ctx = get_sharepoint_context()
-        if not ctx:
-            return
-        
         try:
-            ctx.web.folders.add(self.sharepoint_path).execute_query()
-            file_content = json.dumps(self.inspetores, ensure_ascii=False, indent=4).encode('utf-8')
-            target_folder = ctx.web.get_folder_by_server_relative_url(self.sharepoint_path)
-            target_folder.upload_file("inspetores.json", file_content).execute_query()
-            # Atualiza o cache após salvar
-            st.session_state.inspetores_cache = self.inspetores
+            ctx = self.pool.obter_contexto()
+            with obter_pastas_sharepoint().escrita(ctx, self.sharepoint_path):
+                novos = atualizar_json_condicional(ctx, self.sharepoint_path, "inspetores.json", mesclar, indent=4)
         except Exception as e:
             st.error(f"Erro ao salvar inspetores no SharePoint: {e}")
-
-    def adicionar_inspetor(self, nome: str, email: str) -> None:
-        self.inspetores[nome] = email
-        self.salvar_inspetores()
+            return False
+        with self._lock:
+            self.inspetores = novos
+            # O ETag da nova versão só é conhecido na próxima leitura
+            self._verificado_em = None
+        return True
 
     def obter_email_por_nome(self, nome: str) -> Optional[str]:
+        self.carregar_inspetores()
         return self.inspetores.get(nome)
 
     def obter_lista_inspetores(self) -> List[str]:
+        self.carregar_inspetores()
         return list(self.inspetores.keys())
 
-# Singleton para GerenciadorInspetores
-_instancia = None
-
-def obter_instancia(sharepoint_path=SHAREPOINT_DADOS_PATH):
-    global _instancia
-    if _instancia is None:
-        _instancia = GerenciadorInspetores(sharepoint_path)
-    return _instancia
+@st.cache_resource
+def obter_gerenciador_inspetores(sharepoint_path=SHAREPOINT_DADOS_PATH):
+    return GerenciadorInspetores(obter_pool_sharepoint(), sharepoint_path)
 
 # Funções de Validade
 def calcular_validade_solucao(data_preparo, tipo_solucao):
@@ -190,69 +826,339 @@ def obter_dias_restantes(data_validade):
     return (data_validade - hoje).days
 
 # Funções de Imagem
-def salvar_imagem(imagem, prefixo="evidencia", sharepoint_path=SHAREPOINT_IMAGENS_PATH):
-    ctx = get_sharepoint_context()
-    if not ctx:
-        st.error("Não foi possível conectar ao SharePoint para salvar a imagem.")
-        return None
+UPLOAD_IMAGENS_MAX_WORKERS = 4
+UPLOAD_IMAGENS_TIMEOUT_SEGUNDOS = 120
+ENVIOS_INTERVALO_ATUALIZACAO_SEGUNDOS = 1
+IMAGEM_DIMENSAO_MAXIMA = 1920
+IMAGEM_QUALIDADE_JPEG = 85
+MINIATURA_DIMENSAO_MAXIMA = 320
+MINIATURA_QUALIDADE_JPEG = 70
+SUFIXO_MINIATURA = "_miniatura"
+
+def caminho_miniatura(caminho_imagem) -> str:
+    base, _ = os.path.splitext(caminho_imagem)
+    return f"{base}{SUFIXO_MINIATURA}.jpg"
+
+def _codificar_jpeg(img, qualidade) -> bytes:
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=qualidade, optimize=True)
+    return buffer.getvalue()
+
+def processar_imagem(imagem, dimensao_maxima=IMAGEM_DIMENSAO_MAXIMA, qualidade=IMAGEM_QUALIDADE_JPEG,
+                     dimensao_miniatura=MINIATURA_DIMENSAO_MAXIMA, qualidade_miniatura=MINIATURA_QUALIDADE_JPEG):
+    # Retorna (conteudo, extensao, miniatura): corrige a orientação EXIF, reduz fotos
+    # grandes e mantém capturas de tela PNG sem perdas
+    original = imagem if isinstance(imagem, Image.Image) else Image.open(io.BytesIO(imagem))
+    formato = original.format
+    orientacao = original.getexif().get(0x0112, 1)  # Tag EXIF Orientation
+    img = ImageOps.exif_transpose(original)
+    reduzir = max(img.size) > dimensao_maxima
+    if reduzir:
+        img.thumbnail((dimensao_maxima, dimensao_maxima), Image.LANCZOS)
     
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    nome_arquivo = f"{prefixo}_{timestamp}_{uuid.uuid4().hex[:8]}.jpg"
-    caminho_arquivo = f"{sharepoint_path}/{nome_arquivo}"
+    if isinstance(imagem, bytes) and formato == "JPEG" and not reduzir and orientacao == 1:
+        conteudo, extensao = imagem, "jpg"  # Já está pronta: evita recompressão
+    elif formato == "PNG":
+        buffer = io.BytesIO()
+        img.save(buffer, format="PNG", optimize=True)
+        conteudo, extensao = buffer.getvalue(), "png"
+    else:
+        conteudo, extensao = _codificar_jpeg(img, qualidade), "jpg"
     
+    miniatura = img.copy()
+    miniatura.thumbnail((dimensao_miniatura, dimensao_miniatura), Image.LANCZOS)
+    return conteudo, extensao, _codificar_jpeg(miniatura, qualidade_miniatura)
+
+# Armazenamento de Evidências por Conteúdo
+# Cada evidência é gravada como <sha256>.<ext>, então bytes idênticos sempre resultam
+# no mesmo caminho. O índice hash -> caminho é compartilhado por todas as sessões do
+# processo; uma falta no índice custa apenas uma consulta de existência no SharePoint.
+class IndiceImagens:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._caminhos = {}
+
+    def obter(self, sharepoint_path, hash_imagem) -> Optional[str]:
+        with self._lock:
+            return self._caminhos.get((sharepoint_path, hash_imagem))
+
+    def registrar(self, sharepoint_path, hash_imagem, caminho) -> None:
+        with self._lock:
+            self._caminhos[(sharepoint_path, hash_imagem)] = caminho
+
+@st.cache_resource
+def obter_indice_imagens():
+    return IndiceImagens()
+
+def hash_conteudo(conteudo) -> str:
+    return hashlib.sha256(conteudo).hexdigest()
+
+def extensao_imagem(imagem) -> str:
+    formato = imagem.format if isinstance(imagem, Image.Image) else Image.open(io.BytesIO(imagem)).format
+    return "png" if formato == "PNG" else "jpg"
+
+def caminho_imagem_por_conteudo(imagem, hash_imagem, sharepoint_path=SHAREPOINT_IMAGENS_PATH) -> str:
+    return f"{sharepoint_path}/{hash_imagem}.{extensao_imagem(imagem)}"
+
+def arquivo_existe(ctx, caminho) -> bool:
     try:
-        # Cria a pasta se não existir
-        ctx.web.folders.add(sharepoint_path).execute_query()
-        
-        # Prepara o buffer da imagem
-        if isinstance(imagem, bytes):
-            buffer = io.BytesIO(imagem)
-        elif isinstance(imagem, Image.Image):
-            buffer = io.BytesIO()
-            imagem.save(buffer, format="JPEG")
-        else:
-            img = Image.open(io.BytesIO(imagem))
-            buffer = io.BytesIO()
-            img.save(buffer, format="JPEG")
-        buffer.seek(0)
-        
-        # Faz o upload
-        target_folder = ctx.web.get_folder_by_server_relative_url(sharepoint_path)
-        target_folder.upload_file(nome_arquivo, buffer.getvalue()).execute_query()
+        ctx.web.get_file_by_server_relative_url(caminho).get().execute_query()
+        return True
+    except Exception as e:
+        if arquivo_nao_encontrado(e):
+            return False
+        raise
+
+def enviar_imagem(ctx, imagem, sharepoint_path=SHAREPOINT_IMAGENS_PATH, ao_progredir=None,
+                  dimensao_maxima=IMAGEM_DIMENSAO_MAXIMA, qualidade=IMAGEM_QUALIDADE_JPEG,
+                  indice=None, hash_imagem=None, pastas=None):
+    # Versão sem interface de salvar_imagem: propaga exceções e pode rodar fora da thread do script
+    ao_progredir = ao_progredir or (lambda etapa, progresso: None)
+    if hash_imagem is None:
+        hash_imagem = hash_conteudo(imagem if isinstance(imagem, bytes) else imagem.tobytes())
+    caminho_arquivo = indice.obter(sharepoint_path, hash_imagem) if indice else None
+    if caminho_arquivo:
+        ao_progredir("Concluído", 1.0)
         return caminho_arquivo
+    
+    caminho_arquivo = caminho_imagem_por_conteudo(imagem, hash_imagem, sharepoint_path)
+    nome_arquivo = os.path.basename(caminho_arquivo)
+    ao_progredir("Verificando duplicidade", 0.2)
+    if not arquivo_existe(ctx, caminho_arquivo):
+        ao_progredir("Processando imagem", 0.4)
+        conteudo, _, miniatura = processar_imagem(imagem, dimensao_maxima, qualidade)
+        
+        # Envia a imagem e a miniatura (e a pasta, se ainda não confirmada) em um único lote
+        ao_progredir("Enviando", 0.6)
+        with (pastas or PastasSharePoint()).escrita(ctx, sharepoint_path, em_lote=True):
+            arquivos = ctx.web.get_folder_by_server_relative_url(sharepoint_path).files
+            arquivos.add(nome_arquivo, conteudo, True)
+            arquivos.add(os.path.basename(caminho_miniatura(caminho_arquivo)), miniatura, True)
+            ctx.execute_batch()
+    if indice:
+        indice.registrar(sharepoint_path, hash_imagem, caminho_arquivo)
+    ao_progredir("Concluído", 1.0)
+    return caminho_arquivo
+
+ETAPA_GUARDADA_LOCALMENTE = "Guardada localmente"
+
+@instrumentado("enviar_imagem", acao=True)
+def enviar_imagem_ou_guardar(obter_contexto, conteudo, sharepoint_path=SHAREPOINT_IMAGENS_PATH,
+                             ao_progredir=None, indice=None, hash_imagem=None, fila_local=None, pastas=None):
+    # Sem SharePoint a imagem vai para a fila local; o caminho final já é conhecido
+    # porque depende só do conteúdo, então o registro pode referenciá-la desde já
+    hash_imagem = hash_imagem or hash_conteudo(conteudo)
+    try:
+        return enviar_imagem(obter_contexto(), conteudo, sharepoint_path, ao_progredir,
+                             indice=indice, hash_imagem=hash_imagem, pastas=pastas)
+    except Exception as e:
+        if fila_local is None or not erro_transitorio(e):
+            raise
+        if ao_progredir:
+            ao_progredir(ETAPA_GUARDADA_LOCALMENTE, 1.0)
+        return fila_local.registrar_imagem(conteudo, hash_imagem, sharepoint_path)
+
+@instrumentado("salvar_imagem", acao=True)
+def salvar_imagem(imagem, sharepoint_path=SHAREPOINT_IMAGENS_PATH):
+    if isinstance(imagem, Image.Image):
+        buffer = io.BytesIO()
+        imagem.save(buffer, format="PNG")
+        imagem = buffer.getvalue()
+    
+    try:
+        return enviar_imagem_ou_guardar(obter_pool_sharepoint().obter_contexto, imagem, sharepoint_path,
+                                        indice=obter_indice_imagens(), fila_local=obter_fila_local(),
+                                        pastas=obter_pastas_sharepoint())
     except Exception as e:
         st.error(f"Erro ao salvar imagem no SharePoint: {e}")
         return None
 
+# Fila de Envio de Imagens
+# As evidências são enviadas por um pool de threads do processo; o formulário guarda
+# apenas o EnvioImagem e salvar_inspecao aguarda os envios antes de gravar o registro.
+# As exportações usam o mesmo pool para enviar um relatório enquanto escrevem o próximo.
+class EnvioImagem:
+    def __init__(self, nome, conteudo):
+        self.nome = nome
+        self.conteudo = conteudo  # Mantido para permitir o reenvio após falha
+        self.etapa = "Na fila"
+        self.progresso = 0.0
+        self.future = None
+
+    def _atualizar(self, etapa, progresso):
+        self.etapa = etapa
+        self.progresso = progresso
+
+    def concluido(self) -> bool:
+        return self.future.done()
+
+    def erro(self) -> Optional[BaseException]:
+        return self.future.exception() if self.future.done() else None
+
+    def resultado(self, timeout=UPLOAD_IMAGENS_TIMEOUT_SEGUNDOS) -> str:
+        return self.future.result(timeout=timeout)
+
+@st.cache_resource
+def obter_fila_uploads():
+    return ThreadPoolExecutor(max_workers=UPLOAD_IMAGENS_MAX_WORKERS, thread_name_prefix="envio_sharepoint")
+
+def enfileirar_imagem(conteudo, nome="evidencia", sharepoint_path=SHAREPOINT_IMAGENS_PATH, hash_imagem=None):
+    # Evidências já conhecidas pelo índice retornam o caminho sem passar pela fila
+    indice = obter_indice_imagens()
+    hash_imagem = hash_imagem or hash_conteudo(conteudo)
+    caminho_existente = indice.obter(sharepoint_path, hash_imagem)
+    if caminho_existente:
+        return caminho_existente
+    
+    # Os recursos são resolvidos aqui porque as threads de envio não têm contexto do Streamlit
+    pool = obter_pool_sharepoint()
+    fila_local = obter_fila_local()
+    pastas = obter_pastas_sharepoint()
+    envio = EnvioImagem(nome, conteudo)
+    def tarefa():
+        envio._atualizar("Conectando", 0.1)
+        return enviar_imagem_ou_guardar(pool.obter_contexto, conteudo, sharepoint_path, envio._atualizar,
+                                        indice=indice, hash_imagem=hash_imagem, fila_local=fila_local,
+                                        pastas=pastas)
+    # O contexto de telemetria acompanha a tarefa, para o envio contar no rerun que o pediu
+    envio.future = obter_fila_uploads().submit(contextvars.copy_context().run, tarefa)
+    return envio
+
+def enviar_arquivo_em_segundo_plano(pool, pastas, pasta, nome_arquivo, caminho_local):
+    # Envio em blocos numa thread da fila, com o contexto SharePoint da própria thread
+    def tarefa():
+        ctx = pool.obter_contexto()
+        with pastas.escrita(ctx, pasta):
+            return enviar_arquivo_em_blocos(ctx, pasta, nome_arquivo, caminho_local)
+    return obter_fila_uploads().submit(contextvars.copy_context().run, tarefa)
+
+def exibir_status_envios(envios):
+    # Com envios pendentes o status roda num fragmento que se atualiza sozinho; quando
+    # a fila esvazia, um rerun completo desliga a atualização e mostra o resultado final
+    if not any(isinstance(e, EnvioImagem) and not e.concluido() for e in envios):
+        status_envios(envios)
+        return
+    @fragmento(run_every=ENVIOS_INTERVALO_ATUALIZACAO_SEGUNDOS)
+    def status_envios_pendentes():
+        if not status_envios(envios):
+            st.rerun()
+    status_envios_pendentes()
+
+def status_envios(envios) -> bool:
+    envios_pendentes = [e for e in envios if isinstance(e, EnvioImagem) and not e.concluido()]
+    envios_com_erro = [e for e in envios if isinstance(e, EnvioImagem) and e.erro()]
+    if envios_pendentes:
+        progresso = sum(e.progresso if isinstance(e, EnvioImagem) else 1.0 for e in envios) / len(envios)
+        st.progress(progresso, text=f"Enviando {len(envios_pendentes)} de {len(envios)} evidência(s)...")
+    for envio in envios_com_erro:
+        st.error(f"Erro ao salvar a imagem {envio.nome} no SharePoint: {envio.erro()}")
+    if envios and not envios_pendentes and not envios_com_erro:
+        guardadas = sum(1 for e in envios if isinstance(e, EnvioImagem) and e.etapa == ETAPA_GUARDADA_LOCALMENTE)
+        if guardadas:
+            st.caption(f"💾 {guardadas} evidência(s) guardada(s) localmente; serão enviadas quando o SharePoint estiver acessível.")
+        else:
+            st.caption(f"✅ {len(envios)} evidência(s) enviada(s).")
+    return bool(envios_pendentes)
+
+def aguardar_envios_imagens(valor, falhas):
+    # Substitui cada EnvioImagem pelo caminho final, acumulando as falhas em `falhas`
+    if isinstance(valor, EnvioImagem):
+        try:
+            return valor.resultado()
+        except Exception as e:
+            falhas.append(f"{valor.nome}: {e}")
+            return None
+    if isinstance(valor, dict):
+        return {k: aguardar_envios_imagens(v, falhas) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [aguardar_envios_imagens(v, falhas) for v in valor]
+    return valor
+
+def descartar_fotos_camera(chave):
+    # Trocar a chave recria o camera_input vazio; senão a última foto voltaria no próximo rerun
+    st.session_state[f"capturas_camera_{chave}"] = []
+    st.session_state[f"geracao_camera_{chave}"] = st.session_state.get(f"geracao_camera_{chave}", 0) + 1
+
+@fragmento
 def componente_imagem(chave, label="Adicionar evidência visual", sharepoint_path=SHAREPOINT_IMAGENS_PATH):
+    # Aceita vários arquivos e várias fotos da câmera; cada imagem nova entra na fila
+    # de envio assim que aparece e a função devolve a lista na ordem de seleção
     col1, col2 = st.columns(2)
-    caminho_key = f"imagem_path_{chave}"
-    hash_key = f"imagem_hash_{chave}"
+    envios = st.session_state.setdefault(f"imagens_{chave}", {})  # hash -> EnvioImagem ou caminho
+    capturas = st.session_state.setdefault(f"capturas_camera_{chave}", [])  # hashes das fotos da câmera
+    hashes_arquivos = st.session_state.setdefault(f"hashes_upload_{chave}", {})  # file_id -> hash
+    
+    com_erro = [h for h, e in envios.items() if isinstance(e, EnvioImagem) and e.erro()]
+    if com_erro and st.button("Tentar enviar novamente", key=f"reenviar_{chave}"):
+        for h in com_erro:
+            envios[h] = enfileirar_imagem(envios[h].conteudo, envios[h].nome, sharepoint_path, h)
     with col1:
-        arquivo_upload = st.file_uploader(
-            f"{label} (Upload)", type=["jpg", "jpeg", "png"], key=f"upload_{chave}"
-        )
+        arquivos_upload = st.file_uploader(
+            f"{label} (Upload)", type=["jpg", "jpeg", "png"], key=f"upload_{chave}",
+            accept_multiple_files=True
+        ) or []
     with col2:
         usar_camera = st.checkbox("Usar câmera", key=f"camera_check_{chave}")
         if usar_camera:
-            imagem_camera = st.camera_input("Capturar imagem", key=f"camera_{chave}")
+            geracao = st.session_state.get(f"geracao_camera_{chave}", 0)
+            imagem_camera = st.camera_input("Capturar imagem", key=f"camera_{chave}_{geracao}")
             if imagem_camera:
                 conteudo = imagem_camera.getvalue()
-                hash_imagem = hashlib.md5(conteudo).hexdigest()
-                if st.session_state.get(hash_key) != hash_imagem:
-                    st.session_state[hash_key] = hash_imagem
-                    st.session_state[caminho_key] = salvar_imagem(
-                        conteudo, f"evidencia_{chave}", sharepoint_path
-                    )
-    if arquivo_upload:
-        conteudo = arquivo_upload.getvalue()
-        hash_imagem = hashlib.md5(conteudo).hexdigest()
-        if st.session_state.get(hash_key) != hash_imagem:
-            st.session_state[hash_key] = hash_imagem
-            st.session_state[caminho_key] = salvar_imagem(
-                conteudo, f"evidencia_{chave}", sharepoint_path
-            )
-    return st.session_state.get(caminho_key)
+                hash_imagem = hash_conteudo(conteudo)
+                if hash_imagem not in capturas:
+                    capturas.append(hash_imagem)
+                    if hash_imagem not in envios:
+                        envios[hash_imagem] = enfileirar_imagem(
+                            conteudo, f"foto {len(capturas)} da câmera", sharepoint_path, hash_imagem
+                        )
+        if capturas:
+            st.button("Descartar fotos da câmera", key=f"descartar_camera_{chave}",
+                      on_click=descartar_fotos_camera, args=(chave,))
+    
+    hashes_upload = []
+    for arquivo in arquivos_upload:
+        if arquivo.file_id not in hashes_arquivos:
+            hashes_arquivos[arquivo.file_id] = hash_conteudo(arquivo.getvalue())
+        hash_imagem = hashes_arquivos[arquivo.file_id]
+        hashes_upload.append(hash_imagem)
+        if hash_imagem not in envios:
+            envios[hash_imagem] = enfileirar_imagem(arquivo.getvalue(), arquivo.name, sharepoint_path, hash_imagem)
+    
+    # Imagens removidas do upload ou descartadas da câmera saem da lista
+    selecionadas = list(dict.fromkeys(hashes_upload + capturas))
+    for hash_imagem in list(envios):
+        if hash_imagem not in selecionadas:
+            del envios[hash_imagem]
+    evidencias = [envios[h] for h in selecionadas]
+    exibir_status_envios(evidencias)
+    return evidencias
+
+def exibir_evidencia(ctx, caminho_imagem, legenda="Evidência Visual da Inspeção"):
+    # Exibe a miniatura e só baixa a imagem original quando solicitada
+    chave_original = f"ver_original_{caminho_imagem}"
+    try:
+        if st.session_state.get(chave_original):
+            st.image(baixar_arquivo_em_cache(ctx, caminho_imagem), caption=legenda, use_container_width=True)
+            return
+        conteudo_local = obter_fila_local().conteudo_pendente(caminho_imagem)
+        if conteudo_local:
+            st.image(conteudo_local, caption=f"{legenda} (aguardando sincronização)")
+            return
+        try:
+            miniatura = baixar_arquivo_em_cache(ctx, caminho_miniatura(caminho_imagem))
+        except Exception as e:
+            if not arquivo_nao_encontrado(e):
+                raise
+            miniatura = baixar_arquivo_em_cache(ctx, caminho_imagem)  # Evidências antigas não têm miniatura
+        st.image(miniatura, caption=legenda)
+        if st.button("Ver imagem original", key=f"btn_{chave_original}"):
+            st.session_state[chave_original] = True
+            st.rerun()
+    except Exception as e:
+        st.error(f"Erro ao carregar a imagem do SharePoint: {e}")
+        st.write(f"Caminho da imagem: {caminho_imagem}")
 
 def imagem_para_base64(caminho_imagem):
     ctx = get_sharepoint_context()
@@ -269,381 +1175,1525 @@ def imagem_para_base64(caminho_imagem):
         return None
 
 # Funções de Exportação
-def exportar_para_csv(dados, nome_arquivo, sharepoint_base=SHAREPOINT_DADOS_PATH):
+@instrumentado("serializar_csv")
+def gerar_csv(df) -> bytes:
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, encoding='utf-8-sig')
+    return buffer.getvalue().encode('utf-8')
+
+@instrumentado("serializar_excel")
+def gerar_excel(df) -> bytes:
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False, engine='openpyxl')
+    return buffer.getvalue()
+
+def valor_celula(valor):
+    # O openpyxl só aceita valores escalares; listas e dicionários vão como texto
+    return str(valor) if isinstance(valor, (list, dict, tuple)) else valor
+
+@instrumentado("escrever_csv")
+def escrever_csv(caminho, colunas, linhas) -> None:
+    with open(caminho, 'w', newline='', encoding='utf-8-sig') as arquivo:
+        escritor = csv.DictWriter(arquivo, fieldnames=colunas, extrasaction='ignore')
+        escritor.writeheader()
+        escritor.writerows(linhas)
+
+@instrumentado("escrever_excel")
+def escrever_excel(caminho, colunas, linhas) -> None:
+    # Modo write-only: cada linha é gravada no arquivo assim que é adicionada
+    livro = openpyxl.Workbook(write_only=True)
+    planilha = livro.create_sheet()
+    planilha.append(colunas)
+    for linha in linhas:
+        planilha.append([valor_celula(linha.get(coluna)) for coluna in colunas])
+    livro.save(caminho)
+
+# Funções de Processamento de Dados
+# As colunas exportadas de cada processo são declaradas como (coluna, caminho) sobre o
+# dados_formulario, com formatação opcional. Cada esquema é compilado uma vez em
+# funções de extração; informações básicas, evidências e observações valem para todos.
+class ColunasDinamicas(NamedTuple):
+    # Uma coluna por chave do dicionário em `caminho`; `aninhado` desce mais um nível
+    # nos valores que são dicionários
+    prefixo: str
+    caminho: str
+    normalizar: bool = False
+    aninhado: bool = False
+
+def formatar_lista(valor):
+    if valor is None:
+        return ''
+    return ', '.join(str(item) for item in valor if item) if isinstance(valor, list) else valor
+
+def formatar_data_br(valor):
+    if valor and isinstance(valor, str) and valor != "Prazo do fabricante":
+        try:
+            return datetime.fromisoformat(valor).strftime('%d/%m/%Y')
+        except ValueError:
+            return valor
+    return valor
+
+def valor_escalar(valor):
+    if isinstance(valor, list):
+        return ', '.join(map(str, valor))
+    return str(valor) if isinstance(valor, dict) else valor
+
+def normalizar_chave(chave) -> str:
+    return chave.replace(" ", "_").replace("/", "_")
+
+CAMPOS_BASICOS_EXPORTACAO = [
+    ("ID_Inspecao", "id_inspecao"),
+    ("Data_Inspecao", "informacoes_basicas.data_inspecao"),
+    ("Inspetor", "informacoes_basicas.nome_inspetor"),
+    ("Email_Inspetor", "informacoes_basicas.email_inspetor"),
+    ("Empresa", "informacoes_basicas.empresa"),
+    ("Setor", "informacoes_basicas.setor"),
+    ("Laboratorio", "informacoes_basicas.laboratorio"),
+    ("Processo", "processo_selecionado"),
+    ("Timestamp", "timestamp"),
+]
+
+CAMPOS_FINAIS_EXPORTACAO = [
+    ("Evidencia_Visual", "evidencia_visual", formatar_lista),
+    # Monitoramento ambiental grava "observações"; os demais formulários, "observacoes"
+    ("Observacoes", ("observacoes", "observações")),
+]
+
+CAMPOS_INFO_LOGBOOK = [
+    ("Numero_Logbook", "info_logbook.numero_logbook"),
+    ("TAG_Equipamento", "info_logbook.tag_equipamento"),
+    ("Data_Abertura", "info_logbook.data_abertura"),
+    ("Localizacao", "info_logbook.localizacao"),
+]
+
+# Inspeções feitas a partir de um roteiro exportam uma coluna por resposta
+ESQUEMA_ROTEIRO = "roteiro"
+
+# Aumente ao mudar o que os formatadores ou o achatamento produzem (compilar_*,
+# valor_escalar, normalizar_chave...): a base de exportação refaz as linhas antigas.
+# Mudanças nos esquemas abaixo já são detectadas sozinhas
+VERSAO_ACHATAMENTO = 1
+
+# Chave: processo, ou (processo, setor) quando o formulário muda com o setor;
+# None é o formulário genérico
+ESQUEMAS_EXPORTACAO = {
+    ESQUEMA_ROTEIRO: [
+        ColunasDinamicas("", "respostas", normalizar=True, aninhado=True),
+    ],
+    "Soluções": [
+        ("Codigo_Solucao", "identificacao_controle.codigo_solucao"),
+        ("Codigo_Padrao", "identificacao_controle.codigo_padrao"),
+        ("Etiqueta_Integra", "identificacao_controle.etiqueta_integra"),
+        ("Cadeia_Custodia", "identificacao_controle.cadeia_custodia"),
+        ("Substancia_Controlada", "identificacao_controle.substancia_controlada"),
+        ("Data_Recebimento_Padrao", "identificacao_controle.data_recebimento"),
+        ("Data_Preparo_Solucao", "identificacao_controle.data_preparo"),
+        ("Tipo_Solucao", "identificacao_controle.tipo_solucao"),
+        ("Data_Validade_Solucao", "identificacao_controle.data_validade", formatar_data_br),
+        ("Numero_Livro", "anotacoes_registro.numero_livro"),
+        ("Lacre", "anotacoes_registro.lacre"),
+        ("FOR", "anotacoes_registro.for"),
+        ("Classificacao_Correta", "classificacao_risco"),
+        ("Armazenamento_Adequado", "armazenamento_adequado"),
+        ColunasDinamicas("Avaliacao_", "avaliacao_conformidade", normalizar=True),
+    ],
+    ("Rastreabilidade de amostra", "Synvia Labs"): [
+        ("Etiqueta_Integra", "identificacao_amostra.etiqueta_integra"),
+        ("Codigo_Amostra", "identificacao_amostra.codigo_amostra"),
+        ("Data_Recebimento", "identificacao_amostra.data_recebimento"),
+        ("Ativo", "identificacao_amostra.ativo"),
+        ("Codigo_MBA", "identificacao_amostra.codigo_mba"),
+        ("Armazenado_Corretamente", "identificacao_amostra.armazenado_corretamente"),
+        ("Estudo", "identificacao_racks.estudo"),
+        ("Ensaio", "identificacao_racks.ensaio"),
+        ("Validade", "identificacao_racks.validade"),
+        ("Armazenamento_Adequado", "identificacao_racks.armazenamento_adequado"),
+    ],
+    "Rastreabilidade de amostra": [
+        ("Codigo_Amostra_Acompanhada", "acompanhamento_amostra.codigo_amostra_acompanhada"),
+        ("Codigo_Lote_Acompanhado", "acompanhamento_amostra.codigo_lote_acompanhado"),
+        ("Tipo_Amostra", "acompanhamento_amostra.tipo_amostra", formatar_lista),
+        ("TAG_LCMS", "lcms.tag_lcms"),
+        ("Numero_Livro_LCMS", "lcms.numero_livro_lcms"),
+        ("Data_Injecao", "lcms.data_injecao"),
+        ("Horario_Injecao", "lcms.horario_injecao"),
+        ("Criterios_Curva", "lcms.criterios_curva"),
+        ColunasDinamicas("Controle_", "controles_rejeicoes"),
+        ("Numero_Livro_Extracao", "extracao.numero_livro_extracao"),
+        ("Data_Inicio_Extracao", "extracao.data_inicio_extracao"),
+        ("Horario_Entrada_Extracao", "extracao.horario_entrada_extracao"),
+        ("Horario_Saida_Extracao", "extracao.horario_saida_extracao"),
+        ("TAG_Centrifuga", "centrifuga.tag_centrifuga"),
+        ("Numero_Livro_Centrifuga", "centrifuga.numero_livro_centrifuga"),
+        ("Horario_Entrada_Centrifuga", "centrifuga.horario_entrada_centrifuga"),
+        ("Horario_Saida_Centrifuga", "centrifuga.horario_saida_centrifuga"),
+        ("Numero_Livro_Ultrassom", "ultrassom.numero_livro_ultrassom"),
+        ("Data_Anotacao_Ultrassom", "ultrassom.data_anotacao_ultrassom"),
+        ("Horario_Entrada_Ultrassom", "ultrassom.horario_entrada_ultrassom"),
+        ("Horario_Saida_Ultrassom", "ultrassom.horario_saida_ultrassom"),
+        ("Numero_Pacote", "transporte.numero_pacote"),
+        ("Data_Recebimento_Pacote", "transporte.data_recebimento_pacote"),
+        ("Horario_Recebimento_Pacote", "transporte.horario_recebimento_pacote"),
+        ("Transportadora", "transporte.transportadora"),
+    ],
+    "Equipamentos": [
+        ("TAG", "identificacao.tag"),
+        ("Logbook", "identificacao.logbook"),
+        ("Calibracao_Valida", "identificacao.calibracao_valida"),
+        ("Numero_Certificado", "identificacao.num_certificado"),
+        ("Proxima_Calibracao", "identificacao.proxima_calibracao"),
+        ("Anotacao_Logbook", "identificacao.anotacao_logbook"),
+        ("Anotacao_Outros", "identificacao.anotacao_outros"),
+        ("Equipamento", "equipamento_selecionado"),
+        ColunasDinamicas("", "campos_especificos", aninhado=True),
+    ],
+    "Monitoramento ambiental": CAMPOS_INFO_LOGBOOK + [
+        ("Ocorrencias", "ocorrencias", formatar_lista),
+        ("Integridade_Dados", "integridade_dados", formatar_lista),
+        ("Condicoes_Logbook", "condicoes_logbook", formatar_lista),
+        ("TAG_Termo", "equipamentos_associados.tag_termo"),
+        ("Num_Logbook_Monit", "equipamentos_associados.num_logbook_monit"),
+        ("Num_Certificado", "equipamentos_associados.num_certificado"),
+        ("Data_Calibracao", "equipamentos_associados.data_calibracao"),
+        ("Registros_3Meses", "registros_3meses", formatar_lista),
+    ],
+    None: CAMPOS_INFO_LOGBOOK + [
+        ("Integridade_Dados", "integridade_dados", formatar_lista),
+        ColunasDinamicas("Avaliacao_", "avaliacao_detalhada", normalizar=True),
+        ("Condicoes_Logbook", "condicoes_logbook", formatar_lista),
+    ],
+}
+
+def compilar_caminho(caminho, raiz=None):
+    # "a.b" -> função que percorre os dicionários; uma tupla lista caminhos alternativos
+    alternativas = [
+        ((raiz,) if raiz else ()) + tuple(alternativa.split('.'))
+        for alternativa in (caminho if isinstance(caminho, tuple) else (caminho,))
+    ]
+    def obter(dados):
+        for chaves in alternativas:
+            valor = dados
+            for chave in chaves:
+                if not isinstance(valor, dict) or chave not in valor:
+                    break
+                valor = valor[chave]
+            else:
+                return valor
+        return ''
+    return obter
+
+def compilar_coluna(coluna, obter, formatar=None):
+    if formatar:
+        return lambda dados, saida: saida.__setitem__(coluna, valor_escalar(formatar(obter(dados))))
+    return lambda dados, saida: saida.__setitem__(coluna, valor_escalar(obter(dados)))
+
+def compilar_colunas_dinamicas(campo, raiz=None):
+    obter = compilar_caminho(campo.caminho, raiz)
+    def extrair(dados, saida):
+        valores = obter(dados)
+        if not isinstance(valores, dict):
+            return
+        for chave, valor in valores.items():
+            nome = normalizar_chave(chave) if campo.normalizar else chave
+            if not campo.aninhado or not isinstance(valor, dict):
+                saida[f"{campo.prefixo}{nome}"] = valor_escalar(valor)
+            else:
+                for item, valor_item in valor.items():
+                    item = normalizar_chave(item) if campo.normalizar else item
+                    saida[f"{campo.prefixo}{nome}_{item}"] = valor_escalar(valor_item)
+    return extrair
+
+def compilar_esquema(esquema, raiz=None) -> list:
+    extratores = []
+    for campo in esquema:
+        if isinstance(campo, ColunasDinamicas):
+            extratores.append(compilar_colunas_dinamicas(campo, raiz))
+        else:
+            coluna, caminho, *formatar = campo
+            extratores.append(compilar_coluna(coluna, compilar_caminho(caminho, raiz), *formatar))
+    return extratores
+
+def compilar_achatador(esquema):
+    extratores = (
+        compilar_esquema(CAMPOS_BASICOS_EXPORTACAO)
+        + compilar_esquema(esquema, raiz='dados_formulario')
+        + compilar_esquema(CAMPOS_FINAIS_EXPORTACAO, raiz='dados_formulario')
+    )
+    def achatar(dados, saida):
+        for extrair in extratores:
+            extrair(dados, saida)
+        return saida
+    return achatar
+
+ACHATADORES_EXPORTACAO = {chave: compilar_achatador(esquema) for chave, esquema in ESQUEMAS_EXPORTACAO.items()}
+
+def chave_esquema(processo, setor):
+    for chave in [(processo, setor), processo]:
+        if chave in ESQUEMAS_EXPORTACAO:
+            return chave
+    return None
+
+def esquema_da_inspecao(dados):
+    if 'roteiro' in dados.get('dados_formulario', {}):
+        return ESQUEMA_ROTEIRO
+    processo = dados.get('processo_selecionado', '')
+    setor = dados.get('informacoes_basicas', {}).get('setor', '')
+    return chave_esquema(processo, setor)
+
+def achatador_da_inspecao(dados):
+    return ACHATADORES_EXPORTACAO[esquema_da_inspecao(dados)]
+
+def processar_dados_para_exportacao(dados):
+    return achatador_da_inspecao(dados)(dados, {})
+
+@instrumentado("processar_dados_para_exportacao")
+def achatar_em_colunas(registros) -> Dict[str, list]:
+    # Modo em lote: {coluna: valores}, com None onde a inspeção não tem a coluna
+    return linhas_em_colunas(processar_dados_para_exportacao(dados) for dados in registros)
+
+def linhas_em_colunas(linhas) -> Dict[str, list]:
+    colunas = {}
+    for i, linha in enumerate(linhas):
+        for coluna, valor in linha.items():
+            valores = colunas.get(coluna)
+            if valores is None:
+                valores = colunas[coluna] = [None] * i
+            valores.append(valor)
+        for valores in colunas.values():
+            if len(valores) <= i:
+                valores.append(None)
+    return colunas
+
+ARQUIVO_RELATORIO_COMPLETO = "relatorio_completo.csv"
+DIRETORIO_EXPORTACAO_LOCAL = os.path.join(DIRETORIO_DADOS_LOCAL, "exportacao")
+EXPORTACAO_LOTE_REGISTRO = 100
+
+def escrever_arquivo_local(caminho, escrever) -> None:
+    # Escreve em um arquivo temporário e o troca pelo definitivo de uma vez,
+    # para que outra sessão nunca leia um relatório pela metade
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix=os.path.splitext(caminho)[1])
+    os.close(descritor)
+    try:
+        escrever(temporario)
+        os.replace(temporario, caminho)
+    except Exception:
+        os.remove(temporario)
+        raise
+
+def atualizar_base_exportacao(sharepoint_base=SHAREPOINT_DADOS_PATH):
+    # Baixa e achata apenas as inspeções do catálogo que ainda não estão na base local
+    atualizar_catalogo(sharepoint_base, forcar=True)
+    base = obter_base_exportacao()
+    base.descartar_versoes_antigas()
+    exportadas = base.ids_exportados()
+    novas = []
+    for id_inspecao in obter_catalogo().listar_ids():
+        if id_inspecao in exportadas:
+            continue
+        inspecao = carregar_inspecao(id_inspecao, sharepoint_base)
+        if inspecao:
+            novas.append(inspecao)
+        if len(novas) >= EXPORTACAO_LOTE_REGISTRO:
+            base.registrar(novas)
+            novas = []
+    base.registrar(novas)
+    return base
+
+def cabecalho_csv(caminho) -> Optional[List[str]]:
+    try:
+        with open(caminho, newline='', encoding='utf-8-sig') as arquivo:
+            return next(csv.reader(arquivo), None)
+    except FileNotFoundError:
+        return None
+
+def atualizar_csv_local(base, caminho, colunas, ate_linha) -> None:
+    # Enquanto o cabeçalho for o mesmo, só as linhas novas são acrescentadas (a uma
+    # cópia, trocada de uma vez); uma coluna nova ou linhas refeitas pedem o arquivo inteiro
+    if base.tem_linhas_no_csv() and cabecalho_csv(caminho) == colunas:
+        def escrever(destino):
+            shutil.copyfile(caminho, destino)
+            with open(destino, 'a', newline='', encoding='utf-8') as arquivo:
+                csv.DictWriter(arquivo, fieldnames=colunas, extrasaction='ignore').writerows(
+                    base.linhas(fora_do_csv=True, ate_linha=ate_linha))
+    else:
+        def escrever(destino):
+            escrever_csv(destino, colunas, base.linhas(ate_linha=ate_linha))
+    escrever_arquivo_local(caminho, escrever)
+    base.marcar_no_csv(ate_linha)
+
+@instrumentado("exportar_lista_completa", acao=True)
+def exportar_lista_completa_inspecoes(sharepoint_base=SHAREPOINT_DADOS_PATH):
+    # Mantém um relatório completo único: só as inspeções ainda não exportadas são
+    # baixadas e achatadas; as demais vêm das linhas guardadas na base local
     ctx = get_sharepoint_context()
     if not ctx:
         return None
     
     try:
-        dados_planos = {}
-        def achatar_dict(d, prefixo=""):
-            for k, v in d.items():
-                if isinstance(v, dict):
-                    achatar_dict(v, f"{prefixo}{k}_")
-                elif isinstance(v, list):
-                    dados_planos[f"{prefixo}{k}"] = ", ".join(map(str, v))
-                else:
-                    dados_planos[f"{prefixo}{k}"] = v
-        achatar_dict(dados)
-        df = pd.DataFrame([dados_planos])
-        buffer = io.StringIO()
-        df.to_csv(buffer, index=False, encoding='utf-8-sig')
-        buffer.seek(0)
-        file_path = f"{sharepoint_base}/relatorios/{nome_arquivo}"
-        ctx.web.folders.add(f"{sharepoint_base}/relatorios").execute_query()
-        target_folder = ctx.web.get_folder_by_server_relative_url(f"{sharepoint_base}/relatorios")
-        target_folder.upload_file(nome_arquivo, buffer.getvalue().encode('utf-8')).execute_query()
-        return file_path
+        base = atualizar_base_exportacao(sharepoint_base)
+        # As colunas são lidas depois do limite de linhas, então cobrem todas as linhas escritas
+        ate_linha = base.ultima_linha()
+        colunas = base.colunas()
+        if not colunas:
+            return None
+        # Os relatórios são escritos em disco linha a linha e enviados em blocos,
+        # então o uso de memória não cresce com o número de inspeções; o CSV sobe
+        # em segundo plano enquanto o Excel é escrito
+        pasta_relatorios = f"{sharepoint_base}/relatorios"
+        pool, pastas = obter_pool_sharepoint(), obter_pastas_sharepoint()
+        pastas.garantir(ctx, pasta_relatorios)
+        envios = {}
+        caminho_csv = os.path.join(DIRETORIO_EXPORTACAO_LOCAL, ARQUIVO_RELATORIO_COMPLETO)
+        with base.lock_csv:
+            atualizar_csv_local(base, caminho_csv, colunas, ate_linha)
+        envios[ARQUIVO_RELATORIO_COMPLETO] = enviar_arquivo_em_segundo_plano(
+            pool, pastas, pasta_relatorios, ARQUIVO_RELATORIO_COMPLETO, caminho_csv
+        )
+        # O Excel não tem como receber linhas no fim: é reescrito a cada exportação
+        nome_excel = ARQUIVO_RELATORIO_COMPLETO.replace('.csv', '.xlsx')
+        caminho_excel = os.path.join(DIRETORIO_EXPORTACAO_LOCAL, nome_excel)
+        escrever_arquivo_local(caminho_excel,
+                               lambda destino: escrever_excel(destino, colunas, base.linhas(ate_linha=ate_linha)))
+        envios[nome_excel] = enviar_arquivo_em_segundo_plano(pool, pastas, pasta_relatorios, nome_excel, caminho_excel)
+        caminhos = {nome_arquivo: envio.result() for nome_arquivo, envio in envios.items()}
+        return caminhos[ARQUIVO_RELATORIO_COMPLETO]
     except Exception as e:
-        st.error(f"Erro ao exportar para CSV no SharePoint: {e}")
+        st.error(f"Erro ao exportar lista completa de inspeções: {e}")
+        return None
+
+# Exportação Parquet
+# Uma tabela por processo, particionada por mês (<tabela>/mes=AAAA-MM/dados.parquet),
+# com datas tipadas e setor/processo/inspetor como categorias. Só as partições que
+# receberam inspeções desde a última exportação são reescritas.
+TABELAS_PARQUET = {
+    "Soluções": "solucoes",
+    ("Rastreabilidade de amostra", "Synvia Labs"): "rastreabilidade_labs",
+    "Rastreabilidade de amostra": "rastreabilidade_tox",
+    "Equipamentos": "equipamentos",
+    "Monitoramento ambiental": "monitoramento_ambiental",
+    None: "generico",
+}
+COLUNAS_CATEGORICAS_PARQUET = ['Setor', 'Processo', 'Inspetor', 'Empresa', 'Laboratorio']
+def tabela_parquet_da_inspecao(dados) -> str:
+    # Cada roteiro tem a sua tabela, já que as colunas vêm das respostas
+    esquema = esquema_da_inspecao(dados)
+    if esquema == ESQUEMA_ROTEIRO:
+        return f"roteiro_{dados['dados_formulario']['roteiro']}"
+    return TABELAS_PARQUET[esquema]
+
+COLUNAS_DATA_PARQUET = [
+    'Data_Inspecao', 'Data_Recebimento_Padrao', 'Data_Preparo_Solucao', 'Data_Recebimento', 'Validade',
+    'Data_Injecao', 'Data_Inicio_Extracao', 'Data_Anotacao_Ultrassom', 'Data_Recebimento_Pacote',
+    'Proxima_Calibracao', 'Data_Abertura', 'Data_Calibracao'
+]
+
+def tipo_parquet(coluna):
+    if coluna in COLUNAS_DATA_PARQUET:
+        return pa.date32()
+    if coluna == 'Timestamp':
+        return pa.timestamp('us')
+    return pa.string()
+
+def valor_parquet(valor, tipo):
+    if valor is None or valor == '':
+        return None
+    if tipo == pa.string():
+        return str(valor)
+    try:
+        convertido = datetime.fromisoformat(str(valor))
+    except ValueError:
         return None
+    return convertido.date() if tipo == pa.date32() else convertido
+
+def esquema_parquet(colunas) -> pa.Schema:
+    # Um esquema por tabela, com as colunas de todas as suas linhas, para que todas as
+    # partições mensais tenham as mesmas colunas e tipos
+    return pa.schema([
+        (coluna, pa.dictionary(pa.int32(), tipo_parquet(coluna)) if coluna in COLUNAS_CATEGORICAS_PARQUET
+         else tipo_parquet(coluna))
+        for coluna in colunas
+    ])
+
+def tabela_parquet(linhas, esquema=None) -> pa.Table:
+    valores_por_coluna = linhas_em_colunas(linhas)
+    if esquema is None:
+        esquema = esquema_parquet(valores_por_coluna)
+    quantidade = len(next(iter(valores_por_coluna.values()), []))
+    arrays = []
+    for campo in esquema:
+        tipo = tipo_parquet(campo.name)
+        valores = valores_por_coluna.get(campo.name, [None] * quantidade)
+        array = pa.array([valor_parquet(valor, tipo) for valor in valores], type=tipo)
+        arrays.append(array.dictionary_encode().cast(campo.type) if pa.types.is_dictionary(campo.type) else array)
+    return pa.Table.from_arrays(arrays, schema=esquema)
+
+@instrumentado("exportar_parquet", acao=True)
+def exportar_parquet_por_processo(sharepoint_base=SHAREPOINT_DADOS_PATH):
+    ctx = get_sharepoint_context()
+    if not ctx:
+        return None
+    
+    try:
+        base = atualizar_base_exportacao(sharepoint_base)
+        pasta_parquet = f"{sharepoint_base}/relatorios/parquet"
+        particoes = base.particoes_pendentes()
+        # As pastas de todas as partições são criadas em um só lote; cada partição sobe
+        # em segundo plano enquanto a próxima é escrita
+        pool, pastas = obter_pool_sharepoint(), obter_pastas_sharepoint()
+        pastas.garantir(ctx, *[f"{pasta_parquet}/{tabela}/mes={mes}" for tabela, mes in particoes])
+        envios = []
+        esquemas = {tabela: esquema_parquet(base.colunas(tabela)) for tabela in {tabela for tabela, _ in particoes}}
+        for tabela, mes in particoes:
+            caminho_local = os.path.join(DIRETORIO_EXPORTACAO_LOCAL, "parquet", tabela, f"mes={mes}", "dados.parquet")
+            escrever_arquivo_local(caminho_local, lambda destino: pq.write_table(
+                tabela_parquet(base.linhas(tabela, mes), esquemas[tabela]), destino
+            ))
+            envios.append((tabela, mes, enviar_arquivo_em_segundo_plano(
+                pool, pastas, f"{pasta_parquet}/{tabela}/mes={mes}", "dados.parquet", caminho_local
+            )))
+        falhas = []
+        for tabela, mes, envio in envios:
+            try:
+                envio.result()
+                base.marcar_particao(tabela, mes)
+            except Exception as e:
+                falhas.append(e)  # As demais partições enviadas continuam marcadas
+        if falhas:
+            raise falhas[0]
+        return len(particoes)
+    except Exception as e:
+        st.error(f"Erro ao exportar Parquet: {e}")
+        return None
+
+# Validação de Formulários
+# Regras declaradas sobre o registro da inspeção, com as mesmas chaves dos esquemas
+# de exportação, e compiladas uma vez em funções que devolvem as mensagens de erro.
+# Rodam ao salvar, antes de qualquer envio, e em lote sobre o histórico
+# (auditar_inspecoes.py). Valores vazios só são cobrados pelas regras Obrigatorio.
+class Obrigatorio(NamedTuple):
+    rotulo: str
+    caminho: str
+    # Só cobra o campo quando ele foi exibido (roteiros com show_if omitem os ocultos)
+    se_exibido: bool = False
+
+class Formato(NamedTuple):
+    rotulo: str
+    caminho: str
+    valido: Callable
+    descricao: str
+
+class Ordem(NamedTuple):
+    # `antes` não pode ser posterior a `depois`. Horários iguais são os padrões do
+    # st.time_input (trecho não preenchido) e não contam como erro
+    rotulo_antes: str
+    caminho_antes: str
+    rotulo_depois: str
+    caminho_depois: str
+
+def valor_vazio(valor) -> bool:
+    if isinstance(valor, str):
+        return not valor.strip()
+    return valor is None or (isinstance(valor, (list, dict)) and not valor)
+
+def instante_iso(valor):
+    # Datas ("AAAA-MM-DD") e horários ("HH:MM[:SS]") gravados pelos formulários
+    texto = str(valor)
+    try:
+        return datetime.fromisoformat(texto if '-' in texto else f"2000-01-01T{texto}")
+    except ValueError:
+        return None
+
+def e_data_iso(valor) -> bool:
+    return instante_iso(valor) is not None and '-' in str(valor)
+
+def e_hora_iso(valor) -> bool:
+    return instante_iso(valor) is not None and '-' not in str(valor)
+
+PADRAO_EMAIL = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+
+def e_email(valor) -> bool:
+    return PADRAO_EMAIL.fullmatch(str(valor)) is not None
+
+REGRAS_BASICAS = [
+    Obrigatorio("Nome do Inspetor", "informacoes_basicas.nome_inspetor"),
+    Obrigatorio("Empresa a ser Inspecionada", "informacoes_basicas.empresa"),
+    Obrigatorio("Data da Inspeção", "informacoes_basicas.data_inspecao"),
+    Formato("Data da Inspeção", "informacoes_basicas.data_inspecao", e_data_iso, "uma data"),
+    Formato("Email do Inspetor", "informacoes_basicas.email_inspetor", e_email, "um email"),
+]
+
+REGRAS_INFO_LOGBOOK = [
+    Obrigatorio("Número do logbook", "dados_formulario.info_logbook.numero_logbook"),
+    Formato("Data de abertura do logbook", "dados_formulario.info_logbook.data_abertura", e_data_iso, "uma data"),
+]
+
+REGRAS_VALIDACAO = {
+    "Soluções": [
+        Obrigatorio("Código da Solução", "dados_formulario.identificacao_controle.codigo_solucao"),
+        Obrigatorio("Código do padrão utilizado", "dados_formulario.identificacao_controle.codigo_padrao"),
+        Formato("Data de preparo da solução", "dados_formulario.identificacao_controle.data_preparo",
+                e_data_iso, "uma data"),
+        Ordem("Data de preparo da solução", "dados_formulario.identificacao_controle.data_preparo",
+              "Data de validade da solução", "dados_formulario.identificacao_controle.data_validade"),
+    ],
+    ("Rastreabilidade de amostra", "Synvia Labs"): [
+        Obrigatorio("Código da Amostra", "dados_formulario.identificacao_amostra.codigo_amostra"),
+    ],
+    "Rastreabilidade de amostra": [
+        Obrigatorio("Código da amostra acompanhada", "dados_formulario.acompanhamento_amostra.codigo_amostra_acompanhada"),
+        Ordem("Horário de entrada na extração", "dados_formulario.extracao.horario_entrada_extracao",
+              "Horário de saída da extração", "dados_formulario.extracao.horario_saida_extracao"),
+        Ordem("Horário de entrada na centrífuga", "dados_formulario.centrifuga.horario_entrada_centrifuga",
+              "Horário de saída da centrífuga", "dados_formulario.centrifuga.horario_saida_centrifuga"),
+        Ordem("Horário de entrada no ultrassom", "dados_formulario.ultrassom.horario_entrada_ultrassom",
+              "Horário de saída do ultrassom", "dados_formulario.ultrassom.horario_saida_ultrassom"),
+    ],
+    "Equipamentos": [
+        Obrigatorio("TAG", "dados_formulario.identificacao.tag"),
+    ],
+    "Monitoramento ambiental": REGRAS_INFO_LOGBOOK,
+    None: REGRAS_INFO_LOGBOOK,
+}
+
+def compilar_regra(regra):
+    if isinstance(regra, Obrigatorio) and regra.se_exibido:
+        *pai, chave = regra.caminho.split('.')
+        obter_pai = compilar_caminho('.'.join(pai))
+        mensagem = f"{regra.rotulo} é obrigatório."
+        def validar(dados):
+            valores = obter_pai(dados)
+            return mensagem if isinstance(valores, dict) and chave in valores and valor_vazio(valores[chave]) else None
+        return validar
+    if isinstance(regra, Obrigatorio):
+        obter = compilar_caminho(regra.caminho)
+        mensagem = f"{regra.rotulo} é obrigatório."
+        return lambda dados: mensagem if valor_vazio(obter(dados)) else None
+    if isinstance(regra, Formato):
+        obter = compilar_caminho(regra.caminho)
+        def validar(dados):
+            valor = obter(dados)
+            if valor_vazio(valor) or regra.valido(valor):
+                return None
+            return f"{regra.rotulo} deve ser {regra.descricao} (recebido: {valor})."
+        return validar
+    obter_antes, obter_depois = compilar_caminho(regra.caminho_antes), compilar_caminho(regra.caminho_depois)
+    mensagem = f"{regra.rotulo_antes} deve ser anterior a {regra.rotulo_depois}."
+    def validar(dados):
+        antes, depois = instante_iso(obter_antes(dados)), instante_iso(obter_depois(dados))
+        return mensagem if antes and depois and antes > depois else None
+    return validar
+
+def compilar_validador(regras):
+    validacoes = [compilar_regra(regra) for regra in regras]
+    def validar(dados) -> List[str]:
+        return [mensagem for mensagem in (validacao(dados) for validacao in validacoes) if mensagem]
+    return validar
+
+VALIDADORES = {chave: compilar_validador(REGRAS_BASICAS + REGRAS_VALIDACAO.get(chave, []))
+               for chave in ESQUEMAS_EXPORTACAO}
+validar_informacoes_basicas = compilar_validador(REGRAS_BASICAS)
+
+def validar_inspecao(dados, roteiros=None) -> List[str]:
+    # Inspeções de roteiro usam as regras compiladas com o roteiro; se ele não existe
+    # mais, só as informações básicas são verificadas
+    esquema = esquema_da_inspecao(dados)
+    if esquema != ESQUEMA_ROTEIRO:
+        return VALIDADORES[esquema](dados)
+    formulario = roteiros.formulario(dados.get('processo_selecionado', ''),
+                                     dados.get('informacoes_basicas', {}).get('setor', '')) if roteiros else None
+    if formulario is None or formulario.chave != dados['dados_formulario']['roteiro']:
+        return validar_informacoes_basicas(dados)
+    return formulario.validar(dados)
+
+def auditar_inspecoes(inspecoes, roteiros=None) -> Dict[str, List[str]]:
+    # Modo em lote: {id_inspecao: erros}, só com as inspeções que têm problemas
+    auditoria = {}
+    for dados in inspecoes:
+        erros = validar_inspecao(dados, roteiros)
+        if erros:
+            auditoria[dados.get('id_inspecao', '?')] = erros
+    return auditoria
+
+# Funções de Armazenamento de Inspeções
+# Cada inspeção fica em um arquivo próprio dentro da pasta do mês em que foi salva
+# (inspecoes/AAAA-MM/<id_inspecao>.json). O manifesto.json de cada mês guarda apenas
+# os campos de resumo usados pelo histórico.
+ARQUIVO_MANIFESTO = "manifesto.json"
+ARQUIVO_INSPECOES_LEGADO = "inspecoes.json"
+ARQUIVO_INSPECOES_LEGADO_MIGRADO = "inspecoes_legado.json"
+
+def mes_da_inspecao(id_inspecao) -> str:
+    # IDs seguem o formato insp_AAAAMMDD_HHMMSS_xxxxxxxx
+    try:
+        return datetime.strptime(id_inspecao.split('_')[1], "%Y%m%d").strftime("%Y-%m")
+    except (IndexError, ValueError):
+        return "sem_data"
+
+def pasta_mes_inspecoes(mes, sharepoint_base=SHAREPOINT_DADOS_PATH) -> str:
+    return f"{sharepoint_base}/inspecoes/{mes}"
+
+CATALOGO_INTERVALO_SEGUNDOS = 60
+HISTORICO_ITENS_POR_PAGINA = 10
+CAMPOS_FILTRO_HISTORICO = ['setor', 'processo', 'nome_inspetor']
+CAMPOS_RESUMO = ['id_inspecao', 'data_inspecao', 'nome_inspetor', 'empresa', 'setor', 'processo', 'timestamp']
+
+def resumir_inspecao(dados) -> Dict:
+    info_basicas = dados.get('informacoes_basicas', {})
+    return {
+        'id_inspecao': dados.get('id_inspecao', ''),
+        'data_inspecao': info_basicas.get('data_inspecao', ''),
+        'nome_inspetor': info_basicas.get('nome_inspetor', ''),
+        'empresa': info_basicas.get('empresa', ''),
+        'setor': info_basicas.get('setor', ''),
+        'processo': dados.get('processo_selecionado', ''),
+        'timestamp': dados.get('timestamp', '')
+    }
+
+def serializar_inspecao(dados) -> bytes:
+    return json.dumps(dados, ensure_ascii=False, indent=4).encode('utf-8')
+
+def textos_da_inspecao(valor):
+    # Todos os textos da inspeção, entre eles os caminhos das evidências
+    if isinstance(valor, str):
+        yield valor
+    elif isinstance(valor, dict):
+        for item in valor.values():
+            yield from textos_da_inspecao(item)
+    elif isinstance(valor, list):
+        for item in valor:
+            yield from textos_da_inspecao(item)
+
+def adicionar_ao_manifesto(ctx, pasta_mes, resumos) -> List[Dict]:
+    def mesclar(manifesto):
+        ids_existentes = {r.get('id_inspecao') for r in manifesto}
+        return manifesto + [r for r in resumos if r['id_inspecao'] not in ids_existentes]
+    return atualizar_json_condicional(ctx, pasta_mes, ARQUIVO_MANIFESTO, mesclar, padrao=[])
+
+def migrar_inspecoes_legadas(ctx, sharepoint_base=SHAREPOINT_DADOS_PATH) -> int:
+    # Divide o antigo inspecoes.json em arquivos por inspeção e o renomeia ao final
+    caminho_legado = f"{sharepoint_base}/inspecoes/{ARQUIVO_INSPECOES_LEGADO}"
+    inspecoes = ler_json(ctx, caminho_legado)
+    if inspecoes is None:
+        return 0
+    por_mes = {}
+    for insp in inspecoes:
+        por_mes.setdefault(mes_da_inspecao(insp.get('id_inspecao', '')), []).append(insp)
+    pastas = obter_pastas_sharepoint()
+    for mes, lote in por_mes.items():
+        pasta_mes = pasta_mes_inspecoes(mes, sharepoint_base)
+        # Os arquivos do mês vão em lotes ($batch) em vez de uma requisição por inspeção
+        with pastas.escrita(ctx, pasta_mes, em_lote=True):
+            arquivos = ctx.web.get_folder_by_server_relative_url(pasta_mes).files
+            for insp in lote:
+                arquivos.add(f"{insp['id_inspecao']}.json", serializar_inspecao(insp), True)
+            ctx.execute_batch()
+        invalidar_downloads(*[f"{pasta_mes}/{insp['id_inspecao']}.json" for insp in lote])
+        adicionar_ao_manifesto(ctx, pasta_mes, [resumir_inspecao(insp) for insp in lote])
+    ctx.web.get_file_by_server_relative_url(caminho_legado).rename(ARQUIVO_INSPECOES_LEGADO_MIGRADO).execute_query()
+    invalidar_downloads(caminho_legado)
+    return len(inspecoes)
 
-def exportar_para_excel(dados, nome_arquivo, sharepoint_base=SHAREPOINT_DADOS_PATH):
+@st.cache_resource
+def garantir_migracao_inspecoes(sharepoint_base=SHAREPOINT_DADOS_PATH):
+    # Executada uma vez por processo, junto com o provisionamento da árvore
+    # dados/{imagens,inspecoes,relatorios}; exceções não são cacheadas e tudo é retentado
     ctx = get_sharepoint_context()
     if not ctx:
-        return None
-    
+        raise ConnectionError("Não foi possível conectar ao SharePoint para migrar as inspeções.")
+    obter_pastas_sharepoint().garantir(ctx, *[f"{sharepoint_base}/{pasta}" for pasta in ("imagens", "inspecoes", "relatorios")])
+    return migrar_inspecoes_legadas(ctx, sharepoint_base)
+
+def preparar_armazenamento_inspecoes(sharepoint_base=SHAREPOINT_DADOS_PATH) -> bool:
     try:
-        dados_planos = {}
-        def achatar_dict(d, prefixo=""):
-            for k, v in d.items():
-                if isinstance(v, dict):
-                    achatar_dict(v, f"{prefixo}{k}_")
-                elif isinstance(v, list):
-                    dados_planos[f"{prefixo}{k}"] = ", ".join(map(str, v))
-                else:
-                    dados_planos[f"{prefixo}{k}"] = v
-        achatar_dict(dados)
-        df = pd.DataFrame([dados_planos])
-        buffer = io.BytesIO()
-        df.to_excel(buffer, index=False, engine='openpyxl')
-        buffer.seek(0)
-        file_path = f"{sharepoint_base}/relatorios/{nome_arquivo}"
-        ctx.web.folders.add(f"{sharepoint_base}/relatorios").execute_query()
-        target_folder = ctx.web.get_folder_by_server_relative_url(f"{sharepoint_base}/relatorios")
-        target_folder.upload_file(nome_arquivo, buffer.getvalue()).execute_query()
-        return file_path
+        garantir_migracao_inspecoes(sharepoint_base)
+        return True
     except Exception as e:
-        st.error(f"Erro ao exportar para Excel no SharePoint: {e}")
-        return None
+        st.error(f"Erro ao migrar o arquivo legado de inspeções: {e}")
+        return False
 
-# Funções de Processamento de Dados
-def processar_dados_para_exportacao(dados):
-    dados_processados = {}
-    info_basicas = dados.get('informacoes_basicas', {})
-    dados_processados['ID_Inspecao'] = dados.get('id_inspecao', '')
-    dados_processados['Data_Inspecao'] = info_basicas.get('data_inspecao', '')
-    dados_processados['Inspetor'] = info_basicas.get('nome_inspetor', '')
-    dados_processados['Email_Inspetor'] = info_basicas.get('email_inspetor', '')
-    dados_processados['Empresa'] = info_basicas.get('empresa', '')
-    dados_processados['Setor'] = info_basicas.get('setor', '')
-    dados_processados['Laboratorio'] = info_basicas.get('laboratorio', '')
-    dados_processados['Processo'] = dados.get('processo_selecionado', '')
-    dados_processados['Timestamp'] = dados.get('timestamp', '')
-    
-    dados_form = dados.get('dados_formulario', {})
-    processo = dados.get('processo_selecionado', '')
-    
-    if processo == "Soluções":
-        identificacao = dados_form.get('identificacao_controle', {})
-        dados_processados['Codigo_Solucao'] = identificacao.get('codigo_solucao', '')
-        dados_processados['Codigo_Padrao'] = identificacao.get('codigo_padrao', '')
-        dados_processados['Etiqueta_Integra'] = identificacao.get('etiqueta_integra', '')
-        dados_processados['Cadeia_Custodia'] = identificacao.get('cadeia_custodia', '')
-        dados_processados['Substancia_Controlada'] = identificacao.get('substancia_controlada', '')
-        dados_processados['Data_Recebimento_Padrao'] = identificacao.get('data_recebimento', '')
-        dados_processados['Data_Preparo_Solucao'] = identificacao.get('data_preparo', '')
-        dados_processados['Tipo_Solucao'] = identificacao.get('tipo_solucao', '')
-        data_validade = identificacao.get('data_validade', '')
-        if data_validade and isinstance(data_validade, str) and data_validade != "Prazo do fabricante":
-            try:
-                data_validade_formatada = datetime.fromisoformat(data_validade).strftime('%d/%m/%Y')
-            except:
-                data_validade_formatada = data_validade
-        else:
-            data_validade_formatada = data_validade
-        dados_processados['Data_Validade_Solucao'] = data_validade_formatada
-        anotacoes = dados_form.get('anotacoes_registro', {})
-        dados_processados['Numero_Livro'] = anotacoes.get('numero_livro', '')
-        dados_processados['Lacre'] = anotacoes.get('lacre', '')
-        dados_processados['FOR'] = anotacoes.get('for', '')
-        dados_processados['Classificacao_Correta'] = dados_form.get('classificacao_risco', '')
-        dados_processados['Armazenamento_Adequado'] = dados_form.get('armazenamento_adequado', '')
-        avaliacao = dados_form.get('avaliacao_conformidade', {})
-        for erro, avaliacao_erro in avaliacao.items():
-            dados_processados[f'Avaliacao_{erro.replace(" ", "_").replace("/", "_")}'] = avaliacao_erro
-    
-    elif processo == "Rastreabilidade de amostra":
-        setor = info_basicas.get('setor', '')
-        if setor == "Synvia Labs":
-            identificacao = dados_form.get('identificacao_amostra', {})
-            dados_processados['Etiqueta_Integra'] = identificacao.get('etiqueta_integra', '')
-            dados_processados['Codigo_Amostra'] = identificacao.get('codigo_amostra', '')
-            dados_processados['Data_Recebimento'] = identificacao.get('data_recebimento', '')
-            dados_processados['Ativo'] = identificacao.get('ativo', '')
-            dados_processados['Codigo_MBA'] = identificacao.get('codigo_mba', '')
-            dados_processados['Armazenado_Corretamente'] = identificacao.get('armazenado_corretamente', '')
-            racks = dados_form.get('identificacao_racks', {})
-            dados_processados['Estudo'] = racks.get('estudo', '')
-            dados_processados['Ensaio'] = racks.get('ensaio', '')
-            dados_processados['Validade'] = racks.get('validade', '')
-            dados_processados['Armazenamento_Adequado'] = racks.get('armazenamento_adequado', '')
-        else:
-            acompanhamento = dados_form.get('acompanhamento_amostra', {})
-            dados_processados['Codigo_Amostra_Acompanhada'] = acompanhamento.get('codigo_amostra_acompanhada', '')
-            dados_processados['Codigo_Lote_Acompanhado'] = acompanhamento.get('codigo_lote_acompanhado', '')
-            dados_processados['Tipo_Amostra'] = ', '.join(acompanhamento.get('tipo_amostra', []))
-            lcms = dados_form.get('lcms', {})
-            dados_processados['TAG_LCMS'] = lcms.get('tag_lcms', '')
-            dados_processados['Numero_Livro_LCMS'] = lcms.get('numero_livro_lcms', '')
-            dados_processados['Data_Injecao'] = lcms.get('data_injecao', '')
-            dados_processados['Horario_Injecao'] = lcms.get('horario_injecao', '')
-            dados_processados['Criterios_Curva'] = lcms.get('criterios_curva', '')
-            controles = dados_form.get('controles_rejeicoes', {})
-            for controle, resultado in controles.items():
-                dados_processados[f'Controle_{controle}'] = resultado
-            extracao = dados_form.get('extracao', {})
-            dados_processados['Numero_Livro_Extracao'] = extracao.get('numero_livro_extracao', '')
-            dados_processados['Data_Inicio_Extracao'] = extracao.get('data_inicio_extracao', '')
-            dados_processados['Horario_Entrada_Extracao'] = extracao.get('horario_entrada_extracao', '')
-            dados_processados['Horario_Saida_Extracao'] = extracao.get('horario_saida_extracao', '')
-            centrifuga = dados_form.get('centrifuga', {})
-            dados_processados['TAG_Centrifuga'] = centrifuga.get('tag_centrifuga', '')
-            dados_processados['Numero_Livro_Centrifuga'] = centrifuga.get('numero_livro_centrifuga', '')
-            dados_processados['Horario_Entrada_Centrifuga'] = centrifuga.get('horario_entrada_centrifuga', '')
-            dados_processados['Horario_Saida_Centrifuga'] = centrifuga.get('horario_saida_centrifuga', '')
-            ultrassom = dados_form.get('ultrassom', {})
-            dados_processados['Numero_Livro_Ultrassom'] = ultrassom.get('numero_livro_ultrassom', '')
-            dados_processados['Data_Anotacao_Ultrassom'] = ultrassom.get('data_anotacao_ultrassom', '')
-            dados_processados['Horario_Entrada_Ultrassom'] = ultrassom.get('horario_entrada_ultrassom', '')
-            dados_processados['Horario_Saida_Ultrassom'] = ultrassom.get('horario_saida_ultrassom', '')
-            transporte = dados_form.get('transporte', {})
-            dados_processados['Numero_Pacote'] = transporte.get('numero_pacote', '')
-            dados_processados['Data_Recebimento_Pacote'] = transporte.get('data_recebimento_pacote', '')
-            dados_processados['Horario_Recebimento_Pacote'] = transporte.get('horario_recebimento_pacote', '')
-            dados_processados['Transportadora'] = transporte.get('transportadora', '')
-    
-    elif processo == "Equipamentos":
-        identificacao = dados_form.get('identificacao', {})
-        dados_processados['TAG'] = identificacao.get('tag', '')
-        dados_processados['Logbook'] = identificacao.get('logbook', '')
-        dados_processados['Calibracao_Valida'] = identificacao.get('calibracao_valida', '')
-        dados_processados['Numero_Certificado'] = identificacao.get('num_certificado', '')
-        dados_processados['Proxima_Calibracao'] = identificacao.get('proxima_calibracao', '')
-        dados_processados['Anotacao_Logbook'] = identificacao.get('anotacao_logbook', '')
-        dados_processados['Anotacao_Outros'] = identificacao.get('anotacao_outros', '')
-        dados_processados['Equipamento'] = dados_form.get('equipamento_selecionado', '')
-        campos_especificos = dados_form.get('campos_especificos', {})
-        for categoria, detalhes in campos_especificos.items():
-            if isinstance(detalhes, dict):
-                for item, valor in detalhes.items():
-                    dados_processados[f'{categoria}_{item}'] = valor
-    
-    elif processo == "Monitoramento ambiental":
-        info_logbook = dados_form.get('info_logbook', {})
-        dados_processados['Numero_Logbook'] = info_logbook.get('numero_logbook', '')
-        dados_processados['TAG_Equipamento'] = info_logbook.get('tag_equipamento', '')
-        dados_processados['Data_Abertura'] = info_logbook.get('data_abertura', '')
-        dados_processados['Localizacao'] = info_logbook.get('localizacao', '')
-        dados_processados['Ocorrencias'] = ', '.join(dados_form.get('ocorrencias', []))
-        dados_processados['Integridade_Dados'] = ', '.join(dados_form.get('integridade_dados', []))
-        dados_processados['Condicoes_Logbook'] = ', '.join(dados_form.get('condicoes_logbook', []))
-        equipamentos = dados_form.get('equipamentos_associados', {})
-        dados_processados['TAG_Termo'] = equipamentos.get('tag_termo', '')
-        dados_processados['Num_Logbook_Monit'] = equipamentos.get('num_logbook_monit', '')
-        dados_processados['Num_Certificado'] = equipamentos.get('num_certificado', '')
-        dados_processados['Data_Calibracao'] = equipamentos.get('data_calibracao', '')
-        dados_processados['Registros_3Meses'] = ', '.join(dados_form.get('registros_3meses', []))
-    
-    else:
-        if 'info_logbook' in dados_form:
-            info_logbook = dados_form.get('info_logbook', {})
-            dados_processados['Numero_Logbook'] = info_logbook.get('numero_logbook', '')
-            dados_processados['TAG_Equipamento'] = info_logbook.get('tag_equipamento', '')
-            dados_processados['Data_Abertura'] = info_logbook.get('data_abertura', '')
-            dados_processados['Localizacao'] = info_logbook.get('localizacao', '')
-        if 'integridade_dados' in dados_form:
-            dados_processados['Integridade_Dados'] = ', '.join(dados_form.get('integridade_dados', []))
-        if 'avaliacao_detalhada' in dados_form:
-            avaliacao = dados_form.get('avaliacao_detalhada', {})
-            for erro, avaliacao_erro in avaliacao.items():
-                dados_processados[f'Avaliacao_{erro.replace(" ", "_").replace("/", "_")}'] = avaliacao_erro
-        if 'condicoes_logbook' in dados_form:
-            dados_processados['Condicoes_Logbook'] = ', '.join(dados_form.get('condicoes_logbook', []))
-    
-    dados_processados['Evidencia_Visual'] = dados_form.get('evidencia_visual', '')
-    dados_processados['Observacoes'] = dados_form.get('observacoes', '')
-    return dados_processados
+# Funções de Inspeção
+class PipelineSalvamento:
+    # Achata e serializa a inspeção uma única vez e envia JSON, CSV e XLSX em um só
+    # lote; os artefatos ficam em memória para quem chamou
+    def __init__(self, dados, sharepoint_base=SHAREPOINT_DADOS_PATH):
+        self.dados = dados
+        self.sharepoint_base = sharepoint_base
+        self.id_inspecao = dados['id_inspecao']
+        self.pasta_mes = pasta_mes_inspecoes(mes_da_inspecao(self.id_inspecao), sharepoint_base)
+        self.pasta_relatorios = f"{sharepoint_base}/relatorios"
+        self.nome_arquivo_csv = f"relatorio_{self.id_inspecao}.csv"
+        self.nome_arquivo_excel = f"relatorio_{self.id_inspecao}.xlsx"
+        self.caminho_csv = f"{self.pasta_relatorios}/{self.nome_arquivo_csv}"
+        self.caminho_excel = f"{self.pasta_relatorios}/{self.nome_arquivo_excel}"
+        self.artefatos = {}
 
-def exportar_lista_completa_inspecoes(sharepoint_base=SHAREPOINT_DADOS_PATH):
-    ctx = get_sharepoint_context()
-    if not ctx:
+    def preparar(self):
+        df = pd.DataFrame(achatar_em_colunas([self.dados]))
+        self.artefatos = {
+            'json': serializar_inspecao(self.dados),
+            'csv': gerar_csv(df),
+            'xlsx': gerar_excel(df)
+        }
+        return self
+
+    @instrumentado("enviar_inspecao")
+    def enviar(self, ctx, incluir_registro=True, pastas=None, atualizar_manifesto=True):
+        # Com atualizar_manifesto=False quem chama agrupa os resumos e atualiza o
+        # manifesto de cada mês uma única vez
+        if not self.artefatos:
+            self.preparar()
+        web = ctx.web
+        destinos = [self.pasta_mes, self.pasta_relatorios] if incluir_registro else [self.pasta_relatorios]
+        with (pastas or PastasSharePoint()).escrita(ctx, *destinos, em_lote=True):
+            if incluir_registro:
+                web.get_folder_by_server_relative_url(self.pasta_mes).files.add(
+                    f"{self.id_inspecao}.json", self.artefatos['json'], True
+                )
+            relatorios = web.get_folder_by_server_relative_url(self.pasta_relatorios).files
+            relatorios.add(self.nome_arquivo_csv, self.artefatos['csv'], True)
+            relatorios.add(self.nome_arquivo_excel, self.artefatos['xlsx'], True)
+            ctx.execute_batch()
+        invalidar_downloads(f"{self.pasta_mes}/{self.id_inspecao}.json", self.caminho_csv, self.caminho_excel)
+        # O manifesto depende de escrita condicional, por isso fica fora do lote
+        if incluir_registro and atualizar_manifesto:
+            adicionar_ao_manifesto(ctx, self.pasta_mes, [resumir_inspecao(self.dados)])
+        return self
+
+@instrumentado("salvar_inspecao", acao=True)
+def salvar_inspecao(dados, sharepoint_base=SHAREPOINT_DADOS_PATH):
+    # Aguarda os envios de evidências ainda em andamento antes de gravar o registro
+    falhas = []
+    for chave in list(dados.keys()):
+        dados[chave] = aguardar_envios_imagens(dados[chave], falhas)
+    if falhas:
+        st.error("Não foi possível enviar todas as evidências: " + "; ".join(falhas))
         return None
     
-    arquivo_inspecoes = f"{sharepoint_base}/inspecoes/inspecoes.json"
+    id_inspecao = f"insp_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    dados['id_inspecao'] = id_inspecao
+    dados['timestamp'] = datetime.now().isoformat()
     
     try:
-        file_content = download_file_content(ctx, arquivo_inspecoes)  # Lê o conteúdo do arquivo (retorna bytes)
-        inspecoes = json.loads(file_content.decode('utf-8')) if file_content else []
+        # O registro vai primeiro para a fila local; o envio ao SharePoint é feito pelo
+        # sincronizador em segundo plano, com o id da inspeção tornando-o idempotente
+        pipeline = PipelineSalvamento(dados, sharepoint_base).preparar()
+        obter_fila_local().registrar_inspecao(pipeline)
+        obter_catalogo().registrar([resumir_inspecao(dados)])
+        obter_sincronizador().notificar()
         
-        dados_relatorio = []
-        for insp in inspecoes:
-            dados_processados = processar_dados_para_exportacao(insp)
-            dados_relatorio.append(dados_processados)
-        
-        if dados_relatorio:
-            df = pd.DataFrame(dados_relatorio)
-            nome_arquivo = f"relatorio_completo_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            caminho_arquivo = f"{sharepoint_base}/relatorios/{nome_arquivo}"
-            
-            buffer = io.StringIO()
-            df.to_csv(buffer, index=False, encoding='utf-8-sig')
-            buffer.seek(0)
-            ctx.web.folders.add(f"{sharepoint_base}/relatorios").execute_query()
-            target_folder = ctx.web.get_folder_by_server_relative_url(f"{sharepoint_base}/relatorios")
-            target_folder.upload_file(nome_arquivo, buffer.getvalue().encode('utf-8')).execute_query()
-            
-            nome_arquivo_excel = nome_arquivo.replace('.csv', '.xlsx')
-            caminho_excel = f"{sharepoint_base}/relatorios/{nome_arquivo_excel}"
-            buffer_excel = io.BytesIO()
-            df.to_excel(buffer_excel, index=False, engine='openpyxl')
-            buffer_excel.seek(0)
-            target_folder.upload_file(nome_arquivo_excel, buffer_excel.getvalue()).execute_query()
-            
-            return caminho_arquivo
-        return None
+        st.success(f"Inspeção {id_inspecao} salva com sucesso!")
+        return pipeline
     except Exception as e:
-        st.error(f"Erro ao exportar lista completa de inspeções: {e}")
+        st.error(f"Erro ao salvar inspeção: {e}")
         return None
 
-# Funções de Inspeção
-def salvar_inspecao(dados, sharepoint_base=SHAREPOINT_DADOS_PATH):
+@instrumentado("carregar_inspecao", acao=True)
+def carregar_inspecao(id_inspecao, sharepoint_base=SHAREPOINT_DADOS_PATH):
+    # Inspeções ainda não sincronizadas são lidas da fila local
+    conteudo_local = obter_fila_local().conteudo_pendente(id_inspecao)
+    if conteudo_local:
+        return json.loads(conteudo_local.decode('utf-8'))
+    
     ctx = get_sharepoint_context()
     if not ctx:
-        st.error("Não foi possível conectar ao SharePoint para salvar a inspeção.")
+        st.error("Não foi possível conectar ao SharePoint para carregar a inspeção.")
+        return None
+    if not preparar_armazenamento_inspecoes(sharepoint_base):
         return None
     
-    id_inspecao = f"insp_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
-    dados['id_inspecao'] = id_inspecao
-    dados['timestamp'] = datetime.now().isoformat()
-    arquivo_inspecoes = f"{sharepoint_base}/inspecoes/inspecoes.json"
-    
+    pasta_mes = pasta_mes_inspecoes(mes_da_inspecao(id_inspecao), sharepoint_base)
     try:
-        # Cria a pasta se não existir
-        ctx.web.folders.add(f"{sharepoint_base}/inspecoes").execute_query()
-        
-        # Lê o conteúdo atual do arquivo JSON
-        try:
-            file_content = ctx.web.get_file_by_server_relative_url(arquivo_inspecoes).get_content().execute_query().value
-            inspecoes = json.loads(file_content.decode('utf-8')) if file_content else []
-        except Exception:
-            inspecoes = []  # Se o arquivo não existir, começa com uma lista vazia
-        
-        # Adiciona a nova inspeção
-        inspecoes.append(dados)
-        
-        # Salva o arquivo JSON atualizado
-        file_content = json.dumps(inspecoes, ensure_ascii=False, indent=4).encode('utf-8')
-        target_folder = ctx.web.get_folder_by_server_relative_url(f"{sharepoint_base}/inspecoes")
-        target_folder.upload_file("inspecoes.json", file_content).execute_query()
-        
-        # Verifica se a inspeção foi salva corretamente
-        file_content_verificacao = ctx.web.get_file_by_server_relative_url(arquivo_inspecoes).get_content().execute_query().value
-        inspecoes_verificacao = json.loads(file_content_verificacao.decode('utf-8'))
-        if not any(insp.get('id_inspecao') == id_inspecao for insp in inspecoes_verificacao):
-            st.error("Erro: A inspeção não foi salva corretamente no JSON.")
-            return None
-        
-        # Gera os relatórios CSV e Excel para a inspeção
-        dados_processados = processar_dados_para_exportacao(dados)
-        nome_arquivo_csv = f"relatorio_{id_inspecao}.csv"
-        nome_arquivo_excel = f"relatorio_{id_inspecao}.xlsx"
-        caminho_csv = exportar_para_csv(dados_processados, nome_arquivo_csv, sharepoint_base)
-        caminho_excel = exportar_para_excel(dados_processados, nome_arquivo_excel, sharepoint_base)
-        
-        if not caminho_csv or not caminho_excel:
-            st.error("Erro ao gerar relatórios CSV ou Excel.")
-            return None
-        
-        # Limpa e recarrega o cache
-        get_inspecoes_cached.clear()
-        get_inspecoes_cached(sharepoint_base)
-        
-        st.success(f"Inspeção {id_inspecao} salva com sucesso!")
-        return id_inspecao, caminho_csv  # Retorna também o caminho do CSV para uso posterior
+        return ler_json(ctx, f"{pasta_mes}/{id_inspecao}.json")
     except Exception as e:
-        st.error(f"Erro ao salvar inspeção no SharePoint: {e}")
+        st.error(f"Erro ao carregar inspeção {id_inspecao}: {e}")
         return None
 
-# Função `gerar_relatorio` ajustada (opcional, já que agora é gerado em `salvar_inspecao`)
+# Regenera os relatórios de uma inspeção já salva (o salvamento já os gera)
+@instrumentado("gerar_relatorio", acao=True)
 def gerar_relatorio(id_inspecao, sharepoint_base=SHAREPOINT_DADOS_PATH):
     ctx = get_sharepoint_context()
     if not ctx:
         return None
     
-    arquivo_inspecoes = f"{sharepoint_base}/inspecoes/inspecoes.json"
-    
     try:
-        file_content = download_file_content(ctx, arquivo_inspecoes)
-        inspecoes = json.loads(file_content.decode('utf-8')) if file_content else []
-        
-        inspecao = next((i for i in inspecoes if i.get('id_inspecao') == id_inspecao), None)
+        inspecao = carregar_inspecao(id_inspecao, sharepoint_base)
         if not inspecao:
             st.error(f"Inspeção com ID {id_inspecao} não encontrada.")
             return None
         
-        dados_processados = processar_dados_para_exportacao(inspecao)
-        nome_arquivo_csv = f"relatorio_{id_inspecao}.csv"
-        caminho_csv = exportar_para_csv(dados_processados, nome_arquivo_csv, sharepoint_base)
-        nome_arquivo_excel = f"relatorio_{id_inspecao}.xlsx"
-        caminho_excel = exportar_para_excel(dados_processados, nome_arquivo_excel, sharepoint_base)
-        
-        if not caminho_csv or not caminho_excel:
-            st.error("Erro ao gerar relatórios CSV ou Excel.")
-            return None
-        
-        return caminho_csv
+        pipeline = PipelineSalvamento(inspecao, sharepoint_base).preparar().enviar(
+            ctx, incluir_registro=False, pastas=obter_pastas_sharepoint()
+        )
+        return pipeline.caminho_csv
     except Exception as e:
         st.error(f"Erro ao gerar relatório: {e}")
         return None
     
-@st.cache_data
-def get_inspecoes_cached(sharepoint_base=SHAREPOINT_DADOS_PATH):
-    ctx = get_sharepoint_context()
-    if not ctx:
-        st.error("Não foi possível conectar ao SharePoint para listar inspeções.")
-        return []
-    
-    arquivo_inspecoes = f"{sharepoint_base}/inspecoes/inspecoes.json"
-    
+@instrumentado("listar_inspecoes", acao=True)
+def listar_inspecoes(filtros=None, pagina=0, itens_por_pagina=HISTORICO_ITENS_POR_PAGINA,
+                     sharepoint_base=SHAREPOINT_DADOS_PATH):
+    atualizar_catalogo(sharepoint_base)
+    return obter_catalogo().consultar(filtros, pagina, itens_por_pagina)
+
+# Relatórios para Download
+# Os relatórios de cada inspeção ficam na sessão, com tamanho limitado, e os botões
+# de download os servem sem consultar o SharePoint a cada rerun. O relatório
+# completo é lido do disco local apenas quando o botão é clicado.
+ARTEFATOS_SESSAO_MAX_MB = 16
+MIME_CSV = "text/csv"
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+def relatorios_inspecao(dados) -> Dict[str, bytes]:
+    # Retorna {nome_arquivo: conteudo}, gerando localmente se a sessão ainda não os tiver
+    cache = st.session_state.setdefault('relatorios_sessao', OrderedDict())
+    chave = dados.get('id_inspecao')
+    if chave in cache:
+        cache.move_to_end(chave)
+        return cache[chave]
+    pipeline = PipelineSalvamento(dados).preparar()
+    guardar_relatorios(pipeline)
+    return cache[chave]
+
+def guardar_relatorios(pipeline) -> None:
+    cache = st.session_state.setdefault('relatorios_sessao', OrderedDict())
+    cache.pop(pipeline.id_inspecao, None)
+    cache[pipeline.id_inspecao] = {
+        pipeline.nome_arquivo_csv: pipeline.artefatos['csv'],
+        pipeline.nome_arquivo_excel: pipeline.artefatos['xlsx'],
+    }
+    while len(cache) > 1 and sum(
+        len(conteudo) for relatorios in cache.values() for conteudo in relatorios.values()
+    ) > ARTEFATOS_SESSAO_MAX_MB * 1024 * 1024:
+        cache.popitem(last=False)
+
+def ler_arquivo_local(caminho) -> bytes:
+    with open(caminho, 'rb') as arquivo:
+        return arquivo.read()
+
+# Fila de Gravação Local e Sincronização
+# Inspeções e evidências são gravadas primeiro em um SQLite local (latência de disco)
+# e um sincronizador em segundo plano as envia ao SharePoint. Os envios são
+# idempotentes: inspeções usam o próprio id e imagens um caminho derivado do conteúdo.
+SINCRONIZACAO_INTERVALO_SEGUNDOS = 30
+SINCRONIZACAO_MAX_WORKERS = 4
+SINCRONIZACAO_MAX_TENTATIVAS = 5
+TIPO_PENDENCIA_IMAGEM = "imagem"
+TIPO_PENDENCIA_INSPECAO = "inspecao"
+
+class BancoLocal(ABC):
+    def __init__(self, caminho_banco=ARQUIVO_BANCO_LOCAL):
+        self.caminho_banco = caminho_banco
+        os.makedirs(os.path.dirname(caminho_banco), exist_ok=True)
+        with self._conexao() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            self._criar_tabelas(con)
+
+    @abstractmethod
+    def _criar_tabelas(self, con) -> None:
+        # Cada base cria (ou migra) as próprias tabelas, dentro da transação de abertura
+        ...
+
+    @contextmanager
+    def _conexao(self):
+        con = sqlite3.connect(self.caminho_banco, timeout=30)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+class FilaGravacaoLocal(BancoLocal):
+    def _criar_tabelas(self, con) -> None:
+        con.execute(
+            """CREATE TABLE IF NOT EXISTS pendencias (
+                id TEXT PRIMARY KEY,
+                tipo TEXT NOT NULL,
+                destino TEXT NOT NULL,
+                conteudo BLOB NOT NULL,
+                criado_em TEXT NOT NULL,
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                ultimo_erro TEXT,
+                falha_definitiva INTEGER NOT NULL DEFAULT 0,
+                relatorio_csv BLOB,
+                relatorio_xlsx BLOB
+            )"""
+        )
+        # Filas criadas antes do limite de tentativas ou dos relatórios; as pendências são mantidas
+        colunas = {linha[1] for linha in con.execute("PRAGMA table_info(pendencias)")}
+        if 'falha_definitiva' not in colunas:
+            con.execute("ALTER TABLE pendencias ADD COLUMN falha_definitiva INTEGER NOT NULL DEFAULT 0")
+        if 'relatorio_csv' not in colunas:
+            con.execute("ALTER TABLE pendencias ADD COLUMN relatorio_csv BLOB")
+            con.execute("ALTER TABLE pendencias ADD COLUMN relatorio_xlsx BLOB")
+
+    def _registrar(self, id_pendencia, tipo, destino, conteudo, relatorio_csv=None, relatorio_xlsx=None) -> None:
+        with self._conexao() as con:
+            con.execute(
+                "INSERT OR IGNORE INTO pendencias (id, tipo, destino, conteudo, criado_em, relatorio_csv, relatorio_xlsx) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (id_pendencia, tipo, destino, conteudo, datetime.now().isoformat(), relatorio_csv, relatorio_xlsx)
+            )
+
+    def registrar_imagem(self, conteudo, hash_imagem, sharepoint_path=SHAREPOINT_IMAGENS_PATH) -> str:
+        caminho = caminho_imagem_por_conteudo(conteudo, hash_imagem, sharepoint_path)
+        self._registrar(caminho, TIPO_PENDENCIA_IMAGEM, sharepoint_path, conteudo)
+        return caminho
+
+    def registrar_inspecao(self, pipeline) -> None:
+        # Os artefatos já preparados vão junto, para o sincronizador não gerá-los de novo
+        self._registrar(pipeline.id_inspecao, TIPO_PENDENCIA_INSPECAO, pipeline.sharepoint_base,
+                        pipeline.artefatos['json'], pipeline.artefatos['csv'], pipeline.artefatos['xlsx'])
+
+    def listar(self) -> List[Dict]:
+        # Sem o conteúdo, que cada envio lê com conteudo_pendente; as falhas definitivas
+        # ficam de fora até serem reativadas
+        with self._conexao() as con:
+            con.row_factory = sqlite3.Row
+            linhas = con.execute(
+                "SELECT id, tipo, destino FROM pendencias WHERE falha_definitiva = 0 ORDER BY tipo = ?, criado_em",
+                (TIPO_PENDENCIA_INSPECAO,)
+            ).fetchall()
+        return [dict(linha) for linha in linhas]
+
+    def ids_pendentes(self, tipo) -> set:
+        with self._conexao() as con:
+            return {linha[0] for linha in con.execute("SELECT id FROM pendencias WHERE tipo = ?", (tipo,))}
+
+    def conteudo_pendente(self, id_pendencia) -> Optional[bytes]:
+        with self._conexao() as con:
+            linha = con.execute("SELECT conteudo FROM pendencias WHERE id = ?", (id_pendencia,)).fetchone()
+        return linha[0] if linha else None
+
+    def artefatos_pendentes(self, id_pendencia) -> Optional[Dict[str, bytes]]:
+        # JSON, CSV e XLSX de uma inspeção; None se ela foi enfileirada sem os relatórios
+        with self._conexao() as con:
+            linha = con.execute("SELECT conteudo, relatorio_csv, relatorio_xlsx FROM pendencias WHERE id = ?",
+                                (id_pendencia,)).fetchone()
+        if not linha or linha[1] is None or linha[2] is None:
+            return None
+        return {'json': linha[0], 'csv': linha[1], 'xlsx': linha[2]}
+
+    def remover(self, id_pendencia) -> None:
+        with self._conexao() as con:
+            con.execute("DELETE FROM pendencias WHERE id = ?", (id_pendencia,))
+
+    def registrar_falha(self, id_pendencia, erro, max_tentativas=SINCRONIZACAO_MAX_TENTATIVAS) -> None:
+        # Erros transitórios só contam tentativas; os demais, ao atingir o limite, tiram
+        # a pendência dos ciclos até alguém reativá-la
+        definitiva = not erro_transitorio(erro)
+        with self._conexao() as con:
+            con.execute(
+                """UPDATE pendencias SET tentativas = tentativas + 1, ultimo_erro = ?,
+                   falha_definitiva = (? AND tentativas + 1 >= ?) WHERE id = ?""",
+                (str(erro), definitiva, max_tentativas, id_pendencia)
+            )
+
+    def listar_falhas(self) -> List[Dict]:
+        with self._conexao() as con:
+            con.row_factory = sqlite3.Row
+            linhas = con.execute(
+                "SELECT id, tipo, tentativas, ultimo_erro FROM pendencias WHERE falha_definitiva = 1 ORDER BY criado_em"
+            ).fetchall()
+        return [dict(linha) for linha in linhas]
+
+    def reativar_falhas(self) -> None:
+        with self._conexao() as con:
+            con.execute("UPDATE pendencias SET falha_definitiva = 0, tentativas = 0 WHERE falha_definitiva = 1")
+
+    def resumo(self) -> Dict:
+        with self._conexao() as con:
+            total, falhas, ultimo_erro = con.execute(
+                "SELECT COUNT(*), COALESCE(SUM(falha_definitiva), 0), "
+                "MAX(CASE WHEN ultimo_erro IS NOT NULL THEN ultimo_erro END) FROM pendencias"
+            ).fetchone()
+        return {'total': total, 'falhas': falhas, 'ultimo_erro': ultimo_erro}
+
+class SincronizadorSharePoint:
+    def __init__(self, fila_local, pool, indice_imagens, intervalo=SINCRONIZACAO_INTERVALO_SEGUNDOS,
+                 telemetria=None, pastas=None, max_workers=SINCRONIZACAO_MAX_WORKERS):
+        self.fila_local = fila_local
+        self.pool = pool
+        self.indice_imagens = indice_imagens
+        self.intervalo = intervalo
+        self.telemetria = telemetria
+        self.pastas = pastas or PastasSharePoint()
+        self.max_workers = max_workers
+        # Threads permanentes: cada uma mantém o seu contexto (e o form digest) entre ciclos
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sincronizacao")
+        self._lock = threading.Lock()
+        self._evento = threading.Event()
+        self._thread = threading.Thread(target=self._executar, name="sincronizador_sharepoint", daemon=True)
+        self._thread.start()
+
+    def notificar(self) -> None:
+        self._evento.set()
+
+    def _executar(self) -> None:
+        while True:
+            self._evento.wait(self.intervalo)
+            self._evento.clear()
+            if self.telemetria:
+                # Cada ciclo em segundo plano é um trace próprio, fora de qualquer rerun
+                _contexto_telemetria.set(ContextoTelemetria(self.telemetria, None, None, uuid.uuid4().hex, None))
+            try:
+                self.sincronizar()
+            except Exception:
+                pass  # A falha já ficou registrada na pendência; tenta de novo no próximo ciclo
+
+    def _enviar(self, pendencia, imagens_na_fila=frozenset()):
+        # Roda nas threads do executor; inspeções devolvem (pasta do mês, resumo) para
+        # o manifesto, que é atualizado depois, uma vez por mês, ou None se alguma das
+        # suas evidências ainda estiver na fila
+        conteudo = self.fila_local.conteudo_pendente(pendencia['id'])
+        if conteudo is None:
+            return None  # Já removida por outro ciclo
+        if pendencia['tipo'] == TIPO_PENDENCIA_IMAGEM:
+            hash_imagem = os.path.splitext(os.path.basename(pendencia['id']))[0]
+            enviar_imagem(self.pool.obter_contexto(), conteudo, pendencia['destino'],
+                          indice=self.indice_imagens, hash_imagem=hash_imagem, pastas=self.pastas)
+            return None
+        dados = json.loads(conteudo.decode('utf-8'))
+        if imagens_na_fila and not imagens_na_fila.isdisjoint(textos_da_inspecao(dados)):
+            return None
+        ctx = self.pool.obter_contexto()
+        # Os relatórios preparados no salvamento são reaproveitados; só inspeções
+        # enfileiradas sem eles são achatadas aqui (enviar() chama preparar())
+        pipeline = PipelineSalvamento(dados, pendencia['destino'])
+        pipeline.artefatos = self.fila_local.artefatos_pendentes(pendencia['id']) or {}
+        pipeline.enviar(ctx, pastas=self.pastas, atualizar_manifesto=False)
+        return pipeline.pasta_mes, resumir_inspecao(dados)
+
+    def _enviar_em_ondas(self, pendencias, *args):
+        # Ondas do tamanho do executor; um erro transitório interrompe o ciclo
+        concluidas = []
+        for inicio in range(0, len(pendencias), self.max_workers):
+            onda = [(pendencia, self._executor.submit(contextvars.copy_context().run, self._enviar, pendencia, *args))
+                    for pendencia in pendencias[inicio:inicio + self.max_workers]]
+            interromper = False
+            for pendencia, future in onda:
+                try:
+                    concluidas.append((pendencia, future.result()))
+                except Exception as e:
+                    self.fila_local.registrar_falha(pendencia['id'], e)
+                    interromper = interromper or erro_transitorio(e)
+            if interromper:
+                self.pool.invalidar()
+                return concluidas, False
+        return concluidas, True
+
+    @instrumentado("sincronizacao", acao=True)
+    def sincronizar(self) -> int:
+        enviadas = 0
+        with self._lock:
+            pendencias = self.fila_local.listar()
+            # Imagens primeiro, para que as inspeções cheguem com as evidências já enviadas
+            imagens = [p for p in pendencias if p['tipo'] == TIPO_PENDENCIA_IMAGEM]
+            concluidas, continuar = self._enviar_em_ondas(imagens)
+            for pendencia, _ in concluidas:
+                self.fila_local.remover(pendencia['id'])
+                enviadas += 1
+            if not continuar:
+                return enviadas  # SharePoint inacessível: o restante espera o próximo ciclo
+            
+            # Inspeções cujas evidências continuam na fila (com erro ou falha definitiva) esperam
+            imagens_na_fila = frozenset(self.fila_local.ids_pendentes(TIPO_PENDENCIA_IMAGEM))
+            concluidas, _ = self._enviar_em_ondas([p for p in pendencias if p['tipo'] != TIPO_PENDENCIA_IMAGEM],
+                                                  imagens_na_fila)
+            # Uma inspeção só sai da fila depois de entrar no manifesto; reenviá-la é idempotente
+            por_mes = {}
+            for pendencia, enviada in concluidas:
+                if enviada is None:
+                    continue
+                pasta_mes, resumo = enviada
+                por_mes.setdefault(pasta_mes, []).append((pendencia, resumo))
+            for pasta_mes, itens in por_mes.items():
+                try:
+                    adicionar_ao_manifesto(self.pool.obter_contexto(), pasta_mes, [resumo for _, resumo in itens])
+                except Exception as e:
+                    for pendencia, _ in itens:
+                        self.fila_local.registrar_falha(pendencia['id'], e)
+                    if erro_transitorio(e):
+                        self.pool.invalidar()
+                        break
+                    continue
+                for pendencia, _ in itens:
+                    self.fila_local.remover(pendencia['id'])
+                    enviadas += 1
+        return enviadas
+
+class CatalogoInspecoes(BancoLocal):
+    # Cópia local dos manifestos para o histórico: cada mês guarda o ETag do seu
+    # manifesto e só é baixado de novo quando o próprio manifesto muda
+    def __init__(self, caminho_banco=ARQUIVO_BANCO_LOCAL, intervalo=CATALOGO_INTERVALO_SEGUNDOS):
+        super().__init__(caminho_banco)
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._ultima_sincronizacao = None
+
+    def _criar_tabelas(self, con) -> None:
+        con.execute(
+            """CREATE TABLE IF NOT EXISTS catalogo (
+                id_inspecao TEXT PRIMARY KEY,
+                data_inspecao TEXT,
+                nome_inspetor TEXT,
+                empresa TEXT,
+                setor TEXT,
+                processo TEXT,
+                timestamp TEXT
+            )"""
+        )
+        con.execute("CREATE INDEX IF NOT EXISTS idx_catalogo_timestamp ON catalogo (timestamp)")
+        con.execute("CREATE INDEX IF NOT EXISTS idx_catalogo_data ON catalogo (data_inspecao)")
+        con.execute("CREATE TABLE IF NOT EXISTS catalogo_meses (mes TEXT PRIMARY KEY, etag TEXT)")
+        colunas = {linha[1] for linha in con.execute("PRAGMA table_info(catalogo_meses)")}
+        if 'etag' not in colunas:
+            # Meses registrados pela data da pasta: são relidos uma vez na próxima sincronização
+            con.execute("DROP TABLE catalogo_meses")
+            con.execute("CREATE TABLE catalogo_meses (mes TEXT PRIMARY KEY, etag TEXT)")
+
+    def registrar(self, resumos) -> None:
+        with self._conexao() as con:
+            con.executemany(
+                """INSERT OR REPLACE INTO catalogo
+                   (id_inspecao, data_inspecao, nome_inspetor, empresa, setor, processo, timestamp)
+                   VALUES (:id_inspecao, :data_inspecao, :nome_inspetor, :empresa, :setor, :processo, :timestamp)""",
+                [{**dict.fromkeys(CAMPOS_RESUMO, ''), **r} for r in resumos]
+            )
+
+    def sincronizacao_vencida(self) -> bool:
+        return self._ultima_sincronizacao is None or time.monotonic() - self._ultima_sincronizacao >= self.intervalo
+
+    def sincronizar(self, ctx, sharepoint_base=SHAREPOINT_DADOS_PATH) -> int:
+        with self._lock:
+            self._ultima_sincronizacao = time.monotonic()
+            with self._conexao() as con:
+                conhecidos = dict(con.execute("SELECT mes, etag FROM catalogo_meses").fetchall())
+            atualizados = 0
+            for mes in listar_subpastas(ctx, f"{sharepoint_base}/inspecoes"):
+                # GET condicional: um manifesto inalterado responde 304, sem corpo
+                manifesto, etag = ler_json_com_etag(
+                    ctx, f"{pasta_mes_inspecoes(mes, sharepoint_base)}/{ARQUIVO_MANIFESTO}", [], conhecidos.get(mes)
+                )
+                if manifesto is None:
+                    continue
+                self.registrar(manifesto)
+                with self._conexao() as con:
+                    con.execute("INSERT OR REPLACE INTO catalogo_meses (mes, etag) VALUES (?, ?)", (mes, etag))
+                atualizados += 1
+            return atualizados
+
+    def _filtrar(self, filtros) -> tuple:
+        condicoes, parametros = [], []
+        if filtros.get('data_inicio'):
+            condicoes.append("data_inspecao >= ?")
+            parametros.append(str(filtros['data_inicio']))
+        if filtros.get('data_fim'):
+            condicoes.append("data_inspecao <= ?")
+            parametros.append(str(filtros['data_fim']))
+        for coluna in CAMPOS_FILTRO_HISTORICO:
+            if filtros.get(coluna):
+                condicoes.append(f"{coluna} = ?")
+                parametros.append(filtros[coluna])
+        return (" WHERE " + " AND ".join(condicoes) if condicoes else ""), parametros
+
+    def consultar(self, filtros=None, pagina=0, itens_por_pagina=HISTORICO_ITENS_POR_PAGINA):
+        # Retorna apenas a página pedida e o total de inspeções que atendem aos filtros
+        where, parametros = self._filtrar(filtros or {})
+        with self._conexao() as con:
+            con.row_factory = sqlite3.Row
+            total = con.execute(f"SELECT COUNT(*) FROM catalogo{where}", parametros).fetchone()[0]
+            linhas = con.execute(
+                f"SELECT {', '.join(CAMPOS_RESUMO)} FROM catalogo{where} "
+                "ORDER BY timestamp DESC LIMIT ? OFFSET ?",
+                parametros + [itens_por_pagina, pagina * itens_por_pagina]
+            ).fetchall()
+        return [dict(linha) for linha in linhas], total
+
+    def valores_distintos(self, coluna) -> List[str]:
+        if coluna not in CAMPOS_FILTRO_HISTORICO:
+            raise ValueError(f"Coluna inválida para filtro: {coluna}")
+        with self._conexao() as con:
+            return [linha[0] for linha in con.execute(
+                f"SELECT DISTINCT {coluna} FROM catalogo WHERE {coluna} != '' ORDER BY {coluna}"
+            )]
+
+    def listar_ids(self) -> List[str]:
+        with self._conexao() as con:
+            return [linha[0] for linha in con.execute("SELECT id_inspecao FROM catalogo ORDER BY timestamp")]
+
+def assinatura_exportacao() -> str:
+    # Versão manual mais um hash só da parte declarativa (colunas, caminhos, nomes dos
+    # formatadores e tabelas Parquet): comentários e formatação do código não contam
+    def descrever(valor):
+        if callable(valor):
+            return valor.__name__
+        if isinstance(valor, dict):
+            return [(descrever(chave), descrever(item)) for chave, item in valor.items()]
+        if isinstance(valor, (list, tuple)):
+            return [type(valor).__name__] + [descrever(item) for item in valor]
+        return repr(valor)
+    partes = [CAMPOS_BASICOS_EXPORTACAO, ESQUEMAS_EXPORTACAO, CAMPOS_FINAIS_EXPORTACAO, TABELAS_PARQUET]
+    resumo = hashlib.sha256(repr(descrever(partes)).encode('utf-8')).hexdigest()[:12]
+    return f"{VERSAO_ACHATAMENTO}-{resumo}"
+
+VERSAO_EXPORTACAO = assinatura_exportacao()
+
+class BaseExportacao(BancoLocal):
+    # Linhas já achatadas do relatório completo, uma por inspeção exportada, com a
+    # versão dos esquemas que as gerou, a tabela Parquet e o mês a que pertencem. As
+    # colunas de cada tabela ficam na base, na ordem em que apareceram, e `no_csv`
+    # marca as linhas que já estão no CSV local
+    def __init__(self, caminho_banco=ARQUIVO_BANCO_LOCAL):
+        super().__init__(caminho_banco)
+        self.lock_csv = threading.Lock()
+
+    def _criar_tabelas(self, con) -> None:
+        con.execute(
+            """CREATE TABLE IF NOT EXISTS exportacao (
+                id_inspecao TEXT PRIMARY KEY,
+                timestamp TEXT,
+                linha TEXT NOT NULL,
+                tabela TEXT,
+                mes TEXT,
+                versao TEXT,
+                no_csv INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        colunas = {linha[1] for linha in con.execute("PRAGMA table_info(exportacao)")}
+        if 'versao' not in colunas:
+            # Base criada antes das colunas de partição ou de versão: como é só uma
+            # cópia local, é esvaziada e refeita na próxima exportação
+            con.execute("DROP TABLE exportacao")
+            con.execute("DROP TABLE IF EXISTS colunas_exportacao")
+            self._criar_tabelas(con)
+            return
+        con.execute("CREATE INDEX IF NOT EXISTS idx_exportacao_particao ON exportacao (tabela, mes)")
+        # Partições Parquet já escritas; registrar uma inspeção remove a da sua partição
+        con.execute("CREATE TABLE IF NOT EXISTS particoes_parquet (tabela TEXT, mes TEXT, PRIMARY KEY (tabela, mes))")
+        con.execute("CREATE TABLE IF NOT EXISTS colunas_exportacao (tabela TEXT, coluna TEXT, PRIMARY KEY (tabela, coluna))")
+
+    def ids_exportados(self) -> set:
+        with self._conexao() as con:
+            return {linha[0] for linha in con.execute("SELECT id_inspecao FROM exportacao")}
+
+    def descartar_versoes_antigas(self, versao=VERSAO_EXPORTACAO) -> int:
+        # As inspeções descartadas voltam a ser baixadas e achatadas por atualizar_base_exportacao
+        with self._conexao() as con:
+            descartadas = con.execute("DELETE FROM exportacao WHERE versao IS NOT ?", (versao,)).rowcount
+            if descartadas:
+                con.execute("DELETE FROM particoes_parquet")
+                con.execute("DELETE FROM colunas_exportacao")
+                con.execute("UPDATE exportacao SET no_csv = 0")
+                for tabela, linha in con.execute("SELECT tabela, linha FROM exportacao ORDER BY rowid").fetchall():
+                    self._registrar_colunas(con, [(tabela, coluna) for coluna in json.loads(linha)])
+        return descartadas
+
+    def _registrar_colunas(self, con, colunas) -> None:
+        # Uma coluna nova muda o esquema da tabela: todas as suas partições são reescritas
+        por_tabela = {}
+        for tabela, coluna in colunas:
+            por_tabela.setdefault(tabela, []).append((tabela, coluna))
+        for tabela, novas in por_tabela.items():
+            if con.executemany("INSERT OR IGNORE INTO colunas_exportacao (tabela, coluna) VALUES (?, ?)",
+                               novas).rowcount:
+                con.execute("DELETE FROM particoes_parquet WHERE tabela = ?", (tabela,))
+
+    def registrar(self, inspecoes) -> None:
+        linhas, colunas = [], {}
+        # Um span por lote: medir cada inspeção pesaria mais que o próprio achatamento
+        with medir("processar_dados_para_exportacao", registros=len(inspecoes)):
+            for insp in inspecoes:
+                linha = processar_dados_para_exportacao(insp)
+                tabela = tabela_parquet_da_inspecao(insp)
+                linhas.append((insp['id_inspecao'], insp.get('timestamp', ''),
+                               json.dumps(linha, ensure_ascii=False, default=str),
+                               tabela, mes_da_inspecao(insp['id_inspecao']), VERSAO_EXPORTACAO))
+                colunas.update(dict.fromkeys((tabela, coluna) for coluna in linha))
+        if not linhas:
+            return
+        with self._conexao() as con:
+            # Substituir uma linha que já está no CSV invalida o arquivo, que é reescrito inteiro
+            ids = [linha[0] for linha in linhas]
+            if con.execute(f"SELECT 1 FROM exportacao WHERE no_csv = 1 AND id_inspecao IN ({', '.join('?' * len(ids))})",
+                           ids).fetchone():
+                con.execute("UPDATE exportacao SET no_csv = 0")
+            con.executemany(
+                "INSERT OR REPLACE INTO exportacao (id_inspecao, timestamp, linha, tabela, mes, versao) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                linhas
+            )
+            self._registrar_colunas(con, list(colunas))
+            con.executemany("DELETE FROM particoes_parquet WHERE tabela = ? AND mes = ?",
+                            [(linha[3], linha[4]) for linha in linhas])
+
+    def particoes_pendentes(self) -> List[tuple]:
+        with self._conexao() as con:
+            return con.execute(
+                """SELECT DISTINCT e.tabela, e.mes FROM exportacao e
+                   LEFT JOIN particoes_parquet p ON p.tabela = e.tabela AND p.mes = e.mes
+                   WHERE p.tabela IS NULL ORDER BY e.tabela, e.mes"""
+            ).fetchall()
+
+    def marcar_particao(self, tabela, mes) -> None:
+        with self._conexao() as con:
+            con.execute("INSERT OR REPLACE INTO particoes_parquet (tabela, mes) VALUES (?, ?)", (tabela, mes))
+
+    def colunas(self, tabela=None) -> List[str]:
+        # Sem `tabela`, a união das colunas de todas as tabelas, na ordem em que apareceram
+        with self._conexao() as con:
+            if tabela is not None:
+                return [linha[0] for linha in con.execute(
+                    "SELECT coluna FROM colunas_exportacao WHERE tabela = ? ORDER BY rowid", (tabela,))]
+            return [linha[0] for linha in con.execute(
+                "SELECT coluna FROM colunas_exportacao GROUP BY coluna ORDER BY MIN(rowid)")]
+
+    def ultima_linha(self) -> int:
+        with self._conexao() as con:
+            return con.execute("SELECT COALESCE(MAX(rowid), 0) FROM exportacao").fetchone()[0]
+
+    def tem_linhas_no_csv(self) -> bool:
+        with self._conexao() as con:
+            return con.execute("SELECT 1 FROM exportacao WHERE no_csv = 1 LIMIT 1").fetchone() is not None
+
+    def marcar_no_csv(self, ate_linha) -> None:
+        with self._conexao() as con:
+            con.execute("UPDATE exportacao SET no_csv = 1 WHERE no_csv = 0 AND rowid <= ?", (ate_linha,))
+
+    def linhas(self, tabela=None, mes=None, fora_do_csv=False, ate_linha=None, tamanho_lote=EXPORTACAO_LOTE_REGISTRO):
+        # `ate_linha` limita a leitura às linhas que já existiam quando ultima_linha() foi lido
+        condicoes, parametros = [], []
+        if tabela is not None:
+            condicoes.append("tabela = ? AND mes = ?")
+            parametros += [tabela, mes]
+        if fora_do_csv:
+            condicoes.append("no_csv = 0")
+        if ate_linha is not None:
+            condicoes.append("rowid <= ?")
+            parametros.append(ate_linha)
+        where = " WHERE " + " AND ".join(condicoes) if condicoes else ""
+        with self._conexao() as con:
+            cursor = con.execute(f"SELECT linha FROM exportacao{where} ORDER BY timestamp", parametros)
+            while True:
+                lote = cursor.fetchmany(tamanho_lote)
+                if not lote:
+                    break
+                for linha in lote:
+                    yield json.loads(linha[0])
+
+@st.cache_resource
+def obter_fila_local():
+    return FilaGravacaoLocal()
+
+@st.cache_resource
+def obter_catalogo():
+    return CatalogoInspecoes()
+
+@st.cache_resource
+def obter_base_exportacao():
+    return BaseExportacao()
+
+@instrumentado("atualizar_catalogo", acao=True)
+def atualizar_catalogo(sharepoint_base=SHAREPOINT_DADOS_PATH, forcar=False) -> None:
+    catalogo = obter_catalogo()
+    if not forcar and not catalogo.sincronizacao_vencida():
+        return
     try:
-        file = ctx.web.get_file_by_server_relative_url(arquivo_inspecoes)
-        file_content = file.get_content().execute_query().value
-        inspecoes = json.loads(file_content.decode('utf-8')) if file_content else []
-        return inspecoes
+        ctx = obter_pool_sharepoint().obter_contexto()
+        garantir_migracao_inspecoes(sharepoint_base)
+        catalogo.sincronizar(ctx, sharepoint_base)
     except Exception as e:
-        if "File Not Found" in str(e):
-            st.warning("Arquivo de inspeções não encontrado. Nenhuma inspeção registrada.")
-            return []
-        else:
-            st.error(f"Erro ao listar inspeções: {e}")
-            return []
+        st.caption(f"Exibindo o histórico local; não foi possível atualizá-lo a partir do SharePoint ({e}).")
+
+@st.cache_resource
+def obter_sincronizador():
+    return SincronizadorSharePoint(obter_fila_local(), obter_pool_sharepoint(), obter_indice_imagens(),
+                                   telemetria=obter_telemetria(), pastas=obter_pastas_sharepoint())
 
-def listar_inspecoes(sharepoint_base=SHAREPOINT_DADOS_PATH):
-    inspecoes = get_inspecoes_cached(sharepoint_base)
-    return [
-        {
-            'id_inspecao': insp.get('id_inspecao', ''),
-            'data_inspecao': insp.get('informacoes_basicas', {}).get('data_inspecao', ''),
-            'nome_inspetor': insp.get('informacoes_basicas', {}).get('nome_inspetor', ''),
-            'empresa': insp.get('informacoes_basicas', {}).get('empresa', ''),
-            'setor': insp.get('informacoes_basicas', {}).get('setor', ''),
-            'processo': insp.get('processo_selecionado', '')
+def mudar_pagina_historico(passo) -> None:
+    st.session_state.historico_pagina += passo
+
+@fragmento
+def exibir_historico_inspecoes():
+    st.write("### Histórico de Inspeções")
+    catalogo = obter_catalogo()
+    with st.expander("Filtros"):
+        periodo = st.date_input("Período", value=(), format="DD/MM/YYYY", key="historico_periodo")
+        filtros = {
+            'data_inicio': periodo[0] if len(periodo) > 0 else None,
+            'data_fim': periodo[1] if len(periodo) > 1 else None,
         }
+        for coluna, rotulo in zip(CAMPOS_FILTRO_HISTORICO, ["Setor", "Processo", "Inspetor"]):
+            filtros[coluna] = st.selectbox(rotulo, [""] + catalogo.valores_distintos(coluna),
+                                           key=f"historico_filtro_{coluna}")
+    
+    # Volta para a primeira página sempre que os filtros mudam
+    if st.session_state.get('historico_filtros') != filtros:
+        st.session_state.historico_filtros = filtros
+        st.session_state.historico_pagina = 0
+    pagina = st.session_state.historico_pagina
+    
+    inspecoes, total = listar_inspecoes(filtros, pagina)
+    if not inspecoes:
+        st.caption("Nenhuma inspeção encontrada.")
+        return
+    total_paginas = -(-total // HISTORICO_ITENS_POR_PAGINA)
+    
+    rotulos = {
+        insp['id_inspecao']: f"{insp['data_inspecao']} - {insp['empresa']} - {insp['processo']}"
         for insp in inspecoes
-    ]
+    }
+    id_inspecao = st.radio(
+        f"Inspeções ({total}) — página {pagina + 1} de {total_paginas}:",
+        options=list(rotulos),
+        format_func=rotulos.get,
+        key="historico_inspecoes"
+    )
+    # A página muda no callback, antes do rerun do fragmento, sem um rerun extra
+    col_anterior, col_proxima = st.columns(2)
+    col_anterior.button("◀ Anterior", key="btn_historico_anterior", disabled=pagina == 0,
+                        on_click=mudar_pagina_historico, args=(-1,))
+    col_proxima.button("Próxima ▶", key="btn_historico_proxima", disabled=pagina + 1 >= total_paginas,
+                       on_click=mudar_pagina_historico, args=(1,))
+    
+    if st.button("Carregar Inspeção", key="btn_carregar_inspecao"):
+        inspecao = carregar_inspecao(id_inspecao)
+        if inspecao:
+            st.session_state.dados_inspecao = inspecao
+            st.session_state.etapa_atual = 'conclusao'
+            st.rerun()
+        else:
+            st.error(f"Inspeção com ID {id_inspecao} não encontrada.")
+
+def exibir_status_sincronizacao():
+    obter_sincronizador()  # Garante que o sincronizador do processo esteja rodando
+    resumo = obter_fila_local().resumo()
+    if not resumo['total']:
+        return
+    st.warning(f"🔄 {resumo['total']} registro(s) aguardando sincronização com o SharePoint.")
+    if resumo['ultimo_erro']:
+        st.caption(f"Último erro: {resumo['ultimo_erro']}")
+    if resumo['falhas']:
+        with st.expander(f"⛔ {resumo['falhas']} registro(s) não sincronizado(s) após "
+                         f"{SINCRONIZACAO_MAX_TENTATIVAS} tentativas"):
+            st.dataframe(pd.DataFrame(obter_fila_local().listar_falhas()), hide_index=True)
+            st.caption("Esses registros só voltam a ser enviados depois de reativados; inspeções com "
+                       "evidências nesta lista também aguardam.")
+            if st.button("Reativar e sincronizar", key="btn_reativar_falhas"):
+                obter_fila_local().reativar_falhas()
+                obter_sincronizador().notificar()
+                st.rerun()
+    if st.button("Sincronizar agora", key="btn_sincronizar"):
+        with st.spinner("Sincronizando com o SharePoint..."):
+            enviadas = obter_sincronizador().sincronizar()
+        st.success(f"{enviadas} registro(s) sincronizado(s).")
+
 # Componentes de Interface
-def tabela_avaliacao_erros(chave, erros=None):
+def exibir_erros_validacao(erros):
+    st.error("Corrija os campos abaixo antes de continuar:\n\n" + "\n".join(f"- {erro}" for erro in erros))
+
+@fragmento
+def tabela_avaliacao_erros(chave, erros=None, opcoes=None, titulo="### Avaliação Detalhada", coluna="Erro"):
     if erros is None:
         erros = [
             "Falta de assinatura/rubrica",
@@ -656,12 +2706,14 @@ def tabela_avaliacao_erros(chave, erros=None):
             "TAG incorreta",
             "Dados ilegíveis"
         ]
-    opcoes = ["0 erros", "1 a 5 erros", "6 a 10 erros", "Mais de 10 erros"]
-    st.write("### Avaliação Detalhada")
+    if opcoes is None:
+        opcoes = ["0 erros", "1 a 5 erros", "6 a 10 erros", "Mais de 10 erros"]
+    if titulo:
+        st.write(titulo)
     resultados = {}
     cols = st.columns([3] + [1] * len(opcoes))
     with cols[0]:
-        st.write("**Erro**")
+        st.write(f"**{coluna}**")
     for i, opcao in enumerate(opcoes):
         with cols[i+1]:
             st.write(f"**{opcao}**")
@@ -773,6 +2825,301 @@ def componente_info_logbook(chave, localizacoes=None):
         "localizacao": localizacao
     }
 
+# Roteiros de Inspeção
+# Processos definidos em roteiros_final_v4.json (SharePoint, com cópia local de
+# reserva) são renderizados a partir do esquema. O arquivo é lido uma vez por
+# processo e revalidado pelo ETag (ou pela data de modificação da cópia local) a
+# cada ROTEIROS_REVALIDACAO_SEGUNDOS; só uma versão nova é compilada de novo. Cada
+# campo vira um renderizador e cada show_if uma função sobre as respostas, então
+# um rerun não interpreta o JSON. Processos fora do roteiro usam os formulários fixos.
+ROTEIROS_LOCAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "roteiros_final_v4.json")
+ROTEIROS_REVALIDACAO_SEGUNDOS = 300
+# Respostas com estas chaves ficam na raiz do dados_formulario, como nos formulários fixos
+CAMPOS_RAIZ_ROTEIRO = ("evidencia_visual", "observacoes")
+
+class CampoRoteiro(NamedTuple):
+    chave: str
+    rotulo: str
+    tipo: str
+    opcoes: list
+    obrigatorio: bool
+    visivel: Callable
+    renderizar: Callable
+    depois_de: Optional[str]
+
+class FormularioRoteiro(NamedTuple):
+    chave: str
+    nome: str
+    setor: str
+    campos: tuple
+    validar: Callable
+
+def valor_serializavel(valor):
+    # Datas e horas dos widgets viram texto ISO, como nos formulários fixos
+    return valor.isoformat() if hasattr(valor, 'isoformat') else valor
+
+def campos_validade_roteiro(chave):
+    data_preparo, tipo_solucao, data_validade = campos_validade_solucao(f"{chave}_")
+    return {
+        "data_preparo": valor_serializavel(data_preparo),
+        "tipo_solucao": tipo_solucao,
+        "data_validade": valor_serializavel(data_validade),
+    }
+
+# tipo -> renderizador(rótulo, opções, chave do widget); "titulo" não gera resposta
+COMPONENTES_ROTEIRO = {
+    "titulo": lambda rotulo, opcoes, chave: st.write(f"### {rotulo}"),
+    "texto": lambda rotulo, opcoes, chave: st.text_input(rotulo, key=chave),
+    "texto_longo": lambda rotulo, opcoes, chave: st.text_area(rotulo, key=chave),
+    "numero": lambda rotulo, opcoes, chave: st.number_input(rotulo, value=None, key=chave),
+    "data": lambda rotulo, opcoes, chave: valor_serializavel(st.date_input(rotulo, value=None, format="DD/MM/YYYY", key=chave)),
+    "hora": lambda rotulo, opcoes, chave: valor_serializavel(st.time_input(rotulo, value=None, key=chave)),
+    "selecao": lambda rotulo, opcoes, chave: st.selectbox(rotulo, opcoes, index=None, key=chave),
+    "multiselecao": lambda rotulo, opcoes, chave: st.multiselect(rotulo, opcoes, key=chave),
+    "radio": lambda rotulo, opcoes, chave: st.radio(rotulo, opcoes, key=chave),
+    "checkbox": lambda rotulo, opcoes, chave: st.checkbox(rotulo, key=chave),
+    "imagens": lambda rotulo, opcoes, chave: componente_imagem(chave, rotulo),
+    "avaliacao_erros": lambda rotulo, opcoes, chave: tabela_avaliacao_erros(chave, opcoes or None),
+    "info_logbook": lambda rotulo, opcoes, chave: componente_info_logbook(chave, opcoes or None),
+    "integridade_dados": lambda rotulo, opcoes, chave: componente_integridade_dados(chave),
+    "condicoes_logbook": lambda rotulo, opcoes, chave: componente_condicoes_logbook(chave),
+    "validade_solucao": lambda rotulo, opcoes, chave: campos_validade_roteiro(chave),
+}
+# Tipos que rodam como st.fragment: mudar um deles não reexecuta o resto do roteiro,
+# então um show_if que dependa deles ficaria desatualizado e é recusado
+TIPOS_EM_FRAGMENTO_ROTEIRO = {"imagens", "avaliacao_erros", "validade_solucao"}
+# Grafias aceitas no arquivo de roteiros, comparadas sem acentos
+SINONIMOS_TIPO_ROTEIRO = {
+    "text": "texto", "textarea": "texto_longo", "area_texto": "texto_longo", "number": "numero",
+    "date": "data", "time": "hora", "select": "selecao", "multisselecao": "multiselecao",
+    "multiselect": "multiselecao", "upload": "imagens", "arquivos": "imagens", "imagem": "imagens",
+}
+
+def normalizar_texto(texto) -> str:
+    sem_acentos = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode("ascii")
+    return sem_acentos.strip().lower().replace(" ", "_").replace("-", "_")
+
+def contem_valor(valor, esperado) -> bool:
+    # Multisseleções atendem à condição quando contêm o valor esperado
+    return esperado in valor if isinstance(valor, list) else valor == esperado
+
+def compilar_condicao(condicao):
+    # {"campo": k, "igual"|"diferente"|"em"|"preenchido": ...}, combinadas com "todos"/"algum"
+    if not condicao:
+        return lambda respostas: True
+    if "todos" in condicao:
+        partes = [compilar_condicao(c) for c in condicao["todos"]]
+        return lambda respostas: all(parte(respostas) for parte in partes)
+    if "algum" in condicao:
+        partes = [compilar_condicao(c) for c in condicao["algum"]]
+        return lambda respostas: any(parte(respostas) for parte in partes)
+    campo = condicao.get("campo")
+    if not campo:
+        raise ValueError(f"show_if sem 'campo': {condicao}")
+    if "igual" in condicao or "valor" in condicao:
+        esperado = condicao.get("igual", condicao.get("valor"))
+        return lambda respostas: contem_valor(respostas.get(campo), esperado)
+    if "diferente" in condicao:
+        esperado = condicao["diferente"]
+        return lambda respostas: not contem_valor(respostas.get(campo), esperado)
+    if "em" in condicao:
+        esperados = list(condicao["em"])
+        return lambda respostas: any(contem_valor(respostas.get(campo), e) for e in esperados)
+    if "preenchido" in condicao:
+        preenchido = bool(condicao["preenchido"])
+        return lambda respostas: bool(respostas.get(campo)) == preenchido
+    raise ValueError(f"show_if sem operador reconhecido: {condicao}")
+
+def campos_da_condicao(condicao):
+    if not condicao:
+        return
+    for chave in ("todos", "algum"):
+        if chave in condicao:
+            for parte in condicao[chave]:
+                yield from campos_da_condicao(parte)
+            return
+    yield condicao.get("campo")
+
+def verificar_condicoes(definicoes, campos) -> None:
+    em_fragmento = {campo.chave for campo in campos if campo.tipo in TIPOS_EM_FRAGMENTO_ROTEIRO}
+    for definicao, campo in zip(definicoes, campos):
+        for dependencia in campos_da_condicao(definicao.get("show_if", definicao.get("condicional"))):
+            if dependencia in em_fragmento:
+                raise ValueError(f"show_if de {campo.chave} depende de {dependencia}, que é atualizado "
+                                 "à parte (fragmento) e não reavaliaria a condição")
+
+def compilar_campo(definicao) -> CampoRoteiro:
+    tipo = normalizar_texto(definicao.get("tipo", "texto"))
+    tipo = SINONIMOS_TIPO_ROTEIRO.get(tipo, tipo)
+    if tipo not in COMPONENTES_ROTEIRO:
+        raise ValueError(f"tipo de campo desconhecido: {definicao.get('tipo')}")
+    rotulo = definicao.get("label") or definicao.get("rotulo") or ""
+    chave = definicao.get("key") or normalizar_texto(rotulo)
+    if not chave:
+        raise ValueError(f"campo sem 'key' nem 'label': {definicao}")
+    obrigatorio = bool(definicao.get("obrigatorio", False))
+    return CampoRoteiro(
+        chave=chave,
+        rotulo=f"{rotulo}*" if obrigatorio and not rotulo.endswith("*") else rotulo,
+        tipo=tipo,
+        opcoes=list(definicao.get("opcoes") or []),
+        obrigatorio=obrigatorio,
+        visivel=compilar_condicao(definicao.get("show_if", definicao.get("condicional"))),
+        renderizar=COMPONENTES_ROTEIRO[tipo],
+        depois_de=definicao.get("depois_de"),
+    )
+
+def caminho_resposta_roteiro(chave) -> str:
+    return f"dados_formulario.{chave}" if chave in CAMPOS_RAIZ_ROTEIRO else f"dados_formulario.respostas.{chave}"
+
+def regras_do_roteiro(campos) -> list:
+    # Obrigatórios só quando exibidos; datas e horas no formato ISO; "depois_de" ordena dois campos
+    por_chave = {campo.chave: campo for campo in campos}
+    regras = []
+    for campo in campos:
+        rotulo = campo.rotulo.rstrip("*")
+        caminho = caminho_resposta_roteiro(campo.chave)
+        if campo.obrigatorio:
+            regras.append(Obrigatorio(rotulo, caminho, se_exibido=True))
+        if campo.tipo == "data":
+            regras.append(Formato(rotulo, caminho, e_data_iso, "uma data"))
+        elif campo.tipo == "hora":
+            regras.append(Formato(rotulo, caminho, e_hora_iso, "um horário"))
+        if campo.depois_de:
+            anterior = por_chave.get(campo.depois_de)
+            if anterior is None:
+                raise ValueError(f"'depois_de' de {campo.chave} aponta para campo inexistente: {campo.depois_de}")
+            regras.append(Ordem(anterior.rotulo.rstrip("*"), caminho_resposta_roteiro(anterior.chave),
+                                rotulo, caminho))
+    return regras
+
+def compilar_roteiros(roteiros):
+    # Um processo inválido é ignorado (com o erro registrado) sem derrubar os demais
+    formularios, erros = {}, []
+    for setor in roteiros.get("setores_inspecao", []):
+        for processo in setor.get("processos", []):
+            nome = processo.get("nome", "")
+            try:
+                campos = tuple(compilar_campo(campo) for campo in processo.get("campos", []))
+                verificar_condicoes(processo.get("campos", []), campos)
+                formularios[(nome, setor.get("nome", ""))] = FormularioRoteiro(
+                    chave=normalizar_texto(processo.get("key") or nome),
+                    nome=nome,
+                    setor=setor.get("nome", ""),
+                    campos=campos,
+                    validar=compilar_validador(REGRAS_BASICAS + regras_do_roteiro(campos)),
+                )
+            except (ValueError, TypeError, AttributeError) as e:
+                erros.append(f"{nome or '?'} ({setor.get('nome', '?')}): {e}")
+    return formularios, erros
+
+def url_conteudo_roteiros(ctx, endereco) -> str:
+    # Aceita o link de download (…/download.aspx?UniqueId=…) ou o endereço do arquivo no site
+    partes = urlparse(endereco)
+    unique_id = parse_qs(partes.query).get("UniqueId")
+    if unique_id:
+        return f"{ctx.base_url}/_api/web/GetFileById('{unique_id[0].strip('{}')}')/$value"
+    return _url_conteudo_arquivo(ctx, partes.path)
+
+class RoteirosInspecao:
+    def __init__(self, pool=None, url=None, caminho_local=ROTEIROS_LOCAL_PATH,
+                 intervalo=ROTEIROS_REVALIDACAO_SEGUNDOS):
+        self.pool = pool
+        self.url = url
+        self.caminho_local = caminho_local
+        self.intervalo = intervalo
+        self.formularios = {}
+        self.erros = []
+        self.origem = None
+        self._etag = None
+        self._modificado_local = None
+        self._verificado_em = None
+        self._lock = threading.Lock()
+
+    def atualizar(self, forcar=False) -> None:
+        if not forcar and self._verificado_em is not None and time.monotonic() - self._verificado_em < self.intervalo:
+            return
+        # Com roteiros já compilados, quem chega durante uma revalidação usa a versão atual
+        if not self._lock.acquire(blocking=self._verificado_em is None):
+            return
+        try:
+            if not forcar and self._verificado_em is not None and time.monotonic() - self._verificado_em < self.intervalo:
+                return
+            if not self._atualizar_do_sharepoint():
+                self._atualizar_do_arquivo_local()
+            self._verificado_em = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def _atualizar_do_sharepoint(self) -> bool:
+        if not self.url or self.pool is None:
+            return False
+        try:
+            ctx = self.pool.obter_contexto()
+            roteiros, etag = ler_json_da_url_com_etag(ctx, url_conteudo_roteiros(ctx, self.url),
+                                                      etag_atual=self._etag if self.origem == "sharepoint" else None)
+        except Exception:
+            return self.origem == "sharepoint"  # Mantém a última versão lida do SharePoint
+        if etag is None:
+            return False
+        if self.origem != "sharepoint" or etag != self._etag:
+            self._compilar(roteiros, "sharepoint")
+        self._etag = etag
+        return True
+
+    def _atualizar_do_arquivo_local(self) -> None:
+        try:
+            modificado = os.path.getmtime(self.caminho_local)
+        except OSError:
+            return
+        if self.origem == "local" and modificado == self._modificado_local:
+            return
+        try:
+            with open(self.caminho_local, encoding="utf-8") as arquivo:
+                roteiros = json.load(arquivo)
+        except (OSError, ValueError) as e:
+            self.erros = [f"{self.caminho_local}: {e}"]
+            return
+        self._compilar(roteiros, "local")
+        self._modificado_local = modificado
+
+    def _compilar(self, roteiros, origem) -> None:
+        # Troca os dicionários inteiros: sessões lendo ao mesmo tempo nunca veem meia versão
+        self.formularios, self.erros = compilar_roteiros(roteiros if isinstance(roteiros, dict) else {})
+        self.origem = origem
+
+    def formulario(self, processo, setor) -> Optional[FormularioRoteiro]:
+        self.atualizar()
+        return self.formularios.get((processo, setor))
+
+    def processos_do_setor(self, setor) -> List[str]:
+        self.atualizar()
+        return [nome for nome, setor_formulario in self.formularios if setor_formulario == setor]
+
+@st.cache_resource
+def obter_roteiros():
+    config = st.secrets.get("sharepoint", {})
+    url = config.get("roteiros_file_url")
+    return RoteirosInspecao(obter_pool_sharepoint() if url else None, url)
+
+def renderizar_roteiro(formulario: FormularioRoteiro):
+    st.header(f"{formulario.nome} ({formulario.setor})")
+    respostas = {}
+    dados = {"processo": formulario.nome, "roteiro": formulario.chave, "respostas": respostas}
+    visiveis = {}  # Todas as respostas exibidas, inclusive as da raiz, para os show_if
+    for campo in formulario.campos:
+        if not campo.visivel(visiveis):
+            continue
+        valor = campo.renderizar(campo.rotulo, campo.opcoes, f"roteiro_{formulario.chave}_{campo.chave}")
+        if campo.tipo == "titulo":
+            continue
+        visiveis[campo.chave] = valor
+        if campo.chave in CAMPOS_RAIZ_ROTEIRO:
+            dados[campo.chave] = valor
+        else:
+            respostas[campo.chave] = valor
+    return dados
+
 # Formulários de Processo
 def processo_monitoramento_ambiental():
     st.header("🧪 Monitoramento Ambiental")
@@ -800,7 +3147,7 @@ def processo_monitoramento_ambiental():
     integridade_dados = componente_integridade_dados("monit_amb")
     condicoes_logbook = componente_condicoes_logbook("monit_amb")
     st.write("### Evidências Visuais")
-    caminho_evidencia = componente_imagem("monit_amb", "Adicionar foto das evidências, se aplicável")
+    evidencias = componente_imagem("monit_amb", "Adicionar foto das evidências, se aplicável")
     st.write("### Equipamentos Associados")
     tag_termo = st.text_input(
         "TAG do termo-higrômetro:",
@@ -840,7 +3187,7 @@ def processo_monitoramento_ambiental():
         "ocorrencias": ocorrencias,
         "integridade_dados": integridade_dados,
         "condicoes_logbook": condicoes_logbook,
-        "evidencia_visual": caminho_evidencia,
+        "evidencia_visual": evidencias,
         "equipamentos_associados": {
             "tag_termo": tag_termo,
             "num_logbook_monit": num_logbook_monit,
@@ -899,32 +3246,12 @@ def processo_equipamentos():
         st.write("### Micropipetas (Verificação Gravimétrica)")
         erros_gravimetrica = ["Resultado fora da especificação", "Campos sem preenchimento", "Verificação fora da data especificada"]
         opcoes_gravimetrica = ["0 erros", "1 erro", "2 erros", "3 erros", "4 ou mais erros"]
-        st.write("#### Avaliação Detalhada")
-        resultados_gravimetrica = {}
-        cols = st.columns([3] + [1] * len(opcoes_gravimetrica))
-        with cols[0]:
-            st.write("**Erro**")
-        for i, opcao in enumerate(opcoes_gravimetrica):
-            with cols[i+1]:
-                st.write(f"**{opcao}**")
-        for erro in erros_gravimetrica:
-            cols = st.columns([3] + [1] * len(opcoes_gravimetrica))
-            with cols[0]:
-                st.write(erro)
-            chave_erro = f"gravimetrica_{erro.replace(' ', '_').replace('/', '_')}"
-            selecao = st.radio(
-                f"Selecione para {erro}",
-                opcoes_gravimetrica,
-                key=chave_erro,
-                label_visibility="collapsed",
-                horizontal=True
-            )
-            resultados_gravimetrica[erro] = selecao
-        campos_especificos["micropipeta_gravimetrica"] = resultados_gravimetrica
+        campos_especificos["micropipeta_gravimetrica"] = tabela_avaliacao_erros(
+            "gravimetrica", erros_gravimetrica, opcoes_gravimetrica, titulo="#### Avaliação Detalhada")
     st.write("### Observações Gerais")
     observacoes = st.text_area("Observações pertinentes:", key="observacoes_equip")
     st.write("### Evidências Visuais")
-    caminho_evidencia = componente_imagem("equipamentos", "Inserir evidências, se aplicável")
+    evidencias = componente_imagem("equipamentos", "Inserir evidências, se aplicável")
     return {
         "processo": "Equipamentos",
         "identificacao": {
@@ -939,19 +3266,14 @@ def processo_equipamentos():
         "equipamento_selecionado": equipamento_selecionado,
         "campos_especificos": campos_especificos,
         "observacoes": observacoes,
-        "evidencia_visual": caminho_evidencia
+        "evidencia_visual": evidencias
     }
 
-def processo_solucoes():
-    st.header("🧪 Soluções")
-    st.write("### Identificação e Controle")
-    codigo_solucao = st.text_input("Código da Solução*", key="codigo_solucao")
-    codigo_padrao = st.text_input("Código do padrão utilizado*", key="codigo_padrao")
-    etiqueta_integra = st.radio("Etiqueta de recebimento de reagente e identificação de solução estão íntegras?", ["Sim", "Não"], key="etiqueta_integra")
-    cadeia_custodia = st.radio("Cadeia de custódia (FOR-401) preenchida?", ["Sim", "Não"], key="cadeia_custodia")
-    substancia_controlada = st.radio("Substância controlada pela Portaria nº 344/98?", ["Sim", "Não"], key="substancia_controlada")
-    data_recebimento = st.date_input("Data de recebimento do padrão", key="data_recebimento_solucao")
-    data_preparo = st.date_input("Data de preparo da solução", key="data_preparo_solucao")
+@fragmento
+def campos_validade_solucao(prefixo=""):
+    # Preparo, tipo e validade ficam juntos: mudar um deles recalcula só este trecho.
+    # `prefixo` separa as chaves dos widgets quando há mais de um bloco na página
+    data_preparo = st.date_input("Data de preparo da solução", key=f"{prefixo}data_preparo_solucao")
     st.write("### Tipo de Solução")
     tipos_solucao = [
         "Água Milli-Q", "Água Milli-Q + Ácido/Base", "Solução Alcalina / Ácido Diluído",
@@ -961,17 +3283,30 @@ def processo_solucoes():
         "Soluções Básicas", "Soluções Tampão não utilizadas em análises cromatográficas",
         "Soluções Aquosas (incluindo tampões)", "Soluções Aquosas/Solventes Orgânicos (fase móvel, diluentes)"
     ]
-    tipo_solucao = st.selectbox("Selecione o tipo de solução:", tipos_solucao, key="tipo_solucao")
+    tipo_solucao = st.selectbox("Selecione o tipo de solução:", tipos_solucao, key=f"{prefixo}tipo_solucao")
     if data_preparo:
         data_validade_calculada = calcular_validade_solucao(data_preparo, tipo_solucao)
         if isinstance(data_validade_calculada, str):
             st.info(f"Validade da solução: {data_validade_calculada}")
-            data_validade = st.date_input("Data de validade da solução (conforme fabricante)", key="data_validade_solucao")
+            data_validade = st.date_input("Data de validade da solução (conforme fabricante)",
+                                          key=f"{prefixo}data_validade_solucao")
         else:
             st.info(f"Validade calculada: {data_validade_calculada.strftime('%d/%m/%Y')}")
             data_validade = data_validade_calculada
     else:
-        data_validade = st.date_input("Data de validade da solução", key="data_validade_solucao")
+        data_validade = st.date_input("Data de validade da solução", key=f"{prefixo}data_validade_solucao")
+    return data_preparo, tipo_solucao, data_validade
+
+def processo_solucoes():
+    st.header("🧪 Soluções")
+    st.write("### Identificação e Controle")
+    codigo_solucao = st.text_input("Código da Solução*", key="codigo_solucao")
+    codigo_padrao = st.text_input("Código do padrão utilizado*", key="codigo_padrao")
+    etiqueta_integra = st.radio("Etiqueta de recebimento de reagente e identificação de solução estão íntegras?", ["Sim", "Não"], key="etiqueta_integra")
+    cadeia_custodia = st.radio("Cadeia de custódia (FOR-401) preenchida?", ["Sim", "Não"], key="cadeia_custodia")
+    substancia_controlada = st.radio("Substância controlada pela Portaria nº 344/98?", ["Sim", "Não"], key="substancia_controlada")
+    data_recebimento = st.date_input("Data de recebimento do padrão", key="data_recebimento_solucao")
+    data_preparo, tipo_solucao, data_validade = campos_validade_solucao()
     st.write("### Anotações e Registro")
     numero_livro = st.text_input("Número do livro", key="numero_livro_solucao")
     lacre = st.text_input("Lacre", key="lacre_solucao")
@@ -993,7 +3328,7 @@ def processo_solucoes():
     st.write("### Avaliação da Conformidade")
     avaliacao_conformidade = tabela_avaliacao_erros("solucoes")
     st.write("### Evidências Visuais")
-    caminho_evidencia = componente_imagem("solucoes", "Inserir evidências, se aplicável")
+    evidencias = componente_imagem("solucoes", "Inserir evidências, se aplicável")
     st.write("### Observações Gerais")
     observacoes = st.text_area("Observações pertinentes:", key="observacoes_solucoes")
     return {
@@ -1017,7 +3352,7 @@ def processo_solucoes():
         "classificacao_risco": classificacao_correta,
         "armazenamento_adequado": armazenamento_adequado,
         "avaliacao_conformidade": avaliacao_conformidade,
-        "evidencia_visual": caminho_evidencia,
+        "evidencia_visual": evidencias,
         "observacoes": observacoes
     }
 
@@ -1036,7 +3371,7 @@ def processo_rastreabilidade_amostra_labs():
     validade = st.date_input("Validade", key="validade_rack_labs")
     armazenamento_adequado = st.radio("Armazenamento está adequado?", ["Sim", "Não"], key="armazenamento_adequado_labs")
     st.write("### Evidências Visuais")
-    caminho_evidencia = componente_imagem("rastreabilidade_labs", "Fotos das evidências, se aplicável")
+    evidencias = componente_imagem("rastreabilidade_labs", "Fotos das evidências, se aplicável")
     st.write("### Observações Gerais")
     observacoes = st.text_area("Observações pertinentes:", key="observacoes_rastreabilidade_labs")
     return {
@@ -1055,7 +3390,7 @@ def processo_rastreabilidade_amostra_labs():
             "validade": validade.isoformat() if validade else None,
             "armazenamento_adequado": armazenamento_adequado
         },
-        "evidencia_visual": caminho_evidencia,
+        "evidencia_visual": evidencias,
         "observacoes": observacoes
     }
 
@@ -1088,26 +3423,7 @@ def processo_rastreabilidade_amostra_tox():
     st.write("Os controles para o lote foram aprovados?")
     controles = ["CQA", "CQM", "CQB"]
     opcoes_rejeicao = ["Todos aprovados", "1 Rejeição", "2 Rejeições", "3 Rejeições", "Acima de 4 rejeições"]
-    resultados_controles = {}
-    cols = st.columns([2] + [1] * len(opcoes_rejeicao))
-    with cols[0]:
-        st.write("**Item**")
-    for i, opcao in enumerate(opcoes_rejeicao):
-        with cols[i+1]:
-            st.write(f"**{opcao}**")
-    for controle in controles:
-        cols = st.columns([2] + [1] * len(opcoes_rejeicao))
-        with cols[0]:
-            st.write(controle)
-        chave_controle = f"controle_{controle}"
-        selecao = st.radio(
-            f"Selecione para {controle}",
-            opcoes_rejeicao,
-            key=chave_controle,
-            label_visibility="collapsed",
-            horizontal=True
-        )
-        resultados_controles[controle] = selecao
+    resultados_controles = tabela_avaliacao_erros("controle", controles, opcoes_rejeicao, titulo=None, coluna="Item")
     st.write("### Extração")
     numero_livro_extracao = st.text_input("Número do Livro Ata de Extração", key="numero_livro_extracao")
     data_inicio_extracao = st.date_input("Data de início da extração", key="data_inicio_extracao")
@@ -1129,7 +3445,7 @@ def processo_rastreabilidade_amostra_tox():
     horario_recebimento_pacote = st.time_input("Horário de recebimento do pacote", key="horario_recebimento_pacote")
     transportadora = st.text_input("Transportadora", key="transportadora")
     st.write("### Evidências Visuais")
-    caminho_evidencia = componente_imagem("rastreabilidade_tox", "Fotos das evidências, se aplicável")
+    evidencias = componente_imagem("rastreabilidade_tox", "Fotos das evidências, se aplicável")
     st.write("### Observações Geral")
     observacoes = st.text_area("Observações pertinentes:", key="observacoes_rastreabilidade_tox")
     return {
@@ -1171,7 +3487,7 @@ def processo_rastreabilidade_amostra_tox():
             "horario_recebimento_pacote": horario_recebimento_pacote.isoformat() if horario_recebimento_pacote else None,
             "transportadora": transportadora
         },
-        "evidencia_visual": caminho_evidencia,
+        "evidencia_visual": evidencias,
         "observacoes": observacoes
     }
 
@@ -1182,7 +3498,7 @@ def processo_generico(nome_processo, setor):
     avaliacao_detalhada = tabela_avaliacao_erros(f"{nome_processo.lower().replace(' ', '_')}_{setor.lower().replace(' ', '_')}")
     condicoes_logbook = componente_condicoes_logbook(f"{nome_processo.lower().replace(' ', '_')}_{setor.lower().replace(' ', '_')}")
     st.write("### Evidências Visuais")
-    caminho_evidencia = componente_imagem(
+    evidencias = componente_imagem(
         f"{nome_processo.lower().replace(' ', '_')}_{setor.lower().replace(' ', '_')}",
         "Adicionar foto das evidências, se aplicável"
     )
@@ -1197,7 +3513,7 @@ def processo_generico(nome_processo, setor):
         "integridade_dados": integridade_dados,
         "avaliacao_detalhada": avaliacao_detalhada,
         "condicoes_logbook": condicoes_logbook,
-        "evidencia_visual": caminho_evidencia,
+        "evidencia_visual": evidencias,
         "observacoes": observacoes
     }
 
@@ -1211,7 +3527,7 @@ def main():
     if 'dados_inspecao' not in st.session_state:
         st.session_state.dados_inspecao = {}
 
-    gerenciador_inspetores = obter_instancia()
+    gerenciador_inspetores = obter_gerenciador_inspetores()
 
     with st.sidebar:
         st.header("Navegação")
@@ -1223,60 +3539,30 @@ def main():
             st.write("### Etapas Concluídas")
             for etapa in st.session_state.etapas_concluidas:
                 st.write(f"✅ {etapa}")
-        st.write("### Histórico de Inspeções")
-        inspecoes = listar_inspecoes()
-        if inspecoes:
-            inspecao_selecionada = st.selectbox(
-                "Selecione uma inspeção anterior:",
-                options=[f"{insp['data_inspecao']} - {insp['empresa']} - {insp['processo']}" for insp in inspecoes],
-                format_func=lambda x: x,
-                key="historico_inspecoes"
-            )
-            if st.button("Carregar Inspeção", key="btn_carregar_inspecao"):
-                idx = [f"{insp['data_inspecao']} - {insp['empresa']} - {insp['processo']}" for insp in inspecoes].index(inspecao_selecionada)
-                id_inspecao = inspecoes[idx]['id_inspecao']
-                ctx = get_sharepoint_context()
-                if ctx:
-                    try:
-                        arquivo_inspecoes = f"{SHAREPOINT_DADOS_PATH}/inspecoes/inspecoes.json"
-                        file_content = download_file_content(ctx, arquivo_inspecoes)
-                        todas_inspecoes = json.loads(file_content.decode('utf-8')) if file_content else []
-                        inspecao = next((i for i in todas_inspecoes if i.get('id_inspecao') == id_inspecao), None)
-                        if inspecao:
-                            st.session_state.dados_inspecao = inspecao
-                            st.session_state.etapa_atual = 'conclusao'
-                            st.rerun()
-                        else:
-                            st.error(f"Inspeção com ID {id_inspecao} não encontrada.")
-                    except Exception as e:
-                        st.error(f"Erro ao carregar inspeção: {e}")
+        exibir_status_sincronizacao()
+        exibir_historico_inspecoes()
         st.write("### Exportação de Dados")
         if st.button("Exportar Lista Completa", key="btn_exportar_sidebar"):
-            caminho_relatorio = exportar_lista_completa_inspecoes()
-            ctx = get_sharepoint_context()
-            if caminho_relatorio and ctx:
-                try:
-                    file = ctx.web.get_file_by_server_relative_url(caminho_relatorio)
-                    csv_data = file.read().execute_query()
+            st.session_state.relatorio_completo = exportar_lista_completa_inspecoes()
+        if st.button("Exportar Parquet (BI)", key="btn_exportar_parquet"):
+            particoes = exportar_parquet_por_processo()
+            if particoes is not None:
+                st.success(f"{particoes} partição(ões) Parquet atualizada(s) em dados/relatorios/parquet.")
+        if st.session_state.get('relatorio_completo'):
+            for nome_arquivo, rotulo, mime, chave in [
+                (ARQUIVO_RELATORIO_COMPLETO, "Baixar Relatório Completo CSV", MIME_CSV, "download_csv_sidebar"),
+                (ARQUIVO_RELATORIO_COMPLETO.replace('.csv', '.xlsx'), "Baixar Relatório Completo Excel", MIME_XLSX,
+                 "download_excel_sidebar"),
+            ]:
+                caminho_local = os.path.join(DIRETORIO_EXPORTACAO_LOCAL, nome_arquivo)
+                if os.path.exists(caminho_local):
                     st.download_button(
-                        label="Baixar Relatório Completo CSV",
-                        data=csv_data,
-                        file_name=os.path.basename(caminho_relatorio),
-                        mime="text/csv",
-                        key="download_csv_sidebar"
+                        label=rotulo,
+                        data=lambda caminho=caminho_local: ler_arquivo_local(caminho),
+                        file_name=nome_arquivo,
+                        mime=mime,
+                        key=chave
                     )
-                    caminho_excel = caminho_relatorio.replace('.csv', '.xlsx')
-                    file_excel = ctx.web.get_file_by_server_relative_url(caminho_excel)
-                    excel_data = file_excel.read().execute_query()
-                    st.download_button(
-                        label="Baixar Relatório Completo Excel",
-                        data=excel_data,
-                        file_name=os.path.basename(caminho_excel),
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        key="download_excel_sidebar"
-                    )
-                except Exception as e:
-                    st.error(f"Não foi possível gerar o relatório completo: {e}")
 
     # ----------- ETAPAS PRINCIPAIS DO FORMULÁRIO -----------
     if st.session_state.etapa_atual == 'informacoes_basicas':
@@ -1288,11 +3574,11 @@ def main():
             novo_nome = st.text_input("Nome do novo inspetor")
             novo_email = st.text_input("Email do novo inspetor")
             if st.button("Adicionar", key="btn_adicionar_inspetor") and novo_nome and novo_email:
-                gerenciador_inspetores.adicionar_inspetor(novo_nome, novo_email)
-                st.success(f"Inspetor {novo_nome} adicionado com sucesso!")
-                lista_inspetores = gerenciador_inspetores.obter_lista_inspetores()
-                nome_inspetor = novo_nome
-                st.rerun()
+                if gerenciador_inspetores.adicionar_inspetor(novo_nome, novo_email):
+                    st.success(f"Inspetor {novo_nome} adicionado com sucesso!")
+                    lista_inspetores = gerenciador_inspetores.obter_lista_inspetores()
+                    nome_inspetor = novo_nome
+                    st.rerun()
         email_inspetor = gerenciador_inspetores.obter_email_por_nome(nome_inspetor) if nome_inspetor else ""
         st.text_input("Email do Inspetor*", value=email_inspetor, disabled=True)
         empresa = st.text_input("Empresa a ser Inspecionada*")
@@ -1311,17 +3597,19 @@ def main():
                 ]
             )
         if st.button("Avançar para Seleção de Processo", key="btn_avancar_processo"):
-            if not nome_inspetor or not empresa or not data_inspecao:
-                st.error("Por favor, preencha todos os campos obrigatórios.")
+            informacoes_basicas = {
+                "nome_inspetor": nome_inspetor,
+                "email_inspetor": email_inspetor,
+                "empresa": empresa,
+                "data_inspecao": data_inspecao.isoformat() if data_inspecao else None,
+                "setor": setor,
+                "laboratorio": laboratorio
+            }
+            erros = validar_informacoes_basicas({'informacoes_basicas': informacoes_basicas})
+            if erros:
+                exibir_erros_validacao(erros)
             else:
-                st.session_state.dados_inspecao['informacoes_basicas'] = {
-                    "nome_inspetor": nome_inspetor,
-                    "email_inspetor": email_inspetor,
-                    "empresa": empresa,
-                    "data_inspecao": data_inspecao.isoformat(),
-                    "setor": setor,
-                    "laboratorio": laboratorio
-                }
+                st.session_state.dados_inspecao['informacoes_basicas'] = informacoes_basicas
                 st.session_state.etapa_atual = 'selecao_processo'
                 if 'etapas_concluidas' not in st.session_state:
                     st.session_state.etapas_concluidas = []
@@ -1346,9 +3634,12 @@ def main():
                 "Controle de temperatura ambiente"
             ]
         }
+        roteiros = obter_roteiros()
+        for erro in roteiros.erros:
+            st.warning(f"Processo ignorado no arquivo de roteiros: {erro}")
         processo_selecionado = st.selectbox(
             "Selecione o processo a ser inspecionado:",
-            processos_disponiveis[setor],
+            list(dict.fromkeys(processos_disponiveis[setor] + roteiros.processos_do_setor(setor))),
             key="processo_selecionado"
         )
         col1, col2 = st.columns(2)
@@ -1370,7 +3661,11 @@ def main():
         processo = st.session_state.dados_inspecao['processo_selecionado']
         setor = st.session_state.dados_inspecao['informacoes_basicas']['setor']
 
-        if processo == "Soluções":
+        # Um processo definido no arquivo de roteiros prevalece sobre o formulário fixo
+        formulario = obter_roteiros().formulario(processo, setor)
+        if formulario:
+            dados_formulario = renderizar_roteiro(formulario)
+        elif processo == "Soluções":
             dados_formulario = processo_solucoes()
         elif processo == "Rastreabilidade de amostra" and setor == "Synvia Labs":
             dados_formulario = processo_rastreabilidade_amostra_labs()
@@ -1394,19 +3689,24 @@ def main():
                 st.rerun()
         with col2:
             if st.button("Salvar e Finalizar", key="btn_finalizar_formulario"):
-                st.session_state.dados_inspecao['dados_formulario'] = dados_formulario
-                id_inspecao = salvar_inspecao(st.session_state.dados_inspecao)
-                if id_inspecao:
-                    caminho_relatorio = gerar_relatorio(id_inspecao)
-                    if caminho_relatorio:
-                        st.session_state.dados_inspecao['caminho_relatorio'] = caminho_relatorio
-                    st.session_state.etapa_atual = 'conclusao'
-                    if 'etapas_concluidas' not in st.session_state:
-                        st.session_state.etapas_concluidas = []
-                    st.session_state.etapas_concluidas.append("Formulário do Processo")
-                    st.rerun()
+                # Validação antes de aguardar evidências ou gravar qualquer coisa
+                erros = validar_inspecao({**st.session_state.dados_inspecao, 'dados_formulario': dados_formulario},
+                                         obter_roteiros())
+                if erros:
+                    exibir_erros_validacao(erros)
                 else:
-                    st.error("Erro ao salvar a inspeção. Tente novamente.")
+                    st.session_state.dados_inspecao['dados_formulario'] = dados_formulario
+                    pipeline = salvar_inspecao(st.session_state.dados_inspecao)
+                    if pipeline:
+                        st.session_state.dados_inspecao['caminho_relatorio'] = pipeline.caminho_csv
+                        guardar_relatorios(pipeline)
+                        st.session_state.etapa_atual = 'conclusao'
+                        if 'etapas_concluidas' not in st.session_state:
+                            st.session_state.etapas_concluidas = []
+                        st.session_state.etapas_concluidas.append("Formulário do Processo")
+                        st.rerun()
+                    else:
+                        st.error("Erro ao salvar a inspeção. Tente novamente.")
 
     elif st.session_state.etapa_atual == 'conclusao':
         st.header("✅ Inspeção Finalizada")
@@ -1424,53 +3724,39 @@ def main():
             st.write(f"**Laboratório:** {info_basicas['laboratorio']}")
         st.write(f"**Processo:** {processo}")
 
-        ctx = get_sharepoint_context()
-        if 'caminho_relatorio' in st.session_state.dados_inspecao and ctx:
-            caminho_relatorio = st.session_state.dados_inspecao['caminho_relatorio']
+        id_inspecao = st.session_state.dados_inspecao.get('id_inspecao')
+        if id_inspecao and obter_fila_local().conteudo_pendente(id_inspecao):
+            st.info("A inspeção está salva localmente e será enviada ao SharePoint na próxima sincronização.")
+        if id_inspecao:
             try:
-                file = ctx.web.get_file_by_server_relative_url(caminho_relatorio)
-                csv_data = file.read().execute_query()
-                st.download_button(
-                    label="Baixar Relatório CSV",
-                    data=csv_data,
-                    file_name=os.path.basename(caminho_relatorio),
-                    mime="text/csv",
-                    key="download_csv_conclusao"
-                )
-                caminho_excel = caminho_relatorio.replace('.csv', '.xlsx')
-                file_excel = ctx.web.get_file_by_server_relative_url(caminho_excel)
-                excel_data = file_excel.read().execute_query()
-                st.download_button(
-                    label="Baixar Relatório Excel",
-                    data=excel_data,
-                    file_name=os.path.basename(caminho_excel),
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    key="download_excel_conclusao"
-                )
+                relatorios = relatorios_inspecao(st.session_state.dados_inspecao)
+                for nome_arquivo, conteudo in relatorios.items():
+                    e_csv = nome_arquivo.endswith('.csv')
+                    st.download_button(
+                        label="Baixar Relatório CSV" if e_csv else "Baixar Relatório Excel",
+                        data=conteudo,
+                        file_name=nome_arquivo,
+                        mime=MIME_CSV if e_csv else MIME_XLSX,
+                        key="download_csv_conclusao" if e_csv else "download_excel_conclusao"
+                    )
             except Exception as e:
-                st.warning(f"Erro ao baixar relatórios: {e}. Gere o relatório novamente se necessário.")
+                st.warning(f"Erro ao gerar relatórios: {e}. Gere o relatório novamente se necessário.")
 
+        ctx = get_sharepoint_context()
         st.write("### Evidência Visual")
-        evidencia = st.session_state.dados_inspecao.get('dados_formulario', {}).get('evidencia_visual')
+        evidencias = st.session_state.dados_inspecao.get('dados_formulario', {}).get('evidencia_visual')
+        if isinstance(evidencias, str):
+            evidencias = [evidencias]  # Inspeções antigas guardam uma única evidência
+        evidencias = [e for e in (evidencias or []) if e]
         if not ctx:
             st.error("Falha na conexão com o SharePoint.")
-        elif not evidencia:
+        elif not evidencias:
             st.info("Nenhuma evidência visual foi adicionada.")
         else:
-            try:
-                # Obter o arquivo do SharePoint
-                file = ctx.web.get_file_by_server_relative_url(evidencia)
-                # Ler o conteúdo da imagem
-                image_data = file.get_content().execute_query().value
-                if not image_data:
-                    st.error("Nenhum conteúdo retornado ao ler a imagem.")
-                else:
-                    # Abrir e exibir a imagem
-                    imagem = Image.open(io.BytesIO(image_data))
-                    st.image(imagem, caption="Evidência Visual da Inspeção", use_container_width=True)
-            except Exception as e:
-                st.error(f"Erro ao carregar a imagem do SharePoint: {e}")
-                st.write(f"Caminho da imagem: {evidencia}")
+            colunas = st.columns(min(len(evidencias), 3))
+            for i, evidencia in enumerate(evidencias):
+                with colunas[i % len(colunas)]:
+                    exibir_evidencia(ctx, evidencia, f"Evidência {i + 1}")
 
         st.write("### Ações Adicionais")
         col1, col2 = st.columns(2)
@@ -1489,4 +3775,6 @@ def main():
                     pass  # Evita erro se "Formulário do Processo" não estiver na lista
                 st.rerun()            
 if __name__ == "__main__":
-    main()
+    with rerun_instrumentado():
+        main()
+        exibir_painel_telemetria()
@@ -0,0 +1,80 @@
+# Auditoria em lote das inspeções já salvas, com as mesmas regras da validação dos
+# formulários (campos obrigatórios, formatos e ordem de datas/horários), sem a
+# interface. Lista as inspeções incompletas ou inconsistentes para correção e, com
+# --saida, grava o resultado em CSV. Usa as credenciais de .streamlit/secrets.toml e
+# aceita os mesmos filtros de regenerar_relatorios.py:
+#
+#   python auditar_inspecoes.py --de 2025-01-01 --ate 2025-03-31 --saida auditoria.csv
+#   python auditar_inspecoes.py --processo Soluções
+import argparse
+import csv
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import QualityInspection as qi
+from regenerar_relatorios import LOTE_PADRAO, baixar_inspecao, selecionar_ids
+
+def auditar(ids, pool, sharepoint_base, downloads, roteiros=None, tamanho_lote=LOTE_PADRAO):
+    problemas, falhas = {}, {}
+    with ThreadPoolExecutor(max_workers=downloads) as pool_io:
+        for inicio in range(0, len(ids), tamanho_lote):
+            lote = ids[inicio:inicio + tamanho_lote]
+            baixados = []
+            for id_inspecao, future in [(i, pool_io.submit(baixar_inspecao, pool, i, sharepoint_base)) for i in lote]:
+                try:
+                    baixados.append(future.result())
+                except Exception as e:
+                    falhas[id_inspecao] = f"download: {e}"
+            problemas.update(qi.auditar_inspecoes(baixados, roteiros))
+            print(f"{min(inicio + tamanho_lote, len(ids))}/{len(ids)} auditadas, "
+                  f"{len(problemas)} com problemas", flush=True)
+    return problemas, falhas
+
+def gravar_csv(caminho, problemas) -> None:
+    with open(caminho, "w", newline="", encoding="utf-8-sig") as arquivo:
+        escritor = csv.writer(arquivo)
+        escritor.writerow(["ID_Inspecao", "Problema"])
+        for id_inspecao, erros in sorted(problemas.items()):
+            escritor.writerows([id_inspecao, erro] for erro in erros)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Audita as inspeções já salvas com as regras de validação.")
+    parser.add_argument("--ids", nargs="+", help="IDs específicos (ignora os filtros)")
+    parser.add_argument("--de", help="Data inicial da inspeção (AAAA-MM-DD)")
+    parser.add_argument("--ate", help="Data final da inspeção (AAAA-MM-DD)")
+    parser.add_argument("--setor")
+    parser.add_argument("--processo")
+    parser.add_argument("--inspetor")
+    parser.add_argument("--downloads", type=int, default=qi.UPLOAD_IMAGENS_MAX_WORKERS,
+                        help="Downloads simultâneos do SharePoint")
+    parser.add_argument("--saida", help="Arquivo CSV com um problema por linha")
+    parser.add_argument("--base", default=qi.SHAREPOINT_DADOS_PATH, help="Pasta de dados no SharePoint")
+    args = parser.parse_args(argv)
+
+    pool = qi.obter_pool_sharepoint()
+    catalogo = qi.obter_catalogo()
+    catalogo.sincronizar(pool.obter_contexto(), args.base)
+    ids = selecionar_ids(catalogo, args)
+    if not ids:
+        print("Nenhuma inspeção selecionada.")
+        return 0
+
+    print(f"Auditando {len(ids)} inspeção(ões)...", flush=True)
+    inicio = time.perf_counter()
+    problemas, falhas = auditar(ids, pool, args.base, args.downloads, qi.obter_roteiros())
+    duracao = time.perf_counter() - inicio
+
+    print(f"{len(problemas)} de {len(ids)} inspeção(ões) com problemas, em {duracao:.1f}s")
+    for id_inspecao, erros in sorted(problemas.items()):
+        for erro in erros:
+            print(f"{id_inspecao}: {erro}")
+    if args.saida:
+        gravar_csv(args.saida, problemas)
+        print(f"Resultado gravado em {args.saida}")
+    for id_inspecao, erro in sorted(falhas.items()):
+        print(f"FALHA {id_inspecao}: {erro}", file=sys.stderr)
+    return 1 if problemas or falhas else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
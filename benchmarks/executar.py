@@ -0,0 +1,232 @@
+# Benchmarks dos caminhos principais da aplicação contra o SharePoint falso.
+# Para cada tamanho de base sintética mede tempo, idas e voltas, bytes transferidos
+# e pico de memória (tracemalloc) de cada cenário. Execute a partir da raiz do projeto:
+#
+#   python -m benchmarks.executar --tamanhos 1000 10000 --latencia 0.02 --saida base.json
+#   python -m benchmarks.executar --tamanhos 1000 10000 --latencia 0.02 --comparar base.json
+#
+# Com --comparar, o código de saída é 1 se alguma métrica piorar além da tolerância.
+import argparse
+import gc
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from PIL import Image
+from streamlit import config as config_streamlit
+from streamlit.logger import set_log_level
+
+# Sem `streamlit run`, cada chamada do Streamlit avisa da falta de ScriptRunContext;
+# a opção impede que a leitura da configuração volte o nível para "info"
+config_streamlit.set_option("logger.level", "error")
+set_log_level("error")
+
+import QualityInspection as qi
+from benchmarks.sharepoint_falso import ArmazenamentoDisco, ArmazenamentoMemoria, SharePointFalso
+
+TAMANHOS_IMAGEM = [(640, 480), (1920, 1080), (4000, 3000)]
+PROCESSOS_SINTETICOS = [
+    ("Soluções", "Synvia Labs"),
+    ("Rastreabilidade de amostra", "Synvia Labs"),
+    ("Rastreabilidade de amostra", "Synvia Tox"),
+    ("Equipamentos", "Synvia Tox"),
+    ("Monitoramento ambiental", "Synvia Labs"),
+    ("Controle de temperatura ambiente", "Synvia Tox"),
+]
+
+def formulario_sintetico(processo, aleatorio):
+    data = datetime(2025, 1, 1) + timedelta(days=aleatorio.randrange(365))
+    comum = {"evidencia_visual": [f"{qi.SHAREPOINT_IMAGENS_PATH}/{aleatorio.getrandbits(128):032x}.jpg"],
+             "observacoes": "Sem desvios." * aleatorio.randrange(1, 5)}
+    if processo == "Soluções":
+        return {**comum,
+                "identificacao_controle": {"codigo_solucao": f"SOL-{aleatorio.randrange(10 ** 5)}",
+                                           "data_preparo": data.date().isoformat(), "tipo_solucao": "Solvente Orgânico",
+                                           "data_validade": (data + timedelta(days=30)).date().isoformat()},
+                "anotacoes_registro": {"numero_livro": "12", "lacre": "A1", "for": "FOR-001"},
+                "avaliacao_conformidade": {f"Erro {i}": "Conforme" for i in range(8)}}
+    if processo == "Equipamentos":
+        return {**comum,
+                "identificacao": {"tag": f"EQ-{aleatorio.randrange(999)}", "calibracao_valida": "Sim",
+                                  "proxima_calibracao": data.date().isoformat()},
+                "equipamento_selecionado": "Centrífuga",
+                "campos_especificos": {"Centrífuga": {"rotacao": "Conforme", "temperatura": "Conforme"}}}
+    return {**comum,
+            "info_logbook": {"numero_logbook": str(aleatorio.randrange(999)), "data_abertura": data.date().isoformat()},
+            "integridade_dados": ["Rasuras", "Campos em branco"][:aleatorio.randrange(3)],
+            "condicoes_logbook": ["Bom estado"],
+            "extracao": {"data_inicio_extracao": data.date().isoformat(), "horario_entrada_extracao": "08:00:00",
+                         "horario_saida_extracao": "09:30:00"}}
+
+def inspecao_sintetica(indice, aleatorio, inicio=datetime(2025, 1, 1)):
+    momento = inicio + timedelta(minutes=indice * 7)
+    processo, setor = PROCESSOS_SINTETICOS[indice % len(PROCESSOS_SINTETICOS)]
+    return {
+        "id_inspecao": f"insp_{momento.strftime('%Y%m%d_%H%M%S')}_{indice:08x}",
+        "timestamp": momento.isoformat(),
+        "informacoes_basicas": {"nome_inspetor": f"Inspetor {indice % 21}", "email_inspetor": "x@synvia.com",
+                                "empresa": f"Empresa {indice % 40}", "data_inspecao": momento.date().isoformat(),
+                                "setor": setor, "laboratorio": None},
+        "processo_selecionado": processo,
+        "dados_formulario": formulario_sintetico(processo, aleatorio),
+    }
+
+def semear_inspecoes(armazenamento, inicio, quantidade, sharepoint_base=qi.SHAREPOINT_DADOS_PATH):
+    # Grava shards e manifestos direto no armazenamento, sem contar nas métricas
+    aleatorio = random.Random(inicio)
+    manifestos = {}
+    for i in range(inicio, inicio + quantidade):
+        inspecao = inspecao_sintetica(i, aleatorio)
+        pasta_mes = qi.pasta_mes_inspecoes(qi.mes_da_inspecao(inspecao["id_inspecao"]), sharepoint_base)
+        armazenamento.criar_pasta(pasta_mes)
+        armazenamento.gravar(f"{pasta_mes}/{inspecao['id_inspecao']}.json", qi.serializar_inspecao(inspecao))
+        manifestos.setdefault(pasta_mes, []).append(qi.resumir_inspecao(inspecao))
+    for pasta_mes, resumos in manifestos.items():
+        caminho = f"{pasta_mes}/{qi.ARQUIVO_MANIFESTO}"
+        existentes = json.loads(armazenamento.ler(caminho)) if armazenamento.existe(caminho) else []
+        armazenamento.gravar(caminho, json.dumps(existentes + resumos, ensure_ascii=False).encode("utf-8"))
+
+def imagem_sintetica(largura, altura, semente) -> bytes:
+    # Ruído comprime mal, então é o pior caso para tamanho e tempo de codificação
+    buffer = io.BytesIO()
+    Image.frombytes("RGB", (largura, altura), random.Random(semente).randbytes(largura * altura * 3)).save(
+        buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+class Ambiente:
+    # Substitui os recursos compartilhados da aplicação por versões ligadas ao
+    # SharePoint falso e a bancos locais temporários
+    def __init__(self, latencia, em_disco):
+        self.diretorio = tempfile.mkdtemp(prefix="bench_qi_")
+        armazenamento = (ArmazenamentoDisco(os.path.join(self.diretorio, "sharepoint"))
+                         if em_disco else ArmazenamentoMemoria())
+        self.sharepoint = SharePointFalso(armazenamento, latencia)
+        armazenamento.criar_pasta(qi.SHAREPOINT_DADOS_PATH)
+        banco = os.path.join(self.diretorio, "local.db")
+        pool = self.sharepoint.pool()
+        self.fila = qi.FilaGravacaoLocal(banco)
+        self.catalogo = qi.CatalogoInspecoes(banco)
+        self.base_exportacao = qi.BaseExportacao(banco)
+        self.cache = qi.CacheDownloads()
+        self.indice = qi.IndiceImagens()
+        self.sincronizador = qi.SincronizadorSharePoint(self.fila, pool, self.indice, intervalo=10 ** 9)
+        self.sincronizador.notificar = lambda: None  # A sincronização é medida explicitamente
+
+        qi.obter_pool_sharepoint = lambda: pool
+        qi.obter_fila_local = lambda: self.fila
+        qi.obter_catalogo = lambda: self.catalogo
+        qi.obter_base_exportacao = lambda: self.base_exportacao
+        qi.obter_cache_downloads = lambda: self.cache
+        qi.obter_indice_imagens = lambda: self.indice
+        qi.obter_sincronizador = lambda: self.sincronizador
+        qi.garantir_migracao_inspecoes = lambda sharepoint_base=None: True
+        qi.DIRETORIO_EXPORTACAO_LOCAL = os.path.join(self.diretorio, "exportacao")
+
+    def medir(self, funcao) -> dict:
+        self.sharepoint.metricas.zerar()
+        gc.collect()
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        funcao()
+        duracao = time.perf_counter() - inicio
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {"tempo_s": round(duracao, 4), **self.sharepoint.metricas.resumo(),
+                "pico_memoria_mb": round(pico / 1024 / 1024, 2)}
+
+def cenarios_inspecoes(tamanho, latencia, em_disco) -> dict:
+    ambiente = Ambiente(latencia, em_disco)
+    semear_inspecoes(ambiente.sharepoint.armazenamento, 0, tamanho)
+    resultados = {}
+
+    resultados["listar_inspecoes (catálogo frio)"] = ambiente.medir(lambda: qi.listar_inspecoes())
+    ambiente.catalogo.intervalo = 0  # Força a verificação de pastas alteradas em toda chamada
+    resultados["listar_inspecoes (catálogo quente)"] = ambiente.medir(lambda: qi.listar_inspecoes())
+
+    resultados["exportar_lista_completa (primeira)"] = ambiente.medir(qi.exportar_lista_completa_inspecoes)
+    novas = max(1, tamanho // 100)
+    semear_inspecoes(ambiente.sharepoint.armazenamento, tamanho, novas)
+    resultados[f"exportar_lista_completa (+{novas} novas)"] = ambiente.medir(qi.exportar_lista_completa_inspecoes)
+
+    quantidade = min(50, tamanho)
+    aleatorio = random.Random(tamanho)
+    inspecoes = [inspecao_sintetica(tamanho * 2 + i, aleatorio) for i in range(quantidade)]
+    def salvar():
+        for inspecao in inspecoes:
+            qi.salvar_inspecao(inspecao)
+        ambiente.sincronizador.sincronizar()
+    resultados[f"salvar_inspecao x{quantidade} + sincronização"] = ambiente.medir(salvar)
+    return resultados
+
+def cenarios_imagens(latencia, em_disco) -> dict:
+    ambiente = Ambiente(latencia, em_disco)
+    resultados = {}
+    for largura, altura in TAMANHOS_IMAGEM:
+        imagem = imagem_sintetica(largura, altura, largura)
+        rotulo = f"salvar_imagem {largura}x{altura} ({len(imagem) // 1024} KB)"
+        resultados[f"{rotulo} nova"] = ambiente.medir(lambda: qi.salvar_imagem(imagem))
+        resultados[f"{rotulo} repetida"] = ambiente.medir(lambda: qi.salvar_imagem(imagem))
+    return resultados
+
+# Diferenças absolutas abaixo destes valores são ruído de medição
+DIFERENCA_MINIMA = {"tempo_s": 0.05, "pico_memoria_mb": 0.5}
+
+def comparar(resultados, referencia, tolerancia) -> list:
+    regressoes = []
+    for cenario, metricas in resultados.items():
+        base = referencia.get(cenario)
+        if not base:
+            continue
+        for metrica, valor in metricas.items():
+            anterior = base.get(metrica)
+            if anterior is not None and valor > anterior * (1 + tolerancia) \
+                    and valor - anterior > DIFERENCA_MINIMA.get(metrica, 0):
+                regressoes.append(f"{cenario}: {metrica} {anterior} -> {valor}")
+    return regressoes
+
+def imprimir(resultados) -> None:
+    colunas = ["tempo_s", "idas_e_voltas", "bytes_enviados", "bytes_recebidos", "pico_memoria_mb"]
+    largura = max(len(cenario) for cenario in resultados)
+    print(f"{'cenário':<{largura}}  " + "  ".join(f"{coluna:>15}" for coluna in colunas))
+    for cenario, metricas in resultados.items():
+        print(f"{cenario:<{largura}}  " + "  ".join(f"{metricas[coluna]:>15}" for coluna in colunas))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de QualityInspection contra um SharePoint falso.")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[1000, 10000],
+                        help="Quantidades de inspeções da base sintética (ex.: 1000 10000 100000)")
+    parser.add_argument("--latencia", type=float, default=0.0, help="Latência por ida e volta, em segundos")
+    parser.add_argument("--disco", action="store_true", help="Guarda os arquivos do SharePoint falso em disco")
+    parser.add_argument("--sem-imagens", action="store_true")
+    parser.add_argument("--saida", help="Grava os resultados em JSON")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Piora relativa aceita (padrão: 20%%)")
+    args = parser.parse_args(argv)
+
+    resultados = {}
+    for tamanho in args.tamanhos:
+        for cenario, metricas in cenarios_inspecoes(tamanho, args.latencia, args.disco).items():
+            resultados[f"[{tamanho}] {cenario}"] = metricas
+    if not args.sem_imagens:
+        resultados.update(cenarios_imagens(args.latencia, args.disco))
+    imprimir(resultados)
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            json.dump(resultados, arquivo, ensure_ascii=False, indent=2)
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            regressoes = comparar(resultados, json.load(arquivo), args.tolerancia)
+        for regressao in regressoes:
+            print(f"REGRESSÃO {regressao}", file=sys.stderr)
+        return 1 if regressoes else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
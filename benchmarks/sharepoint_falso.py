@@ -0,0 +1,349 @@
+# SharePoint falso para os benchmarks: implementa o subconjunto da API do
+# Office365-REST-Python-Client usado por QualityInspection.py, guarda os arquivos
+# em memória ou em disco, injeta latência por ida e volta e contabiliza requisições
+# e bytes transferidos.
+import os
+import re
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+class ErroHttp(Exception):
+    def __init__(self, status, mensagem="", hresult=None):
+        super().__init__(f"{status} {mensagem}")
+        self.response = SimpleNamespace(status_code=status)
+        self.hresult = hresult
+
+def pasta_de(caminho) -> str:
+    return caminho.rsplit("/", 1)[0]
+
+class ArmazenamentoMemoria:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.arquivos = {}
+        self.versoes = Counter()
+        self.pastas = set()
+        self.modificacao_pastas = {}
+        self._relogio = 0
+
+    def _ler_bytes(self, caminho) -> bytes:
+        return self.arquivos[caminho]
+
+    def _gravar_bytes(self, caminho, conteudo) -> None:
+        self.arquivos[caminho] = conteudo
+
+    def _remover_bytes(self, caminho) -> None:
+        del self.arquivos[caminho]
+
+    def existe(self, caminho) -> bool:
+        return caminho in self.arquivos
+
+    def ler(self, caminho) -> bytes:
+        with self.lock:
+            if not self.existe(caminho):
+                raise ErroHttp(404, "File Not Found")
+            return self._ler_bytes(caminho)
+
+    def etag(self, caminho) -> str:
+        return f'"{{{abs(hash(caminho)) % 10 ** 8}}},{self.versoes[caminho]}"'
+
+    def criar_pasta(self, caminho) -> None:
+        # Como folders.add do SharePoint, não falha se a pasta já existir
+        with self.lock:
+            partes = caminho.strip("/").split("/")
+            for i in range(1, len(partes) + 1):
+                self.pastas.add("/" + "/".join(partes[:i]))
+
+    def gravar(self, caminho, conteudo, sobrescrever=True) -> None:
+        with self.lock:
+            if pasta_de(caminho) not in self.pastas:
+                raise ErroHttp(404, f"Pasta inexistente: {pasta_de(caminho)}")
+            if self.existe(caminho) and not sobrescrever:
+                raise ErroHttp(400, "O arquivo já existe", hresult="-2130575257")
+            self._gravar_bytes(caminho, bytes(conteudo))
+            self.versoes[caminho] += 1
+            self._tocar(pasta_de(caminho))
+
+    def renomear(self, caminho, novo_nome) -> None:
+        with self.lock:
+            conteudo = self.ler(caminho)
+            self._remover_bytes(caminho)
+            self.gravar(f"{pasta_de(caminho)}/{novo_nome}", conteudo)
+
+    def _tocar(self, pasta) -> None:
+        self._relogio += 1
+        self.modificacao_pastas[pasta] = f"2025-01-01T00:00:00.{self._relogio:07d}Z"
+
+    def subpastas(self, pasta) -> list:
+        with self.lock:
+            prefixo = pasta.rstrip("/") + "/"
+            return sorted({
+                p for p in self.pastas
+                if p.startswith(prefixo) and "/" not in p[len(prefixo):]
+            })
+
+class ArmazenamentoDisco(ArmazenamentoMemoria):
+    # Mesmos metadados em memória, conteúdo em arquivos sob `diretorio`
+    def __init__(self, diretorio):
+        super().__init__()
+        self.diretorio = diretorio
+        self._existentes = set()
+
+    def _local(self, caminho) -> str:
+        return os.path.join(self.diretorio, *caminho.strip("/").split("/"))
+
+    def existe(self, caminho) -> bool:
+        return caminho in self._existentes
+
+    def _ler_bytes(self, caminho) -> bytes:
+        with open(self._local(caminho), "rb") as arquivo:
+            return arquivo.read()
+
+    def _gravar_bytes(self, caminho, conteudo) -> None:
+        local = self._local(caminho)
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        with open(local, "wb") as arquivo:
+            arquivo.write(conteudo)
+        self._existentes.add(caminho)
+
+    def _remover_bytes(self, caminho) -> None:
+        os.remove(self._local(caminho))
+        self._existentes.discard(caminho)
+
+class Metricas:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.zerar()
+
+    def zerar(self) -> None:
+        self.idas_e_voltas = 0
+        self.bytes_enviados = 0
+        self.bytes_recebidos = 0
+        self.por_operacao = Counter()
+
+    def registrar(self, operacao, enviados=0, recebidos=0) -> None:
+        with self.lock:
+            self.por_operacao[operacao] += 1
+            self.bytes_enviados += enviados
+            self.bytes_recebidos += recebidos
+
+    def resumo(self) -> dict:
+        return {
+            "idas_e_voltas": self.idas_e_voltas,
+            "bytes_enviados": self.bytes_enviados,
+            "bytes_recebidos": self.bytes_recebidos,
+        }
+
+class SharePointFalso:
+    def __init__(self, armazenamento=None, latencia=0.0, base_url="https://exemplo.sharepoint.com/personal/teste"):
+        self.armazenamento = armazenamento or ArmazenamentoMemoria()
+        self.latencia = latencia
+        self.base_url = base_url
+        self.metricas = Metricas()
+
+    def ida_e_volta(self) -> None:
+        with self.metricas.lock:
+            self.metricas.idas_e_voltas += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    def contexto(self):
+        return ContextoFalso(self)
+
+    def pool(self):
+        return PoolFalso(self)
+
+class PoolFalso:
+    # Mesma interface de PoolSharePoint: um contexto por thread
+    def __init__(self, sharepoint):
+        self.sharepoint = sharepoint
+        self._local = threading.local()
+
+    def obter_contexto(self):
+        ctx = getattr(self._local, "ctx", None)
+        if ctx is None:
+            ctx = self._local.ctx = self.sharepoint.contexto()
+        return ctx
+
+    def invalidar(self) -> None:
+        pass
+
+class ConsultaFalsa:
+    def __init__(self, ctx, acao):
+        self.ctx = ctx
+        self.acao = acao
+        self.value = None
+        ctx._pendentes.append(self)
+
+    def executar(self) -> None:
+        self.value = self.acao()
+
+    def execute_query(self):
+        self.ctx.execute_query()
+        return self.value if isinstance(self.value, (ObjetoComPropriedades, list)) else self
+
+class ObjetoComPropriedades:
+    def __init__(self, **propriedades):
+        self.properties = propriedades
+        self.name = propriedades.get("Name")
+
+class ContextoFalso:
+    def __init__(self, sharepoint):
+        self.sharepoint = sharepoint
+        self.armazenamento = sharepoint.armazenamento
+        self.metricas = sharepoint.metricas
+        self.base_url = sharepoint.base_url
+        self.web = WebFalsa(self)
+        self._pendentes = []
+
+    def execute_query(self):
+        # Sem lote, cada consulta pendente é uma requisição própria
+        pendentes, self._pendentes = self._pendentes, []
+        for consulta in pendentes:
+            self.sharepoint.ida_e_volta()
+            consulta.executar()
+        return self
+
+    def execute_batch(self, *args, **kwargs):
+        pendentes, self._pendentes = self._pendentes, []
+        if pendentes:
+            self.sharepoint.ida_e_volta()
+            self.metricas.registrar("lote")
+        for consulta in pendentes:
+            consulta.executar()
+        return self
+
+    def pending_request(self):
+        return self
+
+    def execute_request_direct(self, request):
+        self.sharepoint.ida_e_volta()
+        cabecalhos = getattr(request, "headers", {}) or {}
+        armazenamento = self.armazenamento
+        with armazenamento.lock:
+            arquivo = re.search(r"GetFileByServerRelativeUrl\('(.*)'\)/\$value", request.url)
+            if arquivo and cabecalhos.get("X-HTTP-Method") == "PUT":
+                caminho = arquivo.group(1)
+                if not armazenamento.existe(caminho):
+                    raise ErroHttp(404, "File Not Found")
+                if cabecalhos.get("IF-MATCH") not in (None, "*", armazenamento.etag(caminho)):
+                    raise ErroHttp(412, "Precondition Failed")
+                armazenamento.gravar(caminho, request.data)
+                self.metricas.registrar("put", enviados=len(request.data))
+                return SimpleNamespace(status_code=200, content=b"", headers={})
+            if arquivo:
+                caminho = arquivo.group(1)
+                conteudo = armazenamento.ler(caminho)
+                etag = armazenamento.etag(caminho)
+                if cabecalhos.get("If-None-Match") == etag:
+                    self.metricas.registrar("304")
+                    return SimpleNamespace(status_code=304, content=b"", headers={"ETag": etag})
+                self.metricas.registrar("get", recebidos=len(conteudo))
+                return SimpleNamespace(status_code=200, content=conteudo, headers={"ETag": etag})
+            adicao = re.search(r"GetFolderByServerRelativeUrl\('(.*)'\)/Files/add\(url='(.*)',overwrite=(\w+)\)",
+                               request.url)
+            if adicao:
+                caminho = f"{adicao.group(1)}/{adicao.group(2)}"
+                armazenamento.gravar(caminho, request.data, sobrescrever=adicao.group(3) == "true")
+                self.metricas.registrar("put", enviados=len(request.data))
+                return SimpleNamespace(status_code=200, content=b"", headers={})
+        # Só as chamadas REST que o app faz são simuladas; qualquer outra é um erro do benchmark
+        raise ValueError(f"requisição não suportada pelo SharePoint falso: "
+                         f"{cabecalhos.get('X-HTTP-Method', getattr(request, 'method', 'GET'))} {request.url}")
+
+class WebFalsa:
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.folders = ColecaoPastasFalsa(ctx, None)
+
+    def get_file_by_server_relative_url(self, caminho):
+        return ArquivoFalso(self.ctx, caminho)
+
+    def get_folder_by_server_relative_url(self, caminho):
+        return PastaFalsa(self.ctx, caminho)
+
+class ArquivoFalso:
+    def __init__(self, ctx, caminho):
+        self.ctx = ctx
+        self.caminho = caminho
+
+    def get_content(self):
+        def baixar():
+            conteudo = self.ctx.armazenamento.ler(self.caminho)
+            self.ctx.metricas.registrar("get", recebidos=len(conteudo))
+            return conteudo
+        return ConsultaFalsa(self.ctx, baixar)
+
+    def get(self):
+        def propriedades():
+            armazenamento = self.ctx.armazenamento
+            conteudo = armazenamento.ler(self.caminho)
+            self.ctx.metricas.registrar("propriedades")
+            return ObjetoComPropriedades(ETag=armazenamento.etag(self.caminho), Length=len(conteudo))
+        return ConsultaFalsa(self.ctx, propriedades)
+
+    def rename(self, novo_nome):
+        def renomear():
+            self.ctx.armazenamento.renomear(self.caminho, novo_nome)
+            self.ctx.metricas.registrar("renomear")
+        return ConsultaFalsa(self.ctx, renomear)
+
+class PastaFalsa:
+    def __init__(self, ctx, caminho):
+        self.ctx = ctx
+        self.caminho = caminho
+        self.files = ColecaoArquivosFalsa(ctx, caminho)
+        self.folders = ColecaoPastasFalsa(ctx, caminho)
+
+    def upload_file(self, nome, conteudo):
+        return self.files.add(nome, conteudo, True)
+
+class ColecaoArquivosFalsa:
+    def __init__(self, ctx, pasta):
+        self.ctx = ctx
+        self.pasta = pasta
+
+    def add(self, nome, conteudo, overwrite=False):
+        def enviar():
+            self.ctx.armazenamento.gravar(f"{self.pasta}/{nome}", conteudo or b"", sobrescrever=overwrite)
+            self.ctx.metricas.registrar("put", enviados=len(conteudo or b""))
+        return ConsultaFalsa(self.ctx, enviar)
+
+    def create_upload_session(self, arquivo, tamanho_bloco, file_name=None, **kwargs):
+        # Uma requisição para criar o arquivo e uma por bloco, como no cliente real
+        def enviar():
+            partes = []
+            while True:
+                bloco = arquivo.read(tamanho_bloco)
+                if not bloco:
+                    break
+                self.ctx.sharepoint.ida_e_volta()
+                self.ctx.metricas.registrar("bloco", enviados=len(bloco))
+                partes.append(bloco)
+            self.ctx.armazenamento.gravar(f"{self.pasta}/{file_name}", b"".join(partes))
+        return ConsultaFalsa(self.ctx, enviar)
+
+class ColecaoPastasFalsa:
+    def __init__(self, ctx, pasta):
+        self.ctx = ctx
+        self.pasta = pasta
+
+    def add(self, caminho):
+        def criar():
+            self.ctx.armazenamento.criar_pasta(caminho)
+            self.ctx.metricas.registrar("criar_pasta")
+        return ConsultaFalsa(self.ctx, criar)
+
+    def get(self):
+        def listar():
+            armazenamento = self.ctx.armazenamento
+            if self.pasta not in armazenamento.pastas:
+                raise ErroHttp(404, "File Not Found")
+            self.ctx.metricas.registrar("listar_pastas")
+            return [
+                ObjetoComPropriedades(Name=subpasta.rsplit("/", 1)[1],
+                                      TimeLastModified=armazenamento.modificacao_pastas.get(subpasta, ""))
+                for subpasta in armazenamento.subpastas(self.pasta)
+            ]
+        return ConsultaFalsa(self.ctx, listar)
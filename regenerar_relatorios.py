@@ -0,0 +1,134 @@
+# Regeneração em lote dos relatórios CSV/XLSX por inspeção, sem a interface.
+# Útil quando o mapeamento de exportação muda ou quando arquivos somem de
+# dados/relatorios. Usa as credenciais de .streamlit/secrets.toml, então deve ser
+# executado a partir do diretório da aplicação:
+#
+#   python regenerar_relatorios.py --de 2025-01-01 --ate 2025-03-31 --processo Soluções
+#   python regenerar_relatorios.py --ids insp_20250102_101500_ab12cd34 insp_20250103_...
+#
+# O achatamento e a serialização rodam em um pool de processos; downloads e envios
+# usam threads com concorrência limitada.
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import QualityInspection as qi
+
+LOTE_PADRAO = 200
+
+def gerar_artefatos(dados):
+    # Executado nos processos filhos: devolve só os bytes dos relatórios
+    pipeline = qi.PipelineSalvamento(dados).preparar()
+    return {'csv': pipeline.artefatos['csv'], 'xlsx': pipeline.artefatos['xlsx']}
+
+def selecionar_ids(catalogo, args):
+    if args.ids:
+        return list(args.ids)
+    filtros = {
+        'data_inicio': args.de,
+        'data_fim': args.ate,
+        'setor': args.setor,
+        'processo': args.processo,
+        'nome_inspetor': args.inspetor,
+    }
+    ids, pagina = [], 0
+    while True:
+        resumos, total = catalogo.consultar(filtros, pagina, LOTE_PADRAO)
+        ids.extend(resumo['id_inspecao'] for resumo in resumos)
+        pagina += 1
+        if not resumos or len(ids) >= total:
+            return ids
+
+def baixar_inspecao(pool, id_inspecao, sharepoint_base):
+    ctx = pool.obter_contexto()
+    pasta_mes = qi.pasta_mes_inspecoes(qi.mes_da_inspecao(id_inspecao), sharepoint_base)
+    dados = qi.ler_json(ctx, f"{pasta_mes}/{id_inspecao}.json")
+    if not dados:
+        raise FileNotFoundError(f"{id_inspecao}.json não encontrado")
+    return dados
+
+def enviar_relatorios(pool, pastas, dados, artefatos, sharepoint_base):
+    pipeline = qi.PipelineSalvamento(dados, sharepoint_base)
+    pipeline.artefatos = artefatos
+    pipeline.enviar(pool.obter_contexto(), incluir_registro=False, pastas=pastas)
+    return len(artefatos['csv']) + len(artefatos['xlsx'])
+
+def regenerar(ids, pool, sharepoint_base, processos, envios, tamanho_lote=LOTE_PADRAO):
+    falhas = {}
+    # A pasta de relatórios é verificada uma vez, não a cada envio
+    pastas = qi.PastasSharePoint()
+    bytes_enviados = 0
+    concluidas = 0
+    # "spawn" evita herdar, via fork, travas das threads de download em andamento
+    contexto_processos = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processos, mp_context=contexto_processos) as pool_cpu, \
+            ThreadPoolExecutor(max_workers=envios) as pool_io:
+        for inicio in range(0, len(ids), tamanho_lote):
+            lote = ids[inicio:inicio + tamanho_lote]
+
+            baixados = {}
+            for id_inspecao, future in [(i, pool_io.submit(baixar_inspecao, pool, i, sharepoint_base)) for i in lote]:
+                try:
+                    baixados[id_inspecao] = future.result()
+                except Exception as e:
+                    falhas[id_inspecao] = f"download: {e}"
+
+            gerados = {}
+            for id_inspecao, future in [(i, pool_cpu.submit(gerar_artefatos, d)) for i, d in baixados.items()]:
+                try:
+                    gerados[id_inspecao] = future.result()
+                except Exception as e:
+                    falhas[id_inspecao] = f"geração: {e}"
+
+            envios_lote = [
+                (i, pool_io.submit(enviar_relatorios, pool, pastas, baixados[i], artefatos, sharepoint_base))
+                for i, artefatos in gerados.items()
+            ]
+            for id_inspecao, future in envios_lote:
+                try:
+                    bytes_enviados += future.result()
+                    concluidas += 1
+                except Exception as e:
+                    falhas[id_inspecao] = f"envio: {e}"
+            print(f"{min(inicio + tamanho_lote, len(ids))}/{len(ids)} processadas, {len(falhas)} falha(s)", flush=True)
+    return concluidas, bytes_enviados, falhas
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Regenera os relatórios CSV/XLSX de inspeções já salvas.")
+    parser.add_argument("--ids", nargs="+", help="IDs específicos (ignora os filtros)")
+    parser.add_argument("--de", help="Data inicial da inspeção (AAAA-MM-DD)")
+    parser.add_argument("--ate", help="Data final da inspeção (AAAA-MM-DD)")
+    parser.add_argument("--setor")
+    parser.add_argument("--processo")
+    parser.add_argument("--inspetor")
+    parser.add_argument("--processos", type=int, default=os.cpu_count() or 1,
+                        help="Processos para achatar e serializar (padrão: núcleos da CPU)")
+    parser.add_argument("--envios", type=int, default=qi.UPLOAD_IMAGENS_MAX_WORKERS,
+                        help="Downloads/envios simultâneos ao SharePoint")
+    parser.add_argument("--base", default=qi.SHAREPOINT_DADOS_PATH, help="Pasta de dados no SharePoint")
+    args = parser.parse_args(argv)
+
+    pool = qi.obter_pool_sharepoint()
+    catalogo = qi.obter_catalogo()
+    catalogo.sincronizar(pool.obter_contexto(), args.base)
+    ids = selecionar_ids(catalogo, args)
+    if not ids:
+        print("Nenhuma inspeção selecionada.")
+        return 0
+
+    print(f"Regenerando relatórios de {len(ids)} inspeção(ões)...", flush=True)
+    inicio = time.perf_counter()
+    concluidas, bytes_enviados, falhas = regenerar(ids, pool, args.base, args.processos, args.envios)
+    duracao = time.perf_counter() - inicio
+
+    print(f"Concluídas: {concluidas}/{len(ids)} em {duracao:.1f}s "
+          f"({concluidas / max(duracao, 1e-9):.1f} inspeções/s, {bytes_enviados / 1024 / 1024:.1f} MB enviados)")
+    for id_inspecao, erro in sorted(falhas.items()):
+        print(f"FALHA {id_inspecao}: {erro}", file=sys.stderr)
+    return 1 if falhas else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,336 @@
+import pytest
+import requests
+from datetime import datetime
+
+import QualityInspection as q
+
+
+# Achatamento original (antes dos esquemas declarativos), mantido aqui como
+# referência: as colunas e os valores de uma inspeção comum não podem mudar
+def achatar_como_original(dados):
+    dados_processados = {}
+    info_basicas = dados.get('informacoes_basicas', {})
+    dados_processados['ID_Inspecao'] = dados.get('id_inspecao', '')
+    dados_processados['Data_Inspecao'] = info_basicas.get('data_inspecao', '')
+    dados_processados['Inspetor'] = info_basicas.get('nome_inspetor', '')
+    dados_processados['Email_Inspetor'] = info_basicas.get('email_inspetor', '')
+    dados_processados['Empresa'] = info_basicas.get('empresa', '')
+    dados_processados['Setor'] = info_basicas.get('setor', '')
+    dados_processados['Laboratorio'] = info_basicas.get('laboratorio', '')
+    dados_processados['Processo'] = dados.get('processo_selecionado', '')
+    dados_processados['Timestamp'] = dados.get('timestamp', '')
+    
+    dados_form = dados.get('dados_formulario', {})
+    processo = dados.get('processo_selecionado', '')
+    
+    if processo == "Soluções":
+        identificacao = dados_form.get('identificacao_controle', {})
+        dados_processados['Codigo_Solucao'] = identificacao.get('codigo_solucao', '')
+        dados_processados['Codigo_Padrao'] = identificacao.get('codigo_padrao', '')
+        dados_processados['Etiqueta_Integra'] = identificacao.get('etiqueta_integra', '')
+        dados_processados['Cadeia_Custodia'] = identificacao.get('cadeia_custodia', '')
+        dados_processados['Substancia_Controlada'] = identificacao.get('substancia_controlada', '')
+        dados_processados['Data_Recebimento_Padrao'] = identificacao.get('data_recebimento', '')
+        dados_processados['Data_Preparo_Solucao'] = identificacao.get('data_preparo', '')
+        dados_processados['Tipo_Solucao'] = identificacao.get('tipo_solucao', '')
+        data_validade = identificacao.get('data_validade', '')
+        if data_validade and isinstance(data_validade, str) and data_validade != "Prazo do fabricante":
+            try:
+                data_validade_formatada = datetime.fromisoformat(data_validade).strftime('%d/%m/%Y')
+            except ValueError:
+                data_validade_formatada = data_validade
+        else:
+            data_validade_formatada = data_validade
+        dados_processados['Data_Validade_Solucao'] = data_validade_formatada
+        anotacoes = dados_form.get('anotacoes_registro', {})
+        dados_processados['Numero_Livro'] = anotacoes.get('numero_livro', '')
+        dados_processados['Lacre'] = anotacoes.get('lacre', '')
+        dados_processados['FOR'] = anotacoes.get('for', '')
+        dados_processados['Classificacao_Correta'] = dados_form.get('classificacao_risco', '')
+        dados_processados['Armazenamento_Adequado'] = dados_form.get('armazenamento_adequado', '')
+        avaliacao = dados_form.get('avaliacao_conformidade', {})
+        for erro, avaliacao_erro in avaliacao.items():
+            dados_processados[f'Avaliacao_{erro.replace(" ", "_").replace("/", "_")}'] = avaliacao_erro
+    
+    elif processo == "Rastreabilidade de amostra":
+        setor = info_basicas.get('setor', '')
+        if setor == "Synvia Labs":
+            identificacao = dados_form.get('identificacao_amostra', {})
+            dados_processados['Etiqueta_Integra'] = identificacao.get('etiqueta_integra', '')
+            dados_processados['Codigo_Amostra'] = identificacao.get('codigo_amostra', '')
+            dados_processados['Data_Recebimento'] = identificacao.get('data_recebimento', '')
+            dados_processados['Ativo'] = identificacao.get('ativo', '')
+            dados_processados['Codigo_MBA'] = identificacao.get('codigo_mba', '')
+            dados_processados['Armazenado_Corretamente'] = identificacao.get('armazenado_corretamente', '')
+            racks = dados_form.get('identificacao_racks', {})
+            dados_processados['Estudo'] = racks.get('estudo', '')
+            dados_processados['Ensaio'] = racks.get('ensaio', '')
+            dados_processados['Validade'] = racks.get('validade', '')
+            dados_processados['Armazenamento_Adequado'] = racks.get('armazenamento_adequado', '')
+        else:
+            acompanhamento = dados_form.get('acompanhamento_amostra', {})
+            dados_processados['Codigo_Amostra_Acompanhada'] = acompanhamento.get('codigo_amostra_acompanhada', '')
+            dados_processados['Codigo_Lote_Acompanhado'] = acompanhamento.get('codigo_lote_acompanhado', '')
+            dados_processados['Tipo_Amostra'] = ', '.join(acompanhamento.get('tipo_amostra', []))
+            lcms = dados_form.get('lcms', {})
+            dados_processados['TAG_LCMS'] = lcms.get('tag_lcms', '')
+            dados_processados['Numero_Livro_LCMS'] = lcms.get('numero_livro_lcms', '')
+            dados_processados['Data_Injecao'] = lcms.get('data_injecao', '')
+            dados_processados['Horario_Injecao'] = lcms.get('horario_injecao', '')
+            dados_processados['Criterios_Curva'] = lcms.get('criterios_curva', '')
+            controles = dados_form.get('controles_rejeicoes', {})
+            for controle, resultado in controles.items():
+                dados_processados[f'Controle_{controle}'] = resultado
+            extracao = dados_form.get('extracao', {})
+            dados_processados['Numero_Livro_Extracao'] = extracao.get('numero_livro_extracao', '')
+            dados_processados['Data_Inicio_Extracao'] = extracao.get('data_inicio_extracao', '')
+            dados_processados['Horario_Entrada_Extracao'] = extracao.get('horario_entrada_extracao', '')
+            dados_processados['Horario_Saida_Extracao'] = extracao.get('horario_saida_extracao', '')
+            centrifuga = dados_form.get('centrifuga', {})
+            dados_processados['TAG_Centrifuga'] = centrifuga.get('tag_centrifuga', '')
+            dados_processados['Numero_Livro_Centrifuga'] = centrifuga.get('numero_livro_centrifuga', '')
+            dados_processados['Horario_Entrada_Centrifuga'] = centrifuga.get('horario_entrada_centrifuga', '')
+            dados_processados['Horario_Saida_Centrifuga'] = centrifuga.get('horario_saida_centrifuga', '')
+            ultrassom = dados_form.get('ultrassom', {})
+            dados_processados['Numero_Livro_Ultrassom'] = ultrassom.get('numero_livro_ultrassom', '')
+            dados_processados['Data_Anotacao_Ultrassom'] = ultrassom.get('data_anotacao_ultrassom', '')
+            dados_processados['Horario_Entrada_Ultrassom'] = ultrassom.get('horario_entrada_ultrassom', '')
+            dados_processados['Horario_Saida_Ultrassom'] = ultrassom.get('horario_saida_ultrassom', '')
+            transporte = dados_form.get('transporte', {})
+            dados_processados['Numero_Pacote'] = transporte.get('numero_pacote', '')
+            dados_processados['Data_Recebimento_Pacote'] = transporte.get('data_recebimento_pacote', '')
+            dados_processados['Horario_Recebimento_Pacote'] = transporte.get('horario_recebimento_pacote', '')
+            dados_processados['Transportadora'] = transporte.get('transportadora', '')
+    
+    elif processo == "Equipamentos":
+        identificacao = dados_form.get('identificacao', {})
+        dados_processados['TAG'] = identificacao.get('tag', '')
+        dados_processados['Logbook'] = identificacao.get('logbook', '')
+        dados_processados['Calibracao_Valida'] = identificacao.get('calibracao_valida', '')
+        dados_processados['Numero_Certificado'] = identificacao.get('num_certificado', '')
+        dados_processados['Proxima_Calibracao'] = identificacao.get('proxima_calibracao', '')
+        dados_processados['Anotacao_Logbook'] = identificacao.get('anotacao_logbook', '')
+        dados_processados['Anotacao_Outros'] = identificacao.get('anotacao_outros', '')
+        dados_processados['Equipamento'] = dados_form.get('equipamento_selecionado', '')
+        campos_especificos = dados_form.get('campos_especificos', {})
+        for categoria, detalhes in campos_especificos.items():
+            if isinstance(detalhes, dict):
+                for item, valor in detalhes.items():
+                    dados_processados[f'{categoria}_{item}'] = valor
+    
+    elif processo == "Monitoramento ambiental":
+        info_logbook = dados_form.get('info_logbook', {})
+        dados_processados['Numero_Logbook'] = info_logbook.get('numero_logbook', '')
+        dados_processados['TAG_Equipamento'] = info_logbook.get('tag_equipamento', '')
+        dados_processados['Data_Abertura'] = info_logbook.get('data_abertura', '')
+        dados_processados['Localizacao'] = info_logbook.get('localizacao', '')
+        dados_processados['Ocorrencias'] = ', '.join(dados_form.get('ocorrencias', []))
+        dados_processados['Integridade_Dados'] = ', '.join(dados_form.get('integridade_dados', []))
+        dados_processados['Condicoes_Logbook'] = ', '.join(dados_form.get('condicoes_logbook', []))
+        equipamentos = dados_form.get('equipamentos_associados', {})
+        dados_processados['TAG_Termo'] = equipamentos.get('tag_termo', '')
+        dados_processados['Num_Logbook_Monit'] = equipamentos.get('num_logbook_monit', '')
+        dados_processados['Num_Certificado'] = equipamentos.get('num_certificado', '')
+        dados_processados['Data_Calibracao'] = equipamentos.get('data_calibracao', '')
+        dados_processados['Registros_3Meses'] = ', '.join(dados_form.get('registros_3meses', []))
+    
+    else:
+        if 'info_logbook' in dados_form:
+            info_logbook = dados_form.get('info_logbook', {})
+            dados_processados['Numero_Logbook'] = info_logbook.get('numero_logbook', '')
+            dados_processados['TAG_Equipamento'] = info_logbook.get('tag_equipamento', '')
+            dados_processados['Data_Abertura'] = info_logbook.get('data_abertura', '')
+            dados_processados['Localizacao'] = info_logbook.get('localizacao', '')
+        if 'integridade_dados' in dados_form:
+            dados_processados['Integridade_Dados'] = ', '.join(dados_form.get('integridade_dados', []))
+        if 'avaliacao_detalhada' in dados_form:
+            avaliacao = dados_form.get('avaliacao_detalhada', {})
+            for erro, avaliacao_erro in avaliacao.items():
+                dados_processados[f'Avaliacao_{erro.replace(" ", "_").replace("/", "_")}'] = avaliacao_erro
+        if 'condicoes_logbook' in dados_form:
+            dados_processados['Condicoes_Logbook'] = ', '.join(dados_form.get('condicoes_logbook', []))
+    
+    dados_processados['Evidencia_Visual'] = dados_form.get('evidencia_visual', '')
+    dados_processados['Observacoes'] = dados_form.get('observacoes', '')
+    return dados_processados
+
+
+INFORMACOES_BASICAS = {
+    'data_inspecao': '2026-03-10',
+    'nome_inspetor': 'Ana Souza',
+    'email_inspetor': 'ana.souza@synvia.com',
+    'empresa': 'Synvia',
+    'setor': 'Synvia Tox',
+    'laboratorio': 'Bioanalítico',
+}
+
+FORMULARIOS = {
+    ("Soluções", "Synvia Tox"): {
+        'identificacao_controle': {
+            'codigo_solucao': 'SOL-001', 'codigo_padrao': 'PAD-17', 'etiqueta_integra': 'Sim',
+            'cadeia_custodia': 'Sim', 'substancia_controlada': 'Não', 'data_recebimento': '2026-01-05',
+            'data_preparo': '2026-03-01', 'tipo_solucao': 'Estoque', 'data_validade': '2026-06-01',
+        },
+        'anotacoes_registro': {'numero_livro': 'L-12', 'lacre': 'Sim', 'for': 'FOR-003'},
+        'classificacao_risco': 'Sim',
+        'armazenamento_adequado': 'Sim',
+        'avaliacao_conformidade': {'Rasura/emenda': 'Conforme', 'Falta de assinatura': 'Não conforme'},
+        'evidencia_visual': ['evidencias/a.jpg', 'evidencias/b.jpg'],
+        'observacoes': 'Solução dentro do prazo.',
+    },
+    ("Rastreabilidade de amostra", "Synvia Labs"): {
+        'identificacao_amostra': {
+            'etiqueta_integra': 'Sim', 'codigo_amostra': 'AM-555', 'data_recebimento': '2026-03-02',
+            'ativo': 'Sim', 'codigo_mba': 'MBA-9', 'armazenado_corretamente': 'Sim',
+        },
+        'identificacao_racks': {'estudo': 'EST-1', 'ensaio': 'ENS-2', 'validade': '2026-09-01',
+                                'armazenamento_adequado': 'Sim'},
+        'evidencia_visual': [],
+        'observacoes': '',
+    },
+    ("Rastreabilidade de amostra", "Synvia Tox"): {
+        'acompanhamento_amostra': {'codigo_amostra_acompanhada': 'AM-777', 'codigo_lote_acompanhado': 'LT-3',
+                                   'tipo_amostra': ['Urina', 'Sangue']},
+        'lcms': {'tag_lcms': 'LCMS-01', 'numero_livro_lcms': '44', 'data_injecao': '2026-03-09',
+                 'horario_injecao': '10:15', 'criterios_curva': 'Sim'},
+        'controles_rejeicoes': {'CQB': 'Aprovado', 'CQA': 'Rejeitado'},
+        'extracao': {'numero_livro_extracao': '45', 'data_inicio_extracao': '2026-03-08',
+                     'horario_entrada_extracao': '08:00', 'horario_saida_extracao': '09:30'},
+        'centrifuga': {'tag_centrifuga': 'CEN-2', 'numero_livro_centrifuga': '46',
+                       'horario_entrada_centrifuga': '09:40', 'horario_saida_centrifuga': '09:55'},
+        'ultrassom': {'numero_livro_ultrassom': '47', 'data_anotacao_ultrassom': '2026-03-08',
+                      'horario_entrada_ultrassom': '10:00', 'horario_saida_ultrassom': '10:10'},
+        'transporte': {'numero_pacote': 'PK-1', 'data_recebimento_pacote': '2026-03-07',
+                       'horario_recebimento_pacote': '16:20', 'transportadora': 'Rápida'},
+        'evidencia_visual': ['evidencias/c.jpg'],
+        'observacoes': 'Sem desvios.',
+    },
+    ("Equipamentos", "Synvia Tox"): {
+        'identificacao': {'tag': 'BAL-03', 'logbook': 'Sim', 'calibracao_valida': 'Sim', 'num_certificado': 'C-88',
+                          'proxima_calibracao': '2026-12-01', 'anotacao_logbook': 'Sim', 'anotacao_outros': ''},
+        'equipamento_selecionado': 'Balança',
+        'campos_especificos': {'Verificacao_diaria': {'Nivelamento': 'Conforme', 'Limpeza': 'Conforme'}},
+        'evidencia_visual': [],
+        'observacoes': '',
+    },
+    ("Monitoramento ambiental", "Synvia Tox"): {
+        'info_logbook': {'numero_logbook': 'LB-20', 'tag_equipamento': 'TH-1', 'data_abertura': '2026-01-02',
+                         'localizacao': 'Sala 3'},
+        'ocorrencias': ['Temperatura fora da faixa'],
+        'integridade_dados': ['Registros legíveis', 'Sem rasuras'],
+        'condicoes_logbook': ['Íntegro'],
+        'equipamentos_associados': {'tag_termo': 'TT-4', 'num_logbook_monit': 'LB-21', 'num_certificado': 'C-90',
+                                    'data_calibracao': '2025-11-20'},
+        'registros_3meses': ['Janeiro', 'Fevereiro'],
+        'evidencia_visual': [],
+        'observacoes': '',
+    },
+    ("Controle de temperatura ambiente", "Synvia Tox"): {
+        'info_logbook': {'numero_logbook': 'LB-30', 'tag_equipamento': 'TH-2', 'data_abertura': '2026-02-01',
+                         'localizacao': 'Sala 5'},
+        'integridade_dados': ['Registros legíveis'],
+        'avaliacao_detalhada': {'Registro ausente': 'Conforme', 'Rasura/emenda': 'Conforme'},
+        'condicoes_logbook': ['Íntegro'],
+        'evidencia_visual': ['evidencias/d.jpg'],
+        'observacoes': 'Ok.',
+    },
+}
+
+
+def inspecao(processo, setor, formulario=None):
+    return {
+        'id_inspecao': 'insp_20260310_101500_abcd1234',
+        'timestamp': '2026-03-10T10:15:00',
+        'processo_selecionado': processo,
+        'informacoes_basicas': {**INFORMACOES_BASICAS, 'setor': setor},
+        'dados_formulario': FORMULARIOS[(processo, setor)] if formulario is None else formulario,
+    }
+
+
+def como_texto(valor):
+    # O achatamento atual escreve listas como texto
+    return ', '.join(valor) if isinstance(valor, list) else valor
+
+
+@pytest.mark.parametrize("processo, setor", list(FORMULARIOS))
+def test_achatamento_igual_ao_original(processo, setor):
+    dados = inspecao(processo, setor)
+    original = {coluna: como_texto(valor) for coluna, valor in achatar_como_original(dados).items()}
+    assert q.processar_dados_para_exportacao(dados) == original
+    assert list(q.processar_dados_para_exportacao(dados)) == list(original)
+
+
+def test_achatamento_le_observacoes_do_monitoramento():
+    # O formulário de monitoramento grava "observações"; o achatamento original perdia o texto
+    formulario = {**FORMULARIOS[("Monitoramento ambiental", "Synvia Tox")], 'observações': 'Sala aberta.'}
+    del formulario['observacoes']
+    dados = inspecao("Monitoramento ambiental", "Synvia Tox", formulario)
+    assert achatar_como_original(dados)['Observacoes'] == ''
+    assert q.processar_dados_para_exportacao(dados)['Observacoes'] == 'Sala aberta.'
+
+
+@pytest.mark.parametrize("processo, setor", list(FORMULARIOS))
+def test_inspecao_completa_e_valida(processo, setor):
+    assert q.validar_inspecao(inspecao(processo, setor)) == []
+
+
+def test_inspecao_incompleta():
+    formulario = FORMULARIOS[("Soluções", "Synvia Tox")]
+    dados = inspecao("Soluções", "Synvia Tox", {
+        **formulario,
+        'identificacao_controle': {**formulario['identificacao_controle'],
+                                   'codigo_solucao': '', 'data_preparo': '2026-07-01'},
+    })
+    dados['informacoes_basicas']['email_inspetor'] = 'ana.souza'
+    assert q.validar_inspecao(dados) == [
+        "Email do Inspetor deve ser um email (recebido: ana.souza).",
+        "Código da Solução é obrigatório.",
+        "Data de preparo da solução deve ser anterior a Data de validade da solução.",
+    ]
+
+
+def test_horarios_fora_de_ordem():
+    formulario = FORMULARIOS[("Rastreabilidade de amostra", "Synvia Tox")]
+    dados = inspecao("Rastreabilidade de amostra", "Synvia Tox", {
+        **formulario,
+        'centrifuga': {**formulario['centrifuga'], 'horario_saida_centrifuga': '09:00'},
+    })
+    assert q.validar_inspecao(dados) == [
+        "Horário de entrada na centrífuga deve ser anterior a Horário de saída da centrífuga."
+    ]
+
+
+@pytest.fixture
+def fila(tmp_path):
+    fila = q.FilaGravacaoLocal(str(tmp_path / "fila.db"))
+    fila._registrar("insp_1", q.TIPO_PENDENCIA_INSPECAO, "destino", b"{}")
+    return fila
+
+
+def test_erro_transitorio_nunca_vira_falha_definitiva(fila):
+    for _ in range(q.SINCRONIZACAO_MAX_TENTATIVAS + 2):
+        fila.registrar_falha("insp_1", requests.exceptions.ConnectionError("sem rede"))
+    assert [pendencia['id'] for pendencia in fila.listar()] == ["insp_1"]
+    assert fila.listar_falhas() == []
+
+
+def test_erro_permanente_vira_falha_definitiva_no_limite(fila):
+    for _ in range(q.SINCRONIZACAO_MAX_TENTATIVAS - 1):
+        fila.registrar_falha("insp_1", ValueError("JSON inválido"))
+    assert fila.listar_falhas() == []
+    fila.registrar_falha("insp_1", ValueError("JSON inválido"))
+    assert fila.listar() == []
+    assert fila.listar_falhas() == [{'id': "insp_1", 'tipo': q.TIPO_PENDENCIA_INSPECAO,
+                                     'tentativas': q.SINCRONIZACAO_MAX_TENTATIVAS,
+                                     'ultimo_erro': "JSON inválido"}]
+    fila.reativar_falhas()
+    assert [pendencia['id'] for pendencia in fila.listar()] == ["insp_1"]
+
+
+def test_base_exportacao_descarta_versoes_antigas(tmp_path):
+    base = q.BaseExportacao(str(tmp_path / "exportacao.db"))
+    base.registrar([inspecao("Soluções", "Synvia Tox")])
+    assert base.descartar_versoes_antigas() == 0
+    assert base.ids_exportados() == {'insp_20260310_101500_abcd1234'}
+    assert base.descartar_versoes_antigas("versao-nova") == 1
+    assert base.ids_exportados() == set()